@@ -1,7 +1,7 @@
 import sys
 
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 
 # Adding paths to import custom modules
@@ -14,6 +14,7 @@ from schemas import QueryInput, SettingsInput, DataIngestionInput
 from custom_logger import logging as logger
 # Importing the main function and data ingestor
 from driver import ast_driver
+from instrumentation import metrics_registry
 from elasticsearch_ingestion import DataIngestor
 
 # Importing functions to fetch and update settings
@@ -48,13 +49,14 @@ async def service_check() -> dict:
 
 
 @app.post("/invoke/{app_name}")
-async def invoke_agent(app_name: str, query_input: QueryInput) -> dict:
+async def invoke_agent(app_name: str, query_input: QueryInput, x_debug_trace: bool = Header(False)) -> dict:
     """
     Endpoint to invoke the agent driver function using the app_name and input parameters.
 
     Args:
         app_name (str): The name of the application.
         query_input (QueryInput): Input parameters including session_id and query.
+        x_debug_trace (bool): Value of the X-Debug-Trace header enabling verbose tracing for this request.
 
     Returns:
         dict: Result returned by the agent.
@@ -62,13 +64,24 @@ async def invoke_agent(app_name: str, query_input: QueryInput) -> dict:
     in_params = {"app_name": app_name, "session_id": query_input.session_id, "query": query_input.query}
     try:
         settings = fetch_and_compare(app_name)
-        result, status = ast_driver(in_params, settings)
+        result, status = ast_driver(in_params, settings, debug=x_debug_trace)
         return {"result": result, "status": status}
     except Exception as e:
         logger.info(f"Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/metrics")
+async def get_metrics() -> dict:
+    """
+    Endpoint to retrieve the in-memory service metrics.
+
+    Returns:
+        dict: Current metric values keyed by subsystem.
+    """
+    return metrics_registry.snapshot()
+
+
 @app.get("/settings/{app_name}")
 async def get_settings(app_name: str) -> dict:
     """
@@ -125,7 +138,8 @@ async def ingest_data(data_input: DataIngestionInput) -> dict:
             index_name=data_input.index_name,
             source=data_input.source,
             load_csvs_separately=data_input.load_csvs_separately,
-            data_type=data_input.data_type
+            data_type=data_input.data_type,
+            backend=data_input.backend
         )
         return {"message": "Data ingestion successful"}
     except Exception as e:
@@ -33,9 +33,11 @@ class DataIngestionInput(BaseModel):
         source (str): Source of the files ('local' or 'google_drive'). Default is 'local'.
         load_csvs_separately (bool): Whether to load CSV files separately. Default is False.
         data_type (str): Type of data to load ('text', 'csv', 'pdf', or 'all'). Default is 'all'.
+        backend (str): Retrieval backend to ingest into ('elasticsearch' or 'local'). Default is 'elasticsearch'.
     """
     file_path: str
     index_name: str
     source: str = 'local'
     load_csvs_separately: bool = False
     data_type: str = 'all'
+    backend: str = 'elasticsearch'
@@ -2,17 +2,18 @@ import json
 import os
 import shutil
 
-import redis
 from custom_logger import logger
 from dotenv import load_dotenv
 
+from cache_store import get_redis_client
+
 # Path to the .env file
 dotenv_path = os.path.join(os.path.dirname(__file__), "../.env")
 # Load environment variables from the .env file
 load_dotenv(dotenv_path)
 
-# Connect to Redis using the URL specified in the environment variables
-redis_client = redis.Redis.from_url(os.environ.get("REDIS_SETTINGS_URL"), decode_responses=True)
+# Connect to Redis using the URL specified in the environment variables; memory:// keeps settings in-process
+redis_client = get_redis_client(os.environ.get("REDIS_SETTINGS_URL"), decode_responses=True)
 
 # Local settings directory path
 local_settings_dir = os.path.join(os.path.dirname(__file__), "settings")
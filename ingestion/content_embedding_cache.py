@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+from custom_logger import logger
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+from cache_store import get_redis_client
+
+# Load environment variables from .env file
+dotenv_path = os.path.join(os.path.dirname(__file__), "../.env")
+load_dotenv(dotenv_path)
+
+# Persistent store of chunk embeddings: 'sqlite', 'redis' or 'off'
+INGESTION_EMBEDDING_CACHE = os.getenv("INGESTION_EMBEDDING_CACHE", "sqlite").lower()
+INGESTION_EMBEDDING_CACHE_PATH = os.getenv(
+    "INGESTION_EMBEDDING_CACHE_PATH", os.path.join(os.path.dirname(__file__), "../ingestion_cache/embeddings.sqlite")
+)
+INGESTION_EMBEDDING_CACHE_REDIS_URL = os.getenv("INGESTION_EMBEDDING_CACHE_REDIS_URL")
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def document_id(document: Document) -> str:
+    """
+    Returns the deterministic ID of a chunk, derived from the hash of its content and its metadata, so that
+    ingesting the same chunk again addresses the same document.
+
+    Args:
+        document (Document): The chunk.
+
+    Returns:
+        str: The document ID.
+    """
+    payload = json.dumps([content_hash(document.page_content), document.metadata], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def embedding_model_name(embedding) -> str:
+    """
+    Returns the model name of an embeddings client, looking through wrappers such as the query cache.
+    """
+    for candidate in (embedding, getattr(embedding, "embedding", None)):
+        name = getattr(candidate, "model", None) or getattr(candidate, "model_name", None)
+        if name:
+            return name
+    return type(embedding).__name__
+
+
+class SQLiteEmbeddingCache:
+    """
+    Embedding cache in a local SQLite file, storing float32 vectors keyed by model and content hash.
+    """
+
+    def __init__(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (model TEXT, hash TEXT, vector BLOB, PRIMARY KEY (model, hash))"
+        )
+        self._connection.commit()
+        self._lock = threading.Lock()
+
+    def get_many(self, model: str, hashes: list[str]) -> dict[str, list[float]]:
+        found = {}
+        with self._lock:
+            # Stay below SQLite's bound parameter limit
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                rows = self._connection.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch]
+                ).fetchall()
+                found.update({key: np.frombuffer(vector, dtype=np.float32).tolist() for key, vector in rows})
+        return found
+
+    def set_many(self, model: str, vectors: dict[str, list[float]]) -> None:
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [(model, key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in vectors.items()]
+            )
+            self._connection.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class RedisEmbeddingCache:
+    """
+    Embedding cache in Redis, storing float32 vectors under model and content hash keys.
+    """
+
+    def __init__(self, redis_client) -> None:
+        self.redis_client = redis_client
+
+    def get_many(self, model: str, hashes: list[str]) -> dict[str, list[float]]:
+        if not hashes:
+            return {}
+        values = self.redis_client.mget([self._key(model, key) for key in hashes])
+        return {key: np.frombuffer(value, dtype=np.float32).tolist() for key, value in zip(hashes, values) if value}
+
+    def set_many(self, model: str, vectors: dict[str, list[float]]) -> None:
+        for key, vector in vectors.items():
+            self.redis_client.set(self._key(model, key), np.asarray(vector, dtype=np.float32).tobytes())
+
+    def close(self) -> None:
+        # The Redis client is shared through cache_store and stays open
+        pass
+
+    @staticmethod
+    def _key(model: str, key: str) -> str:
+        return f"chunk_embedding:{model}:{key}"
+
+
+def get_content_embedding_cache():
+    """
+    Returns the configured persistent embedding cache. The caller closes it when done.
+
+    Returns:
+        SQLiteEmbeddingCache | RedisEmbeddingCache | None: The cache, or None when it is turned off.
+    """
+    if INGESTION_EMBEDDING_CACHE == "off":
+        return None
+    if INGESTION_EMBEDDING_CACHE == "redis":
+        if not INGESTION_EMBEDDING_CACHE_REDIS_URL:
+            raise ValueError("INGESTION_EMBEDDING_CACHE_REDIS_URL must be set for the Redis embedding cache.")
+        return RedisEmbeddingCache(get_redis_client(INGESTION_EMBEDDING_CACHE_REDIS_URL))
+    if INGESTION_EMBEDDING_CACHE != "sqlite":
+        raise ValueError(f"Unsupported ingestion embedding cache: {INGESTION_EMBEDDING_CACHE}")
+    logger.debug(f"Ingestion embedding cache at {INGESTION_EMBEDDING_CACHE_PATH}.")
+    return SQLiteEmbeddingCache(INGESTION_EMBEDDING_CACHE_PATH)
@@ -1,38 +1,92 @@
 import io
+import multiprocessing
 import os
 import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
 from pathlib import Path
+from typing import Iterator
 
 from dotenv import load_dotenv
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
 from langchain_community.document_loaders import TextLoader, CSVLoader, PyPDFLoader
+from langchain_core.vectorstores import VectorStore
 from langchain_elasticsearch import ElasticsearchStore
 from langchain_openai import OpenAIEmbeddings
 from langchain_text_splitters import CharacterTextSplitter
 
 sys.path.insert(0, "configurations")
+sys.path.insert(1, "source")
 
 from custom_logger import logger
+from content_embedding_cache import document_id, get_content_embedding_cache
+from embedding_stage import EmbeddingStage
+from ingestion_pipeline import IngestionPipeline
+from retrieval_cache import index_generations
+from vector_stores import get_vector_store
 
 # Load environment variables from .env file
 dotenv_path = os.path.join(os.path.dirname(__file__), "../.env")
 load_dotenv(dotenv_path)
 
+# Processes parsing and splitting files; defaults to one per core
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "0")) or os.cpu_count() or 1
+# Chunks embedded and indexed together, and batches buffered between pipeline stages
+INGESTION_BATCH_SIZE = int(os.getenv("INGESTION_BATCH_SIZE", "100"))
+INGESTION_QUEUE_SIZE = int(os.getenv("INGESTION_QUEUE_SIZE", "4"))
+# Embedding requests: texts per request, requests in flight and token budget per minute (0 disables it).
+# A request never spans two pipeline batches, so it holds at most INGESTION_BATCH_SIZE texts.
+INGESTION_EMBED_BATCH_SIZE = int(os.getenv("INGESTION_EMBED_BATCH_SIZE", "100"))
+INGESTION_EMBED_CONCURRENCY = int(os.getenv("INGESTION_EMBED_CONCURRENCY", "4"))
+INGESTION_EMBED_TPM = int(os.getenv("INGESTION_EMBED_TPM", "0"))
+# Skip chunks whose content-derived document ID is already in the index
+INGESTION_SKIP_EXISTING = os.getenv("INGESTION_SKIP_EXISTING", "true").lower() == "true"
+DATA_TYPES = ("text", "csv", "pdf", "all")
+
+
+def _load_file_worker(file_path: str, load_csvs_separately: bool, data_type: str = "all") -> list:
+    """
+    Parses and splits one file in a worker process. Defined at module level so that it can be pickled.
+
+    Args:
+        file_path (str): Path to the file.
+        load_csvs_separately (bool): Whether CSV files are loaded with the CSV loader.
+        data_type (str): Type of the file ('text', 'csv', 'pdf'), or 'all' to pick the loader by extension.
+
+    Returns:
+        list: List of split document chunks.
+    """
+    return DataIngestor()._load_file(file_path, load_csvs_separately, data_type)
+
 
 class DataIngestor:
-    def __init__(self):
+    def __init__(self, workers: int | None = None, batch_size: int | None = None, queue_size: int | None = None,
+                 skip_existing: bool | None = None):
         """
         Initializes the DataIngestor with Elasticsearch URL and Google Drive credentials from environment variables.
+
+        Args:
+            workers (int | None): Number of processes loading files in parallel. Defaults to INGESTION_WORKERS.
+            batch_size (int | None): Chunks per embedding and indexing batch. Defaults to INGESTION_BATCH_SIZE.
+            queue_size (int | None): Batches buffered between pipeline stages. Defaults to INGESTION_QUEUE_SIZE.
+            skip_existing (bool | None): Whether chunks already in the index are skipped. Defaults to
+                INGESTION_SKIP_EXISTING.
         """
         self.es_url = os.getenv("ES_URL")
         self.google_drive_credentials = os.getenv("GOOGLE_DRIVE_CREDENTIALS")
+        self.workers = workers or INGESTION_WORKERS
+        self.batch_size = batch_size or INGESTION_BATCH_SIZE
+        self.queue_size = queue_size or INGESTION_QUEUE_SIZE
+        self.skip_existing = INGESTION_SKIP_EXISTING if skip_existing is None else skip_existing
 
     def load_data(self, file_path: str, index_name: str, source='local', load_csvs_separately: bool = False,
-                  data_type: str = "all"):
+                  data_type: str = "all", backend: str = "elasticsearch"):
         """
         Loads data from the specified file path or Google Drive folder and ingests it into Elasticsearch.
+        Files stream through a pipeline (discover, load and split, embed, bulk index) with bounded queues between
+        the stages, so memory stays flat and batches become searchable as soon as they are indexed. Chunks get
+        content-derived IDs, so re-ingesting unchanged files neither re-embeds nor duplicates them.
 
         Args:
             file_path (str): Path to the file or directory to load data from, or ID of the Google Drive folder.
@@ -40,6 +94,7 @@ class DataIngestor:
             source (str): Source of the files ('local' or 'google_drive'). Default is 'local'.
             load_csvs_separately (bool): Whether to load CSV files separately. Default is False.
             data_type (str): Type of data to load ('text', 'csv', 'pdf', or 'all'). Default is 'all'.
+            backend (str): Retrieval backend to ingest into ('elasticsearch' or 'local'). Default is 'elasticsearch'.
 
         Raises:
             ValueError: If an unsupported data type is provided.
@@ -49,26 +104,56 @@ class DataIngestor:
             self.download_files_from_drive(file_path, download_path)
             file_path = download_path  # Update file_path to local download path
 
-        embedding = OpenAIEmbeddings()
-        elastic_vector_search = ElasticsearchStore(
-            es_url=self.es_url,
-            index_name=index_name,
-            embedding=embedding
-        )
-        logger.info("Data loaded successfully.")
-
-        if data_type == "text":
-            documents = self._load_text(file_path)
-        elif data_type == "csv":
-            documents = self._load_csv(file_path)
-        elif data_type == "pdf":
-            documents = self._load_pdf(file_path)
-        elif data_type == "all":
-            documents = self._load_all(file_path, load_csvs_separately)
+        # Retries are owned by the embedding stage, which backs off adaptively on rate limits, so documents are
+        # embedded with a client that does not retry on its own for either backend
+        embedding = OpenAIEmbeddings(max_retries=0)
+        if backend == "local":
+            elastic_vector_search = get_vector_store(index_name, backend="local")
         else:
+            elastic_vector_search = ElasticsearchStore(
+                es_url=self.es_url,
+                index_name=index_name,
+                embedding=embedding
+            )
+        if data_type not in DATA_TYPES:
             raise ValueError(f"Unsupported data type: {data_type}")
 
-        self._ingest_to_elasticsearch(elastic_vector_search, documents)
+        if INGESTION_EMBED_BATCH_SIZE > self.batch_size:
+            logger.warning(f"Embedding requests are capped at the pipeline batch size of {self.batch_size} texts; "
+                           f"raise INGESTION_BATCH_SIZE to send {INGESTION_EMBED_BATCH_SIZE} per request.")
+        cache = get_content_embedding_cache()
+        embed = EmbeddingStage(
+            embedding,
+            batch_size=INGESTION_EMBED_BATCH_SIZE,
+            max_concurrency=INGESTION_EMBED_CONCURRENCY,
+            tokens_per_minute=INGESTION_EMBED_TPM or None,
+            cache=cache
+        )
+
+        def skip_existing(documents: list) -> list | None:
+            # Identical chunks of the same file share an ID; keep the first of them
+            unique = dict(zip((document_id(doc) for doc in documents), documents))
+            existing = self._existing_ids(elastic_vector_search, index_name, list(unique))
+            documents = [doc for doc_id, doc in unique.items() if doc_id not in existing]
+            return documents or None
+
+        def index(batch: tuple) -> None:
+            documents, vectors = batch
+            self._ingest_to_elasticsearch(elastic_vector_search, documents, vectors)
+            # Invalidate retrieval results cached before this batch landed
+            index_generations.bump(index_name)
+
+        pipeline = IngestionPipeline(queue_size=self.queue_size)
+        if self.skip_existing:
+            pipeline.add_stage("skip_existing", skip_existing)
+        pipeline.add_stage("embed", embed, workers=embed.max_concurrency).add_stage("index", index)
+        file_docs = self._iter_load_files(self._discover(file_path, data_type), load_csvs_separately, data_type)
+        try:
+            stats = pipeline.run(self._batch_chunks(file_docs))
+        finally:
+            if cache is not None:
+                cache.close()
+        logger.info(f"Data ingested into '{index_name}': {stats}; embedding: {embed.stats()}")
 
     def _load_text(self, file_path: str) -> list:
         """
@@ -113,21 +198,101 @@ class DataIngestor:
         pages = loader.load_and_split()
         return pages
 
-    def _load_all(self, directory_path: str, load_csvs_separately: bool) -> list:
-        docs = []
-        # Ensure the use of Path from pathlib for handling paths
-        base_path = Path(directory_path)
-        # Recursive glob needs to be correctly used with pathlib or similar
-        for file_path in base_path.rglob('*'):  # This correctly uses recursive globbing
-            if file_path.is_file():
-                if load_csvs_separately and file_path.suffix == '.csv':
-                    docs.extend(self._load_csv(str(file_path)))
-                elif file_path.suffix == '.pdf':
-                    docs.extend(self._load_pdf(str(file_path)))
-                else:
-                    # Assuming other files are text files
-                    docs.extend(self._split_documents([str(file_path)]))
-        return docs
+    @staticmethod
+    def _discover(file_path: str, data_type: str) -> Iterator[str]:
+        """
+        Yields the files to ingest: every file below the directory for 'all', otherwise the file itself.
+
+        Args:
+            file_path (str): Path to the file or directory.
+            data_type (str): Type of data to load ('text', 'csv', 'pdf', or 'all').
+
+        Yields:
+            str: Paths of the files to load.
+        """
+        if data_type != "all":
+            yield file_path
+            return
+        # Recursive glob over every file below the directory
+        for path in Path(file_path).rglob('*'):
+            if path.is_file():
+                yield str(path)
+
+    def _batch_chunks(self, file_docs: Iterator[list]) -> Iterator[list]:
+        """
+        Regroups the chunks of loaded files into batches of batch_size chunks.
+        """
+        batch = []
+        for docs in file_docs:
+            for doc in docs:
+                # Clean the metadata up front, so document IDs are the same in every stage
+                doc.metadata = {k: v for k, v in doc.metadata.items() if k != "page_content"}
+                batch.append(doc)
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _load_file(self, file_path: str, load_csvs_separately: bool, data_type: str = "all") -> list:
+        """
+        Loads and splits a single file with the loader of the data type, or the one matching its extension.
+
+        Args:
+            file_path (str): Path to the file.
+            load_csvs_separately (bool): Whether CSV files are loaded with the CSV loader.
+            data_type (str): Type of the file ('text', 'csv', 'pdf'), or 'all' to pick the loader by extension.
+
+        Returns:
+            list: List of split document chunks.
+        """
+        if data_type == "text":
+            return self._load_text(file_path)
+        if data_type == "csv":
+            return self._load_csv(file_path)
+        if data_type == "pdf":
+            return self._load_pdf(file_path)
+        suffix = Path(file_path).suffix
+        if load_csvs_separately and suffix == '.csv':
+            return self._load_csv(file_path)
+        if suffix == '.pdf':
+            return self._load_pdf(file_path)
+        # Assuming other files are text files
+        return self._load_text(file_path)
+
+    def _iter_load_files(self, file_paths, load_csvs_separately: bool, data_type: str = "all") -> Iterator[list]:
+        """
+        Loads files in a process pool and yields the chunks of each file as soon as it is done. At most two
+        files per worker are in flight, so the paths are consumed lazily. Workers are spawned rather than
+        forked: ingestion runs inside the API process, whose thread pools and client connections hold locks
+        that a forked child could inherit in a locked state and deadlock on.
+
+        Args:
+            file_paths (Iterable[str]): Paths of the files to load.
+            load_csvs_separately (bool): Whether CSV files are loaded with the CSV loader.
+            data_type (str): Type of the files, or 'all' to pick the loader by extension.
+
+        Yields:
+            list: The split document chunks of one file, in completion order.
+        """
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            pending = {}
+            for file_path in file_paths:
+                pending[pool.submit(_load_file_worker, file_path, load_csvs_separately, data_type)] = file_path
+                if len(pending) >= 2 * self.workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from self._file_result(future, pending.pop(future))
+            for future in as_completed(pending):
+                yield from self._file_result(future, pending[future])
+
+    @staticmethod
+    def _file_result(future, file_path: str) -> Iterator[list]:
+        try:
+            yield future.result()
+        except Exception as e:
+            # One unreadable file should not abort the ingestion of the rest of the corpus
+            logger.error(f"Error loading {file_path}: {e}")
 
     def _split_documents(self, documents: list) -> list:
         """
@@ -142,20 +307,51 @@ class DataIngestor:
         text_splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=10)
         return text_splitter.split_documents(documents)
 
-    def _ingest_to_elasticsearch(self, elastic_vector_search: ElasticsearchStore, documents: list) -> None:
+    def _ingest_to_elasticsearch(self, elastic_vector_search: VectorStore, documents: list,
+                                 embeddings: list | None = None) -> None:
         """
-        Ingests documents into Elasticsearch.
+        Ingests documents into Elasticsearch or the local vector index.
 
         Args:
-            elastic_vector_search (ElasticsearchStore): Elasticsearch store instance.
+            elastic_vector_search (VectorStore): Elasticsearch or local vector store instance.
             documents (list): List of documents to ingest.
+            embeddings (list | None): Precomputed embeddings of the documents; computed by the store when omitted.
         """
-        logger.info("Ingesting documents to Elasticsearch...")
+        logger.info(f"Ingesting {len(documents)} documents to Elasticsearch...")
         for doc in documents:
             doc.metadata = {k: v for k, v in doc.metadata.items() if k != "page_content"}
-        elastic_vector_search.add_documents(documents)
+        ids = [document_id(doc) for doc in documents]
+        if embeddings is None:
+            elastic_vector_search.add_documents(documents, ids=ids)
+        else:
+            elastic_vector_search.add_embeddings(
+                list(zip([doc.page_content for doc in documents], embeddings)),
+                metadatas=[doc.metadata for doc in documents],
+                ids=ids
+            )
         logger.info("Documents ingested successfully.")
 
+    @staticmethod
+    def _existing_ids(elastic_vector_search: VectorStore, index_name: str, ids: list) -> set:
+        """
+        Returns the IDs among the given ones that are already stored in the index.
+
+        Args:
+            elastic_vector_search (VectorStore): Elasticsearch or local vector store instance.
+            index_name (str): Name of the index.
+            ids (list): The document IDs to check.
+
+        Returns:
+            set: The stored IDs.
+        """
+        if hasattr(elastic_vector_search, "existing_ids"):
+            return elastic_vector_search.existing_ids(ids)
+        client = elastic_vector_search.client
+        if not client.indices.exists(index=index_name):
+            return set()
+        response = client.mget(index=index_name, ids=ids, source=False)
+        return {doc["_id"] for doc in response["docs"] if doc.get("found")}
+
     def connect_to_google_drive(self):
         """
         Connects to Google Drive using service account credentials.
@@ -0,0 +1,227 @@
+import random
+import threading
+import time
+
+import openai
+from custom_logger import logger
+from langchain_core.embeddings import Embeddings
+
+from content_embedding_cache import content_hash, embedding_model_name
+from context_packer import count_tokens
+
+# Lowest fraction of the unthrottled request rate the adaptive limiter throttles down to after repeated 429s
+MIN_RATE_FACTOR = 0.1
+# Weight of the latest request in the moving average of the request latency
+LATENCY_SMOOTHING = 0.2
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at a tokens-per-minute rate, holding at most one minute of tokens.
+    """
+
+    def __init__(self, tokens_per_minute: float) -> None:
+        self.tokens_per_minute = tokens_per_minute
+        self.rate = tokens_per_minute / 60
+        self.capacity = tokens_per_minute
+        self._tokens = tokens_per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int) -> float:
+        """
+        Blocks until the tokens are available and takes them. A request larger than the bucket waits for
+        a full bucket.
+
+        Args:
+            tokens (int): The number of tokens to take.
+
+        Returns:
+            float: The seconds spent waiting.
+        """
+        tokens = min(tokens, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class EmbeddingStage:
+    """
+    Ingestion stage embedding batches of documents with a bounded number of concurrent requests, an optional
+    tokens-per-minute budget and adaptive backoff: every 429 halves the request rate, which then recovers
+    gradually as requests succeed. The unthrottled rate is estimated as the concurrency over the average request
+    latency, and a throttled rate is enforced by spacing request starts. With a content cache, chunks embedded
+    before are served from it.
+    """
+
+    def __init__(self, embedding: Embeddings, batch_size: int = 100, max_concurrency: int = 4,
+                 tokens_per_minute: int | None = None, max_retries: int = 6, backoff_base: float = 1.0,
+                 backoff_max: float = 60.0, cache=None) -> None:
+        """
+        Initializes the EmbeddingStage.
+
+        Args:
+            embedding (Embeddings): The embeddings client; its own retries should be turned off.
+            batch_size (int): Number of texts sent in one embedding request. A request never spans two calls of
+                the stage, so it is also capped by the size of the batches the stage receives.
+            max_concurrency (int): Maximum number of embedding requests in flight.
+            tokens_per_minute (int | None): Token budget per minute; None disables rate limiting.
+            max_retries (int): Retries of a request that was rate limited or failed transiently.
+            backoff_base (float): Base delay of the exponential backoff in seconds.
+            backoff_max (float): Maximum backoff delay in seconds.
+            cache (SQLiteEmbeddingCache | RedisEmbeddingCache | None): Persistent embeddings keyed by model and
+                content hash.
+
+        Returns:
+            None
+        """
+        self.embedding = embedding
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cache = cache
+        self.model_name = embedding_model_name(embedding)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._rate_factor = 1.0
+        self._latency = None
+        self._last_start = 0.0
+        self._started = None
+        self._counts = {"embeddings": 0, "requests": 0, "tokens": 0, "rate_limited": 0, "retries": 0,
+                        "cache_hits": 0, "throttled_seconds": 0.0}
+
+    def __call__(self, documents: list) -> tuple:
+        """
+        Embeds a batch of documents.
+
+        Args:
+            documents (list): The documents to embed.
+
+        Returns:
+            tuple: The documents and their embeddings, in the same order.
+        """
+        texts = [doc.page_content for doc in documents]
+        hashes = [content_hash(text) for text in texts]
+        cached = self.cache.get_many(self.model_name, hashes) if self.cache is not None else {}
+        with self._lock:
+            self._counts["cache_hits"] += sum(1 for key in hashes if key in cached)
+
+        # Embed each distinct uncached text once
+        missing = list(dict.fromkeys((key, text) for key, text in zip(hashes, texts) if key not in cached))
+        computed = {}
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            computed.update(zip([key for key, _ in batch], self.embed([text for _, text in batch])))
+        if computed and self.cache is not None:
+            self.cache.set_many(self.model_name, computed)
+
+        vectors = {**cached, **computed}
+        return documents, [vectors[key] for key in hashes]
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embeds texts in one request, waiting for the token budget, the throttled rate and a request slot, and
+        retrying rate limited or transiently failed requests with jittered exponential backoff.
+
+        Args:
+            texts (list[str]): The texts to embed.
+
+        Returns:
+            list[list[float]]: The embeddings.
+        """
+        tokens = sum(count_tokens(text) for text in texts)
+        with self._lock:
+            if self._started is None:
+                self._started = time.monotonic()
+
+        for retry in range(self.max_retries + 1):
+            if self.bucket is not None:
+                self.bucket.acquire(tokens)
+            self._throttle()
+            try:
+                with self._slots:
+                    started = time.monotonic()
+                    vectors = self.embedding.embed_documents(texts)
+                    latency = time.monotonic() - started
+            except (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError,
+                    openai.InternalServerError) as e:
+                if retry == self.max_retries:
+                    raise
+                delay = self._on_failure(e, retry)
+                logger.warning(f"Embedding request failed ({type(e).__name__}), retrying in {delay:.2f}s.")
+                time.sleep(delay)
+                continue
+            self._on_success(len(texts), tokens, latency)
+            return vectors
+
+    def stats(self) -> dict:
+        """
+        Returns the stage counters and the embedding throughput.
+        """
+        with self._lock:
+            elapsed = time.monotonic() - self._started if self._started is not None else 0.0
+            return {
+                **self._counts,
+                "seconds": round(elapsed, 3),
+                "embeddings_per_second": round(self._counts["embeddings"] / elapsed, 2) if elapsed else 0.0,
+                "throttled_seconds": round(self._counts["throttled_seconds"], 3),
+                "rate_factor": round(self._rate_factor, 3),
+            }
+
+    def _throttle(self) -> None:
+        """
+        Waits until the next request may start when the rate is throttled. Starts are spaced by the average
+        request latency over the concurrency scaled by the rate factor.
+        """
+        with self._lock:
+            now = time.monotonic()
+            start = now
+            if self._rate_factor < 1.0 and self._latency is not None:
+                spacing = self._latency / (self.max_concurrency * self._rate_factor)
+                start = max(now, self._last_start + spacing)
+            self._last_start = start
+            self._counts["throttled_seconds"] += start - now
+        if start > now:
+            time.sleep(start - now)
+
+    def _on_success(self, count: int, tokens: int, latency: float) -> None:
+        with self._lock:
+            self._counts["embeddings"] += count
+            self._counts["requests"] += 1
+            self._counts["tokens"] += tokens
+            if self._latency is None:
+                self._latency = latency
+            else:
+                self._latency += LATENCY_SMOOTHING * (latency - self._latency)
+            if self._rate_factor < 1.0:
+                self._rate_factor = min(1.0, self._rate_factor * 1.1)
+
+    def _on_failure(self, error: Exception, retry: int) -> float:
+        """
+        Records a failed request, throttles the rate on a 429 and returns the delay before the retry.
+        """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry))
+        with self._lock:
+            self._counts["retries"] += 1
+            if isinstance(error, openai.RateLimitError):
+                self._counts["rate_limited"] += 1
+                self._rate_factor = max(MIN_RATE_FACTOR, self._rate_factor / 2)
+                retry_after = error.response.headers.get("retry-after")
+                if retry_after:
+                    try:
+                        delay = max(delay, float(retry_after))
+                    except ValueError:
+                        pass
+        return delay
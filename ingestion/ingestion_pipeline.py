@@ -0,0 +1,140 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable
+
+from custom_logger import logger
+
+# Marks the end of a stage's input
+_DONE = object()
+# Interval at which blocked stages check whether the pipeline was stopped
+_POLL_SECONDS = 0.1
+
+
+class IngestionPipeline:
+    """
+    Runs items through a chain of stages connected by bounded queues. Each stage has its own worker threads;
+    a full queue blocks the stage feeding it, so no more than a few items per stage are held in memory at
+    any time. A stage returning None drops the item. The first failing stage stops the whole pipeline.
+    """
+
+    def __init__(self, queue_size: int = 4) -> None:
+        """
+        Initializes an empty pipeline.
+
+        Args:
+            queue_size (int): Capacity of the queue in front of every stage.
+
+        Returns:
+            None
+        """
+        self.queue_size = queue_size
+        self.stages: list[tuple[str, Callable[[Any], Any], int]] = []
+
+    def add_stage(self, name: str, function: Callable[[Any], Any], workers: int = 1) -> "IngestionPipeline":
+        """
+        Appends a stage.
+
+        Args:
+            name (str): The stage name used in logs and statistics.
+            function (Callable[[Any], Any]): Transforms one item; the result of the last stage is discarded.
+            workers (int): Number of threads running the stage concurrently.
+
+        Returns:
+            IngestionPipeline: The pipeline, for chaining.
+        """
+        self.stages.append((name, function, workers))
+        return self
+
+    def run(self, source: Iterable[Any]) -> dict:
+        """
+        Feeds the items of the source through the stages and waits until every item is processed.
+
+        Args:
+            source (Iterable[Any]): The items entering the first stage; consumed lazily.
+
+        Returns:
+            dict: The number of items each stage processed and the elapsed seconds.
+
+        Raises:
+            Exception: The first error raised by the source or a stage.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        remaining = [workers for _, _, workers in self.stages]
+        counts = {name: 0 for name, _, _ in self.stages}
+        stop = threading.Event()
+        errors: list[BaseException] = []
+        lock = threading.Lock()
+        started = time.monotonic()
+
+        def put(position: int, item: Any) -> bool:
+            while not stop.is_set():
+                try:
+                    queues[position].put(item, timeout=_POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(position: int) -> Any:
+            while True:
+                try:
+                    return queues[position].get(timeout=_POLL_SECONDS)
+                except queue.Empty:
+                    if stop.is_set():
+                        return _DONE
+
+        def fail(error: BaseException) -> None:
+            with lock:
+                errors.append(error)
+            stop.set()
+
+        def work(position: int) -> None:
+            name, function, _ = self.stages[position]
+            while True:
+                item = get(position)
+                if item is _DONE:
+                    break
+                try:
+                    result = function(item)
+                except BaseException as e:
+                    logger.error(f"Ingestion stage '{name}' failed: {e}", exc_info=True)
+                    fail(e)
+                    break
+                with lock:
+                    counts[name] += 1
+                if result is not None and position + 1 < len(self.stages) and not put(position + 1, result):
+                    break
+            with lock:
+                remaining[position] -= 1
+                last = remaining[position] == 0
+            # The last worker of a stage closes the input of the next one
+            if last and position + 1 < len(self.stages):
+                for _ in range(self.stages[position + 1][2]):
+                    put(position + 1, _DONE)
+
+        threads = [
+            threading.Thread(target=work, args=(position,), name=f"ingest-{name}-{index}", daemon=True)
+            for position, (name, _, workers) in enumerate(self.stages)
+            for index in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for item in source:
+                if not put(0, item):
+                    break
+        except BaseException as e:
+            logger.error(f"Ingestion source failed: {e}", exc_info=True)
+            fail(e)
+        finally:
+            for _ in range(self.stages[0][2]):
+                put(0, _DONE)
+            for thread in threads:
+                thread.join()
+
+        if errors:
+            raise errors[0]
+        counts["seconds"] = round(time.monotonic() - started, 3)
+        return counts
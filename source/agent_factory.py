@@ -2,7 +2,7 @@ from custom_logger import logger
 from langchain.agents import create_openai_tools_agent, AgentExecutor
 from langchain_core.runnables.history import Runnable
 
-from tools_lib import initialize_tools
+from tools_lib import init_executor, initialize_tools, release_tools
 from utils import model, fetch_prompt
 
 
@@ -17,40 +17,51 @@ class AgentManager:
         self.settings = settings
         logger.debug("AgentManager initialized with settings.")
 
-    def initialize_agent(self) -> Runnable:
+    def initialize_agent(self, errors: dict | None = None) -> Runnable:
         """
-        Initializes and configures the agent for execution.
+        Initializes and configures the agent for execution. The agent prompt is pulled while the tools are built.
+
+        Args:
+            errors (dict | None): Collects the error message of every tool that failed, keyed by tool name.
 
         Returns:
             agent_runnable (Runnable): The agent setup and configured tools.
 
         """
         prompt_id = self.settings["parent_settings"]["agent_id"]
-        prompt_text = fetch_prompt(prompt_id)
-        logger.debug(f"Prompt fetched: {prompt_text}")
+        prompt_future = init_executor.submit(fetch_prompt, prompt_id)
 
-        tools = initialize_tools(self.settings)
+        tools = initialize_tools(self.settings, errors)
         logger.debug(f"Tools initialized: {tools}")
 
-        agent_runnable = create_openai_tools_agent(model, tools, prompt_text)
-        logger.debug("Agent created and configured with tools and prompt.")
-        agent_executor = AgentExecutor(
-            agent=agent_runnable,
-            tools=tools,
-            verbose=True,
-            return_intermediate_steps=True,
-            early_stopping_method="generate"
-        )
+        try:
+            prompt_text = prompt_future.result()
+            logger.debug(f"Prompt fetched: {prompt_text}")
+
+            agent_runnable = create_openai_tools_agent(model, tools, prompt_text)
+            logger.debug("Agent created and configured with tools and prompt.")
+            agent_executor = AgentExecutor(
+                agent=agent_runnable,
+                tools=tools,
+                verbose=self.settings["parent_settings"].get("verbose", False),
+                return_intermediate_steps=True,
+                early_stopping_method="generate"
+            )
+        except Exception:
+            # No agent holds the tools, so their registry references would never be released
+            release_tools(tools)
+            raise
 
         return agent_executor
 
 
-def agent_manager(settings: dict) -> Runnable:
+def agent_manager(settings: dict, errors: dict | None = None) -> Runnable:
     """
     Executes the agent using the provided settings.
 
     Args:
         settings (dict): Settings to be used for agent execution.
+        errors (dict | None): Collects the error messages of the agent ("agent") and of its failed tools.
 
     Returns:
         agent_setup (Runnable): The agent setup and configured tools.
@@ -62,9 +73,11 @@ def agent_manager(settings: dict) -> Runnable:
 
     try:
         logger.info("Initializing agent and tools.")
-        agent_setup = agent_manager_instance.initialize_agent()
+        agent_setup = agent_manager_instance.initialize_agent(errors)
         logger.info("Agent and tools initialized successfully.")
     except Exception as e:
         logger.error(f"Error during agent execution: {e}", exc_info=True)
+        if errors is not None:
+            errors["agent"] = str(e)
 
     return agent_setup
@@ -0,0 +1,163 @@
+import uuid
+from typing import Any
+
+import numpy as np
+from custom_logger import logger
+
+from cache_store import TTLCache
+from retrieval_cache import ALL_INDEXES, index_generations
+from vector_stores import get_embeddings
+
+# Default cache behaviour, overridden per app through the "answer_cache" settings block
+DEFAULT_SETTINGS = {
+    "enabled": False,
+    "similarity_threshold": 0.95,
+    "max_entries": 500,
+    "ttl": 3600,
+    "only_fresh_sessions": True,
+}
+
+
+class SemanticAnswerCache:
+    """
+    Caches final graph answers per app and returns them for semantically similar queries. Answers are tagged
+    with the KB generation they were produced at and go stale as soon as any index is ingested into.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initializes the SemanticAnswerCache with one entry store per app.
+
+        Returns:
+            None
+        """
+        self._stores: dict[str, TTLCache] = {}
+        logger.debug("SemanticAnswerCache initialized.")
+
+    @staticmethod
+    def resolve_settings(settings: dict) -> dict:
+        """
+        Merges the app's "answer_cache" settings block with the defaults.
+
+        Args:
+            settings (dict): The application settings.
+
+        Returns:
+            dict: The effective cache settings.
+        """
+        return {**DEFAULT_SETTINGS, **(settings.get("answer_cache") or {})}
+
+    def lookup(self, app_name: str, query: str, settings_version: str,
+               cache_settings: dict) -> tuple[Any | None, np.ndarray | None]:
+        """
+        Looks up a cached answer for a query similar enough to a previously answered one.
+
+        Args:
+            app_name (str): The name of the application.
+            query (str): The incoming user query.
+            settings_version (str): Version of the settings the answer must have been produced with.
+            cache_settings (dict): The effective cache settings.
+
+        Returns:
+            tuple[Any | None, np.ndarray | None]: The cached result, or None on a miss, and the query vector if
+                the query was embedded, to be passed on to store.
+        """
+        store = self._stores.get(app_name)
+        if not store:
+            return None, None
+
+        generation = index_generations.get(ALL_INDEXES)
+        entries = [(key, entry) for key, entry in store.items()]
+        stale = [
+            key for key, entry in entries
+            if entry["settings_version"] != settings_version or entry["generation"] != generation
+        ]
+        for key in stale:
+            store.pop(key)
+        entries = [(key, entry) for key, entry in entries if key not in stale]
+        if not entries:
+            return None, None
+
+        query_vector = self._embed(query)
+        if query_vector is None:
+            return None, None
+
+        scores = np.stack([entry["vector"] for _, entry in entries]) @ query_vector
+        best = int(np.argmax(scores))
+        if scores[best] < cache_settings["similarity_threshold"]:
+            logger.debug(f"Answer cache miss for app '{app_name}' (best similarity {scores[best]:.3f}).")
+            return None, query_vector
+
+        key, entry = entries[best]
+        store.get(key)  # Refresh the entry's recency
+        logger.info(f"Answer cache hit for app '{app_name}' (similarity {scores[best]:.3f}).")
+        return entry["result"], query_vector
+
+    def store(self, app_name: str, query: str, settings_version: str, result: Any, cache_settings: dict,
+              query_vector: np.ndarray | None = None) -> None:
+        """
+        Stores a final answer for later lookups.
+
+        Args:
+            app_name (str): The name of the application.
+            query (str): The user query that produced the answer.
+            settings_version (str): Version of the settings the answer was produced with.
+            result (Any): The final result returned by the graph.
+            cache_settings (dict): The effective cache settings.
+            query_vector (np.ndarray | None): The query vector returned by lookup; the query is embedded when
+                omitted.
+        """
+        # Read before embedding, so an ingestion finishing meanwhile makes the entry stale rather than current
+        generation = index_generations.get(ALL_INDEXES)
+        if query_vector is None:
+            query_vector = self._embed(query)
+        if query_vector is None:
+            return
+
+        store = self._stores.get(app_name)
+        if store is None:
+            store = self._stores.setdefault(
+                app_name, TTLCache(max_size=cache_settings["max_entries"], ttl=cache_settings["ttl"])
+            )
+        store.set(uuid.uuid4().hex, {
+            "vector": query_vector,
+            "query": query,
+            "settings_version": settings_version,
+            "generation": generation,
+            "result": result,
+        })
+        logger.debug(f"Answer cached for app '{app_name}'.")
+
+    def invalidate(self, app_name: str | None = None) -> None:
+        """
+        Drops cached answers for one app, or for every app when no name is given.
+
+        Args:
+            app_name (str | None): The application whose answers should be dropped.
+        """
+        if app_name is None:
+            self._stores.clear()
+            logger.info("Answer cache invalidated for all apps.")
+        else:
+            self._stores.pop(app_name, None)
+            logger.info(f"Answer cache invalidated for app '{app_name}'.")
+
+    def _embed(self, query: str) -> np.ndarray | None:
+        """
+        Embeds and normalizes a query so that a dot product yields the cosine similarity.
+
+        Args:
+            query (str): The query to embed.
+
+        Returns:
+            np.ndarray | None: The unit-length query vector, or None if embedding failed.
+        """
+        try:
+            vector = np.asarray(get_embeddings().embed_query(query), dtype=np.float32)
+            return vector / (np.linalg.norm(vector) or 1.0)
+        except Exception as e:
+            logger.error(f"Error embedding query for answer cache: {e}", exc_info=True)
+            return None
+
+
+answer_cache = SemanticAnswerCache()
@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+import redis
+
+from replay import MEMORY_REDIS_SCHEME, FakeRedis
+
+
+class TTLCache:
+    """
+    Thread-safe in-process cache with least-recently-used eviction and an optional time-to-live per entry.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float | None = None) -> None:
+        """
+        Initializes the cache.
+
+        Args:
+            max_size (int): Maximum number of entries kept before the least recently used one is evicted.
+            ttl (float | None): Default time-to-live in seconds. None keeps entries until they are evicted.
+
+        Returns:
+            None
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Returns the value stored under the key, or the default when it is missing or expired.
+
+        Args:
+            key (Hashable): The cache key.
+            default (Any): Value returned on a miss.
+
+        Returns:
+            Any: The cached value or the default.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        """
+        Stores a value, evicting the least recently used entries when the cache is full.
+
+        Args:
+            key (Hashable): The cache key.
+            value (Any): The value to store.
+            ttl (float | None): Time-to-live overriding the cache default.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Removes a key from the cache.
+
+        Args:
+            key (Hashable): The cache key.
+            default (Any): Value returned when the key is not cached.
+
+        Returns:
+            Any: The removed value or the default.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def items(self) -> list[tuple[Hashable, Any]]:
+        """
+        Returns a snapshot of the live entries, dropping expired ones on the way.
+
+        Returns:
+            list[tuple[Hashable, Any]]: Key/value pairs in least to most recently used order.
+        """
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if self._expired(entry)]:
+                del self._entries[key]
+            return [(key, entry[0]) for key, entry in self._entries.items()]
+
+    def clear(self) -> None:
+        """
+        Removes every entry from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns hit, miss and eviction counters for the cache.
+
+        Returns:
+            dict: Cache statistics.
+        """
+        return {"size": len(self), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _expired(entry: tuple) -> bool:
+        expires_at = entry[1]
+        return expires_at is not None and expires_at <= time.monotonic()
+
+
+def get_redis_client(url: str | None, decode_responses: bool = False):
+    """
+    Returns a Redis client for an optional shared cache tier.
+
+    Args:
+        url (str | None): The Redis URL. An empty value disables the tier; memory:// uses the in-process fake.
+        decode_responses (bool): Whether the client should decode responses to strings.
+
+    Returns:
+        redis.Redis | None: The client, or None when no URL is configured.
+    """
+    if not url:
+        return None
+    if url.startswith(MEMORY_REDIS_SCHEME):
+        return FakeRedis(url, decode_responses=decode_responses)
+    return redis.Redis.from_url(url, decode_responses=decode_responses)
@@ -0,0 +1,203 @@
+import functools
+import re
+from typing import Iterable
+
+import tiktoken
+from custom_logger import logger
+from langchain_core.documents import Document
+
+# Shortest and longest suffix/prefix overlap accepted when stitching adjacent chunks back together
+MIN_STITCH_OVERLAP = 10
+MAX_STITCH_OVERLAP = 200
+# Partial chunks shorter than this are dropped instead of being squeezed into the remaining budget
+MIN_PARTIAL_TOKENS = 50
+
+
+@functools.lru_cache(maxsize=8)
+def get_encoding(encoding_name: str = "cl100k_base") -> tiktoken.Encoding:
+    """
+    Returns a cached tiktoken encoding.
+
+    Args:
+        encoding_name (str): Name of the tiktoken encoding.
+
+    Returns:
+        encoding (tiktoken.Encoding): The encoding.
+    """
+    return tiktoken.get_encoding(encoding_name)
+
+
+def count_tokens(text: str, encoding_name: str = "cl100k_base") -> int:
+    """
+    Counts the tokens of a text.
+
+    Args:
+        text (str): The text to count.
+        encoding_name (str): Name of the tiktoken encoding.
+
+    Returns:
+        count (int): The number of tokens.
+    """
+    return len(get_encoding(encoding_name).encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, encoding_name: str = "cl100k_base") -> str:
+    """
+    Truncates a text to at most max_tokens tokens.
+
+    Args:
+        text (str): The text to truncate.
+        max_tokens (int): The token limit.
+        encoding_name (str): Name of the tiktoken encoding.
+
+    Returns:
+        truncated (str): The text, cut at the token limit.
+    """
+    encoding = get_encoding(encoding_name)
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def deduplicate(documents: list[Document], threshold: float = 0.9) -> list[Document]:
+    """
+    Drops documents whose word shingles overlap an earlier, better ranked document above the threshold.
+
+    Args:
+        documents (list[Document]): Documents in rank order.
+        threshold (float): Jaccard similarity above which a document counts as a near duplicate.
+
+    Returns:
+        kept (list[Document]): The documents without near duplicates, in rank order.
+    """
+    kept, kept_shingles = [], []
+    for document in documents:
+        shingles = _shingles(document.page_content)
+        if any(len(shingles & other) / (len(shingles | other) or 1) >= threshold for other in kept_shingles):
+            continue
+        kept.append(document)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def _stitch(first: str, second: str) -> str | None:
+    """
+    Joins two chunks when the end of the first overlaps the start of the second.
+    """
+    for size in range(min(MAX_STITCH_OVERLAP, len(first), len(second)), MIN_STITCH_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return None
+
+
+def _join(first: Document, second: Document) -> str | None:
+    """
+    Joins two chunks of the same source when the second continues the first: their texts overlap, or the
+    second starts where the first ends on the same page according to the "start_index" metadata.
+    """
+    text = _stitch(first.page_content, second.page_content)
+    if text is not None:
+        return text
+    starts = (first.metadata.get("start_index"), second.metadata.get("start_index"))
+    if all(isinstance(start, int) for start in starts) and \
+            first.metadata.get("page") == second.metadata.get("page") and \
+            starts[0] + len(first.page_content) == starts[1]:
+        return first.page_content + second.page_content
+    return None
+
+
+def _page_range(document: Document) -> list[int]:
+    page = document.metadata.get("page")
+    return document.metadata.get("page_range") or ([page, page] if isinstance(page, int) else [])
+
+
+def _merge(kept: Document, document: Document) -> Document | None:
+    """
+    Merges a chunk into a better ranked chunk of the same source when one continues the other, keeping the
+    metadata of the better ranked chunk, the page and offset of the first part and the pages spanned.
+    """
+    for first, second in ((kept, document), (document, kept)):
+        text = _join(first, second)
+        if text is None:
+            continue
+        metadata = dict(kept.metadata)
+        for key in ("page", "start_index"):
+            if key in first.metadata:
+                metadata[key] = first.metadata[key]
+        pages = _page_range(first) + _page_range(second)
+        if pages:
+            metadata["page_range"] = [min(pages), max(pages)]
+        return Document(page_content=text, metadata=metadata)
+    return None
+
+
+def merge_adjacent(documents: list[Document]) -> list[Document]:
+    """
+    Merges chunks from the same source whose texts continue each other, keeping the better rank. The merged
+    chunk records the pages it spans in "page_range".
+
+    Args:
+        documents (list[Document]): Documents in rank order.
+
+    Returns:
+        merged (list[Document]): Documents with adjacent chunks merged, in rank order.
+    """
+    merged: list[Document] = []
+    for document in documents:
+        source = document.metadata.get("source")
+        for index, kept in enumerate(merged):
+            if source is None or kept.metadata.get("source") != source:
+                continue
+            joined = _merge(kept, document)
+            if joined is not None:
+                merged[index] = joined
+                break
+        else:
+            merged.append(document)
+    return merged
+
+
+def pack_context(documents: Iterable[Document | str], budget_tokens: int = 3000, dedup_threshold: float = 0.9,
+                 encoding_name: str = "cl100k_base") -> str:
+    """
+    Assembles retrieved content into a prompt context: deduplicates near-identical chunks, merges adjacent
+    chunks from the same source and packs the highest ranked content into a token budget.
+
+    Args:
+        documents (Iterable[Document | str]): Retrieved content in rank order, best first.
+        budget_tokens (int): Maximum number of tokens of the packed context.
+        dedup_threshold (float): Jaccard similarity above which chunks count as near duplicates.
+        encoding_name (str): Name of the tiktoken encoding used for counting.
+
+    Returns:
+        context (str): The packed context.
+    """
+    documents = [
+        document if isinstance(document, Document) else Document(page_content=str(document))
+        for document in documents
+    ]
+    documents = [document for document in documents if document.page_content.strip()]
+    candidates = merge_adjacent(deduplicate(documents, dedup_threshold))
+
+    sections, used = [], 0
+    for document in candidates:
+        source = document.metadata.get("source")
+        header = f"[{len(sections) + 1}]" + (f" (source: {source})" if source else "")
+        section = f"{header}\n{document.page_content}"
+        tokens = count_tokens(section, encoding_name)
+        remaining = budget_tokens - used
+        if tokens > remaining:
+            if remaining >= MIN_PARTIAL_TOKENS:
+                sections.append(truncate_tokens(section, remaining, encoding_name))
+            break
+        sections.append(section)
+        used += tokens
+
+    logger.debug(f"Packed {len(sections)} of {len(documents)} retrieved chunks into the context budget.")
+    return "\n\n".join(sections)
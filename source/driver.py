@@ -1,35 +1,90 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any
 
 from custom_logger import logger
 from langchain_core.messages import HumanMessage
 
 from agent_factory import agent_manager
+from answer_cache import answer_cache
+from instrumentation import debug_callbacks
+from request_memo import request_scope
 from graph_assembler import graph_manager
+from tools_lib import release_tools
 from utils import get_memory, update_memory
 
 # Variable to hold the settings state across function calls
 last_settings = None
+AGENT_KEYS = ("research_agent", "discriminator_agent", "drafter_agent")
+# Agents are built side by side; their tools are built on the tool initialization pool
+agent_executor = ThreadPoolExecutor(max_workers=int(os.getenv("AGENT_INIT_WORKERS", "3")),
+                                    thread_name_prefix="agent-init")
 
 
-def update_settings(settings: Dict[str, Any]) -> None:
+def release_agent_tools(settings: Dict[str, Any]) -> None:
+    """
+    Releases the shared tools held by the agents of a settings dictionary.
+
+    Args:
+    settings (Dict[str, Any]): Settings whose agent entries may hold initialized agents.
+    """
+    for agent_key in AGENT_KEYS:
+        release_tools(getattr(settings.get(agent_key), "tools", []))
+
+
+def update_settings(settings: Dict[str, Any]) -> Dict[str, Any]:
     """
     Update and initialize the application settings with the provided dictionary.
-    This function initializes various agents as per the settings and updates the application graph.
+    This function initializes the agents concurrently as per the settings and updates the application graph.
 
     Args:
     settings (Dict[str, Any]): A dictionary containing configuration settings for various agents and app components.
+
+    Returns:
+    Dict[str, Any]: Error messages of the components that failed, keyed by agent and then by tool name. An "app"
+    entry means the application could not be built and the previous settings stay in use.
     """
     logger.debug("Initializing agent and tools with provided settings.")
+    errors = {agent_key: {} for agent_key in AGENT_KEYS}
     try:
-        # Initialize agents with settings from the configuration
-        research_agent = agent_manager(settings["research_agent"])
-        discriminator_agent = agent_manager(settings["discriminator_agent"])
-        drafter_agent = agent_manager(settings["drafter_agent"])
+        # Fingerprint the raw settings before agents replace their configuration blocks
+        settings["settings_version"] = hashlib.sha256(
+            json.dumps(settings, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+        missing = [agent_key for agent_key in AGENT_KEYS if agent_key not in settings]
+        if missing:
+            raise KeyError(f"Settings are missing the agents {missing}")
+
+        # Initialize agents concurrently with settings from the configuration
+        futures = {
+            agent_key: agent_executor.submit(agent_manager, settings[agent_key], errors[agent_key])
+            for agent_key in AGENT_KEYS
+        }
+
+        # Wait for every agent, so the ones already built can be released if another one failed
+        agents, failure = {}, None
+        for agent_key, future in futures.items():
+            try:
+                agents[agent_key] = future.result()
+            except Exception as e:
+                failure = failure or e
+        failed = [agent_key for agent_key, agent in agents.items() if agent is None]
+        if failure is None and failed:
+            failure = RuntimeError(f"Agents could not be built: {failed}")
+        if failure is not None:
+            for agent in agents.values():
+                release_tools(getattr(agent, "tools", []))
+            raise failure
 
         # Update settings dictionary with initialized agents
-        settings["research_agent"] = research_agent
-        settings["discriminator_agent"] = discriminator_agent
-        settings["drafter_agent"] = drafter_agent
+        settings.update(agents)
+
+        errors = {agent_key: failures for agent_key, failures in errors.items() if failures}
+        if errors:
+            logger.warning(f"Settings update completed with failed components: {errors}")
 
         # Initialize graph with these updated settings
         settings["app"] = graph_manager(settings)
@@ -37,14 +92,18 @@ def update_settings(settings: Dict[str, Any]) -> None:
     except Exception as e:
         # Log any exceptions encountered during initialization
         logger.error(f"Error initializing agents: {e}", exc_info=True)
-        return
+        release_agent_tools(settings)
+        return {"app": str(e), **{key: value for key, value in errors.items() if value}}
 
-    # Store the successfully updated settings globally for later use
+    # Store the successfully updated settings globally for later use, releasing the tools of the replaced app
     global last_settings
+    if last_settings is not None and last_settings is not settings:
+        release_agent_tools(last_settings)
     last_settings = settings
+    return errors
 
 
-def ast_driver(in_params: Dict[str, Any], settings: Dict[str, Any] = None) -> tuple:
+def ast_driver(in_params: Dict[str, Any], settings: Dict[str, Any] = None, debug: bool = False) -> tuple:
     """
     Main driver function to process incoming parameters using application settings.
     This function handles initialization, message processing, and memory updates.
@@ -52,6 +111,7 @@ def ast_driver(in_params: Dict[str, Any], settings: Dict[str, Any] = None) -> tu
     Args:
     in_params (Dict[str, Any]): A dictionary containing input parameters like session ID and query.
     settings (Dict[str, Any], optional): A dictionary of settings that may override the last used settings.
+    debug (bool, optional): Whether to print verbose chain traces and streamed tokens for this request only.
 
     Returns:
     tuple: A tuple containing the result of processing and the status message.
@@ -69,7 +129,10 @@ def ast_driver(in_params: Dict[str, Any], settings: Dict[str, Any] = None) -> tu
         settings = last_settings
     else:
         logger.debug("Updating settings.")
-        update_settings(settings)
+        errors = update_settings(settings)
+        if "app" in errors:
+            return f"Initialization failed. {errors}", "500 Internal Server Error"
+        answer_cache.invalidate(in_params.get("app_name"))
 
     # Retrieve the application instance from settings
     app = settings.get("app")
@@ -80,14 +143,34 @@ def ast_driver(in_params: Dict[str, Any], settings: Dict[str, Any] = None) -> tu
     try:
         # Retrieve chat history from memory based on session ID
         chat_history = get_memory(in_params["session_id"])
-        result = app.invoke(
-            {
-                "messages": [
-                    HumanMessage(content=in_params["query"])
-                ],
-                "chat_history": chat_history.messages
-            }
-        )
+        history_messages = chat_history.messages
+
+        # Serve repeat questions from the semantic answer cache when it is enabled for the app
+        cache_settings = answer_cache.resolve_settings(settings)
+        use_cache = cache_settings["enabled"] and not (cache_settings["only_fresh_sessions"] and history_messages)
+        result, query_vector = None, None
+        if use_cache:
+            result, query_vector = answer_cache.lookup(
+                in_params["app_name"], in_params["query"], settings.get("settings_version"), cache_settings
+            )
+
+        if result is None:
+            # Identical tool calls made by different agents during this run are executed only once
+            with request_scope():
+                result = app.invoke(
+                    {
+                        "messages": [
+                            HumanMessage(content=in_params["query"])
+                        ],
+                        "chat_history": history_messages
+                    },
+                    config={"callbacks": debug_callbacks()} if debug else None
+                )
+            if use_cache:
+                answer_cache.store(
+                    in_params["app_name"], in_params["query"], settings.get("settings_version"), result,
+                    cache_settings, query_vector=query_vector
+                )
 
         # Log the successful execution of the driver function
         logger.info("Driver function executed successfully.")
@@ -0,0 +1,100 @@
+import hashlib
+import re
+
+import numpy as np
+from custom_logger import logger
+from langchain_core.embeddings import Embeddings
+
+from cache_store import TTLCache
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalizes a query so that trivially different spellings share a cache entry.
+
+    Args:
+        text (str): The raw query text.
+
+    Returns:
+        normalized (str): The case-folded query with collapsed whitespace.
+    """
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Embeddings wrapper caching query vectors in an in-process LRU, backed by an optional Redis tier
+    shared across workers. Document embeddings are passed through untouched.
+    """
+
+    def __init__(self, embedding: Embeddings, model_name: str, max_size: int = 2048, ttl: float | None = None,
+                 redis_client=None, redis_ttl: int | None = 86400) -> None:
+        """
+        Initializes the CachedQueryEmbeddings wrapper.
+
+        Args:
+            embedding (Embeddings): The embeddings client computing vectors on a miss.
+            model_name (str): Name of the embedding model, part of every cache key.
+            max_size (int): Maximum number of vectors kept in process.
+            ttl (float | None): Time-to-live of in-process entries in seconds.
+            redis_client (redis.Redis | None): Optional client for the shared tier.
+            redis_ttl (int | None): Time-to-live of shared entries in seconds.
+
+        Returns:
+            None
+        """
+        self.embedding = embedding
+        self.model_name = model_name
+        self.cache = TTLCache(max_size=max_size, ttl=ttl)
+        self.redis_client = redis_client
+        self.redis_ttl = redis_ttl
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embedding.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        """
+        Returns the query vector from the cache, computing and storing it on a miss.
+
+        Args:
+            text (str): The query text.
+
+        Returns:
+            vector (list[float]): The query embedding.
+        """
+        key = self._key(text)
+        vector = self.cache.get(key)
+        if vector is not None:
+            return vector
+
+        vector = self._redis_get(key)
+        if vector is None:
+            vector = self.embedding.embed_query(text)
+            self._redis_set(key, vector)
+        self.cache.set(key, vector)
+        return vector
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha256(normalize_query(text).encode()).hexdigest()
+        return f"query_embedding:{self.model_name}:{digest}"
+
+    def _redis_get(self, key: str) -> list[float] | None:
+        if self.redis_client is None:
+            return None
+        try:
+            payload = self.redis_client.get(key)
+            return np.frombuffer(payload, dtype=np.float32).tolist() if payload else None
+        except Exception as e:
+            logger.warning(f"Shared embedding cache read failed: {e}")
+            return None
+
+    def _redis_set(self, key: str, vector: list[float]) -> None:
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.set(key, np.asarray(vector, dtype=np.float32).tobytes(), ex=self.redis_ttl)
+        except Exception as e:
+            logger.warning(f"Shared embedding cache write failed: {e}")
@@ -0,0 +1,170 @@
+import threading
+import time
+from typing import Any, Callable
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler, StdOutCallbackHandler, StreamingStdOutCallbackHandler
+from langchain_core.outputs import LLMResult
+
+
+class MetricsRegistry:
+    """
+    Process-wide registry of metric sources, exposed together through a single snapshot.
+    """
+
+    def __init__(self) -> None:
+        self._sources: dict[str, Callable[[], dict]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, source: Callable[[], dict]) -> None:
+        """
+        Registers a callable returning a dictionary of metrics under the given name.
+
+        Args:
+            name (str): The name the metrics are reported under.
+            source (Callable[[], dict]): Callable producing the current metric values.
+        """
+        with self._lock:
+            self._sources[name] = source
+
+    def snapshot(self) -> dict:
+        """
+        Collects the current values of every registered metric source.
+
+        Returns:
+            dict: Metric values keyed by source name.
+        """
+        with self._lock:
+            sources = dict(self._sources)
+        return {name: source() for name, source in sources.items()}
+
+
+class LLMMetrics:
+    """
+    Thread-safe in-memory counters for language model calls, aggregated per model name.
+    """
+
+    def __init__(self) -> None:
+        self._counters: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_name: str, latency: float, ttft: float | None, prompt_tokens: int,
+               completion_tokens: int, error: bool = False) -> None:
+        """
+        Records a finished model call.
+
+        Args:
+            model_name (str): The name of the model that served the call.
+            latency (float): Wall-clock duration of the call in seconds.
+            ttft (float | None): Time to first streamed token in seconds, if the call streamed.
+            prompt_tokens (int): Number of prompt tokens reported for the call.
+            completion_tokens (int): Number of completion tokens reported or streamed for the call.
+            error (bool): Whether the call ended with an error.
+        """
+        with self._lock:
+            counters = self._counters.setdefault(model_name, {
+                "calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "latency_total": 0.0, "latency_max": 0.0, "ttft_total": 0.0, "ttft_count": 0,
+            })
+            counters["calls"] += 1
+            counters["errors"] += int(error)
+            counters["prompt_tokens"] += prompt_tokens
+            counters["completion_tokens"] += completion_tokens
+            counters["latency_total"] += latency
+            counters["latency_max"] = max(counters["latency_max"], latency)
+            if ttft is not None:
+                counters["ttft_total"] += ttft
+                counters["ttft_count"] += 1
+
+    def snapshot(self) -> dict:
+        """
+        Returns the counters per model together with derived averages.
+
+        Returns:
+            dict: Metrics keyed by model name.
+        """
+        with self._lock:
+            counters = {name: dict(values) for name, values in self._counters.items()}
+        for values in counters.values():
+            values["latency_avg"] = values["latency_total"] / values["calls"] if values["calls"] else 0.0
+            values["ttft_avg"] = values["ttft_total"] / values["ttft_count"] if values["ttft_count"] else None
+        return counters
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Callback handler aggregating token counts, time to first token and latency of model calls.
+    It only touches in-memory counters, so it is cheap enough to stay attached in production.
+    """
+
+    def __init__(self, metrics: LLMMetrics) -> None:
+        self.metrics = metrics
+        self._runs: dict[UUID, dict] = {}
+
+    def on_llm_start(self, serialized: dict, prompts: list[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._start_run(serialized, run_id)
+
+    def on_chat_model_start(self, serialized: dict, messages: list, *, run_id: UUID, **kwargs: Any) -> None:
+        self._start_run(serialized, run_id)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.get(run_id)
+        # OpenAI streams an empty first chunk (the role) and an empty last chunk (the finish reason)
+        if run is None or not token:
+            return
+        if run["first_token_at"] is None:
+            run["first_token_at"] = time.perf_counter()
+        run["streamed_tokens"] += 1
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        self._finish_run(
+            run,
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", run["streamed_tokens"]),
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            self._finish_run(run, prompt_tokens=0, completion_tokens=run["streamed_tokens"], error=True)
+
+    def _start_run(self, serialized: dict, run_id: UUID) -> None:
+        model_name = (serialized or {}).get("kwargs", {}).get("model_name", "unknown")
+        self._runs[run_id] = {
+            "model_name": model_name,
+            "started_at": time.perf_counter(),
+            "first_token_at": None,
+            "streamed_tokens": 0,
+        }
+
+    def _finish_run(self, run: dict, prompt_tokens: int, completion_tokens: int, error: bool = False) -> None:
+        ttft = run["first_token_at"] - run["started_at"] if run["first_token_at"] is not None else None
+        self.metrics.record(
+            model_name=run["model_name"],
+            latency=time.perf_counter() - run["started_at"],
+            ttft=ttft,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            error=error,
+        )
+
+
+def debug_callbacks() -> list[BaseCallbackHandler]:
+    """
+    Builds the verbose tracing handlers attached to a single request when debugging is requested.
+
+    Returns:
+        list[BaseCallbackHandler]: Handlers printing chain traces and streamed tokens to stdout.
+    """
+    return [StdOutCallbackHandler(), StreamingStdOutCallbackHandler()]
+
+
+# Process-wide metrics shared by every model and subsystem
+metrics_registry = MetricsRegistry()
+llm_metrics = LLMMetrics()
+metrics_callback = MetricsCallbackHandler(llm_metrics)
+metrics_registry.register("llm", llm_metrics.snapshot)
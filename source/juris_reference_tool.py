@@ -1,8 +1,21 @@
+import asyncio
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from custom_logger import logger
+from langchain_core.documents import Document
+
+from context_packer import pack_context
 from web_search_tool import WebSearchTool
 from kb_search import KBSearchTool
 from custom_chains import chain_handler
 
+# Shared pool running the web and Knowledge Base branches of a lookup side by side
+branch_executor = ThreadPoolExecutor(max_workers=int(os.getenv("JURIS_BRANCH_WORKERS", "8")),
+                                     thread_name_prefix="juris-branch")
+
 
 class JurisReferenceTool:
     def __init__(self, settings: dict) -> None:
@@ -19,11 +32,14 @@ class JurisReferenceTool:
         self.web_search_tool = WebSearchTool(settings["wb_tool"])
         self.juris_chain = chain_handler.create_chain(prompt_id=self.settings.get("prompt_id"))
         self.kb = KBSearchTool(settings["kb_search_tool"])
+        self.web_timeout = self.settings.get("web_timeout", 20)
+        self.kb_timeout = self.settings.get("kb_timeout", 30)
         logger.debug("JurisReferenceTool initialized with settings.")
 
     def juris_tool(self, query: str) -> str:
         """
-        Executes the JurisReferenceTool.
+        Executes the JurisReferenceTool. The web and Knowledge Base searches run concurrently, each bounded by
+        its own timeout; a failed or timed out branch is left out of the results.
 
         Args:
             query (str): The query to be used for the JurisReferenceTool Search.
@@ -32,8 +48,74 @@ class JurisReferenceTool:
             results (str): The results of the JurisReferenceTool.
         """
         logger.info(f"Executing Juris Reference search for query: {query}")
-        wb_results = self.web_search_tool.wb_tool(query)
-        kb_results = self.kb.kb_tool(query)
-        results = self.juris_chain.invoke({"input": query, "documents": (wb_results, kb_results)})
+        started = time.monotonic()
+        web_future = branch_executor.submit(contextvars.copy_context().run, self.web_search_tool.wb_tool, query)
+        kb_future = branch_executor.submit(contextvars.copy_context().run, self.kb.kb_tool, query)
+
+        branches = {}
+        for name, future, timeout in (("web", web_future, self.web_timeout), ("kb", kb_future, self.kb_timeout)):
+            try:
+                branches[name] = future.result(timeout=max(timeout - (time.monotonic() - started), 0))
+            except Exception as e:
+                future.cancel()
+                logger.warning(f"Juris Reference {name} branch failed or timed out: {e!r}")
+                branches[name] = None
+
+        results = self.juris_chain.invoke({"input": query, "documents": self._build_documents(branches)})
         logger.info("Juris Reference search and chain processing completed.")
         return results
+
+    async def ajuris_tool(self, query: str) -> str:
+        """
+        Executes the JurisReferenceTool asynchronously, gathering the web and Knowledge Base branches.
+
+        Args:
+            query (str): The query to be used for the JurisReferenceTool Search.
+
+        Returns:
+            results (str): The results of the JurisReferenceTool.
+        """
+        logger.info(f"Executing async Juris Reference search for query: {query}")
+        outcomes = await asyncio.gather(
+            asyncio.wait_for(asyncio.to_thread(self.web_search_tool.wb_tool, query), self.web_timeout),
+            asyncio.wait_for(asyncio.to_thread(self.kb.kb_tool, query), self.kb_timeout),
+            return_exceptions=True
+        )
+
+        branches = {}
+        for name, outcome in zip(("web", "kb"), outcomes):
+            if isinstance(outcome, BaseException):
+                logger.warning(f"Juris Reference {name} branch failed or timed out: {outcome!r}")
+                outcome = None
+            branches[name] = outcome
+
+        results = await self.juris_chain.ainvoke({"input": query, "documents": self._build_documents(branches)})
+        logger.info("Async Juris Reference search and chain processing completed.")
+        return results
+
+    def _build_documents(self, branches: dict) -> str:
+        """
+        Packs the branch results that completed into the prompt context.
+
+        Args:
+            branches (dict): The web result tuple and Knowledge Base summary, None for a failed branch.
+
+        Returns:
+            documents (str): The packed context.
+        """
+        wb_text, wb_urls = branches["web"] or ("", [])
+        kb_results = branches["kb"] or ""
+        documents = pack_context(
+            [
+                Document(page_content=kb_results, metadata={"source": "knowledge_base"}),
+                Document(page_content=wb_text, metadata={"source": "web", "urls": wb_urls}),
+            ],
+            budget_tokens=self.settings.get("context_budget_tokens", 3000),
+            dedup_threshold=self.settings.get("dedup_threshold", 0.9)
+        )
+        if wb_urls:
+            documents += "\n\nWeb references: " + ", ".join(wb_urls)
+        missing = [name for name, value in branches.items() if value is None]
+        if missing:
+            documents += f"\n\nNote: the {' and '.join(missing)} search did not return in time; results are partial."
+        return documents
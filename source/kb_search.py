@@ -1,35 +1,146 @@
+import contextvars
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
 from custom_logger import logger
+from langchain_core.pydantic_v1 import BaseModel, Field
 
+from context_packer import pack_context
 from custom_chains import chain_handler
-from utils import setup_es_vector_store
+from retrieval_cache import index_generations, retrieval_cache
+from utils import setup_vector_store
 
+# Shared pool for querying the indexes of a federated search concurrently
+search_executor = ThreadPoolExecutor(max_workers=int(os.getenv("KB_SEARCH_WORKERS", "8")),
+                                     thread_name_prefix="kb-search")
 
-def fetch_kb_results(query: str, settings: dict) -> list[Any]:
+
+def build_es_filters(filters: dict | None) -> list[dict]:
+    """
+    Converts metadata filters into Elasticsearch filter clauses.
+
+    Args:
+        filters (dict | None): Metadata values keyed by field name, where list values match any element.
+
+    Returns:
+        clauses (list[dict]): The Elasticsearch filter clauses.
+    """
+    if not filters:
+        return []
+    clauses = []
+    for field, value in filters.items():
+        values = value if isinstance(value, list) else [value]
+        # Strings are matched exactly against the keyword sub-field created by dynamic mapping
+        path = f"metadata.{field}.keyword" if all(isinstance(item, str) for item in values) else f"metadata.{field}"
+        clauses.append({"terms": {path: values}})
+    return clauses
+
+
+def fetch_kb_results(query: str, settings: dict, filters: dict | None = None) -> list[Any]:
     """
     Fetches Knowledge Base search results based on the provided query and settings.
 
     Args:
         query (str): The query to be used for the search.
-        settings (dict): The settings to be used for the search.
+        settings (dict): The settings to be used for the search. Optional tunables are "filters",
+            "num_candidates" and "rrf" (e.g. {"rank_constant": 60, "window_size": 100}).
+        filters (dict | None): Metadata pre-filters from the tool input, overriding the settings' filters.
 
     Returns:
         results (str): The results of the Knowledge Base search.
     """
     logger.info(f"Fetching Knowledge Base search results for query: {query}")
+    if settings.get("indexes"):
+        return fetch_federated_kb_results(query, settings, filters)
+
+    index_name = settings["index_name"]
+    k = settings.get("k", 5)
+    backend = settings.get("backend", "elasticsearch")
+    filters = {**(settings.get("filters") or {}), **(filters or {})}
+    num_candidates = settings.get("num_candidates", 50)
+    rrf = settings.get("rrf", True)
+    params = json.dumps({"backend": backend, "filters": filters, "num_candidates": num_candidates, "rrf": rrf},
+                        sort_keys=True)
+
+    use_cache = settings.get("cache_results", True)
+    if use_cache:
+        cached = retrieval_cache.get(index_name, query, k, params)
+        if cached is not None:
+            logger.info("Knowledge Base search results served from the retrieval cache.")
+            return cached
 
     try:
-        es_vs = setup_es_vector_store(settings["index_name"])
-        results = es_vs.similarity_search(query=query, k=settings.get("k", 5))
+        # Read the generation before searching so results racing an ingestion are never cached as fresh
+        generation = index_generations.get(index_name)
+        vector_store = setup_vector_store(index_name, backend=backend, rrf=rrf)
+        results = vector_store.similarity_search(
+            query=query,
+            k=k,
+            fetch_k=max(num_candidates, k),
+            filter=filters if backend == "local" else build_es_filters(filters)
+        )
         logger.info("Knowledge Base search results fetched successfully.")
+        if use_cache:
+            retrieval_cache.set(index_name, query, k, results, params=params, generation=generation)
     except Exception as e:
         logger.info(f"Error fetching Knowledge Base search results: {e}")
         results = []
     return results
 
 
+def fetch_federated_kb_results(query: str, settings: dict, filters: dict | None = None) -> list[Any]:
+    """
+    Queries several Knowledge Base indexes concurrently and merges their results with weighted
+    reciprocal rank fusion.
+
+    Args:
+        query (str): The query to be used for the search.
+        settings (dict): The settings to be used for the search. "indexes" lists per-index settings
+            with "index_name" and optional "k", "weight" and "backend"; other keys apply to every index.
+        filters (dict | None): Metadata pre-filters from the tool input, applied to every index.
+
+    Returns:
+        results (list[Any]): The fused results, best first.
+    """
+    shared_settings = {key: value for key, value in settings.items() if key != "indexes"}
+    index_settings = [{**shared_settings, **index} for index in settings["indexes"]]
+    futures = [
+        search_executor.submit(contextvars.copy_context().run, fetch_kb_results, query, index, filters)
+        for index in index_settings
+    ]
+
+    rank_constant = settings.get("rank_constant", 60)
+    scores: dict[str, float] = defaultdict(float)
+    documents: dict[str, Any] = {}
+    for index, future in zip(index_settings, futures):
+        weight = index.get("weight", 1.0)
+        for rank, document in enumerate(future.result()):
+            key = document.page_content
+            documents.setdefault(key, document)
+            scores[key] += weight / (rank_constant + rank + 1)
+
+    k = settings.get("k", sum(index.get("k", 5) for index in index_settings))
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    logger.info(f"Fused results from {len(index_settings)} Knowledge Base indexes.")
+    return [documents[key] for key in ranked]
+
+
+class KBSearchInput(BaseModel):
+    query: str = Field(description="The search query.")
+    filters: dict | None = Field(
+        default=None,
+        description="Optional metadata filters keyed by field, e.g. {\"source\": \"statutes\"}; "
+                    "a list value matches any of its elements."
+    )
+
+
 class KBSearchTool:
+    # Lets the agent pass metadata filters along with the query
+    args_schema = KBSearchInput
+
     def __init__(self, settings: dict) -> None:
         """
         Initializes the Knowledge Base Search with the provided settings.
@@ -44,20 +155,26 @@ class KBSearchTool:
         self.kb_chain = chain_handler.create_chain(prompt_id=self.settings.get("prompt_id"))
         logger.debug("Initializing with settings.")
 
-    def kb_tool(self, query: str) -> str:
+    def kb_tool(self, query: str, filters: dict | None = None) -> str:
         """
         Executes the web search tool.
 
         Args:
             query (str): The query to be used for the search.
+            filters (dict | None): Metadata pre-filters such as source, document type or jurisdiction.
 
         Returns:
             results (str): The results of the web search.
         """
         logger.info(f"Executing Knowledge Base search for query: {query}")
         try:
-            raw_kb_search = fetch_kb_results(query, self.settings)
-            results = self.kb_chain.invoke({"query": query, "documents": raw_kb_search}).content
+            raw_kb_search = fetch_kb_results(query, self.settings, filters)
+            documents = pack_context(
+                raw_kb_search,
+                budget_tokens=self.settings.get("context_budget_tokens", 3000),
+                dedup_threshold=self.settings.get("dedup_threshold", 0.9)
+            )
+            results = self.kb_chain.invoke({"query": query, "documents": documents}).content
             logger.info("Knowledge Base Search and chain processing completed.")
 
         except Exception as e:
@@ -0,0 +1,371 @@
+import fcntl
+import json
+import math
+import os
+import re
+import threading
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+from custom_logger import logger
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+# Rows scored per block, bounding the temporary memory of a scan over large matrices
+SCAN_BLOCK_ROWS = 65536
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def _tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def _value_key(value: Any) -> Any:
+    # Metadata values are matched by equality; unhashable values are keyed by their JSON form
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return json.dumps(value, sort_keys=True)
+
+
+class BM25Index:
+    """
+    In-memory Okapi BM25 index over the documents of a local vector store. Postings are kept as numpy arrays
+    and the length normalization of every row is computed once per change, so a query costs one vectorized
+    update per query term.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, tuple[list[int], list[int]]] = defaultdict(lambda: ([], []))
+        self.doc_lengths: list[int] = []
+        self.total_length = 0
+        self._arrays: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self._norms: np.ndarray | None = None
+
+    def add(self, text: str) -> None:
+        """
+        Indexes the next document; documents are identified by their insertion position.
+
+        Args:
+            text (str): The document text.
+        """
+        row = len(self.doc_lengths)
+        tokens = _tokenize(text)
+        for token, frequency in Counter(tokens).items():
+            rows, frequencies = self.postings[token]
+            rows.append(row)
+            frequencies.append(frequency)
+            self._arrays.pop(token, None)
+        self.doc_lengths.append(len(tokens))
+        self.total_length += len(tokens)
+        self._norms = None
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        Scores every document against the query.
+
+        Args:
+            query (str): The query text.
+
+        Returns:
+            np.ndarray: BM25 score of every document row; rows without a query term score 0.
+        """
+        count = len(self.doc_lengths)
+        scores = np.zeros(count, dtype=np.float32)
+        if not count:
+            return scores
+        if self._norms is None:
+            lengths = np.asarray(self.doc_lengths, dtype=np.float32)
+            self._norms = self.k1 * (1 - self.b + self.b * lengths / (self.total_length / count))
+        for token in set(_tokenize(query)):
+            if token not in self.postings:
+                continue
+            if token not in self._arrays:
+                rows, frequencies = self.postings[token]
+                self._arrays[token] = (np.asarray(rows, dtype=np.int64), np.asarray(frequencies, dtype=np.float32))
+            rows, frequencies = self._arrays[token]
+            idf = math.log(1 + (count - len(rows) + 0.5) / (len(rows) + 0.5))
+            scores[rows] += idf * frequencies * (self.k1 + 1) / (frequencies + self._norms[rows])
+        return scores
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Embedded vector store keeping normalized vectors in a memory-mapped float32 matrix with a JSON lines
+    sidecar for texts and metadata. Searches combine cosine top-k with BM25 through reciprocal rank fusion.
+
+    Writers hold an exclusive lock on the index directory, first catch up with rows appended by other
+    processes and then append the documents before their vectors. A crash between or during the two writes
+    leaves documents without a complete vector; the next load or write truncates both files to the rows
+    present in both.
+    """
+
+    def __init__(self, index_name: str, embedding: Embeddings, directory: str, rank_constant: int = 60) -> None:
+        """
+        Initializes the LocalVectorStore, loading any existing index files.
+
+        Args:
+            index_name (str): The name of the index, used as its directory name.
+            embedding (Embeddings): The embeddings client for documents and queries.
+            directory (str): Root directory holding the local indexes.
+            rank_constant (int): Rank constant of the reciprocal rank fusion.
+
+        Returns:
+            None
+        """
+        self.index_name = index_name
+        self.embedding = embedding
+        self.rank_constant = rank_constant
+        self.path = os.path.join(directory, index_name)
+        self._vectors_path = os.path.join(self.path, "vectors.f32")
+        self._docs_path = os.path.join(self.path, "docs.jsonl")
+        self._meta_path = os.path.join(self.path, "meta.json")
+        self._lock_path = os.path.join(self.path, "write.lock")
+        self._lock = threading.RLock()
+        self._matrix: np.memmap | None = None
+        self._docs_offset = 0
+        self.dim: int | None = None
+        self.docs: list[dict] = []
+        self.ids: set[str] = set()
+        self.bm25 = BM25Index()
+        self.metadata_index: dict[str, dict[Any, list[int]]] = defaultdict(lambda: defaultdict(list))
+        self._load()
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        """
+        Embeds texts and appends them to the index.
+
+        Args:
+            texts (Iterable[str]): The texts to add.
+            metadatas (Optional[List[dict]]): Metadata for each text.
+            ids (Optional[List[str]]): IDs for each text; generated when omitted.
+
+        Returns:
+            List[str]: The IDs of the added texts.
+        """
+        texts = list(texts)
+        return self.add_embeddings(zip(texts, self.embedding.embed_documents(texts)), metadatas=metadatas, ids=ids)
+
+    def add_embeddings(self, text_embeddings: Iterable[Tuple[str, List[float]]],
+                       metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None,
+                       **kwargs: Any) -> List[str]:
+        """
+        Appends precomputed embeddings and their texts to the index.
+
+        Args:
+            text_embeddings (Iterable[Tuple[str, List[float]]]): Pairs of text and embedding.
+            metadatas (Optional[List[dict]]): Metadata for each text.
+            ids (Optional[List[str]]): IDs for each text; generated when omitted.
+
+        Returns:
+            List[str]: The IDs of the added texts. Texts whose ID is already stored, or repeated within the
+                call, are skipped and their IDs left out.
+        """
+        text_embeddings = list(text_embeddings)
+        if not text_embeddings:
+            return []
+        texts = [text for text, _ in text_embeddings]
+        vectors = np.asarray([vector for _, vector in text_embeddings], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock, self._file_lock():
+            self._sync()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self._meta_path, "w") as file:
+                    json.dump({"dim": self.dim}, file)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.dim}.")
+
+            # An ID is stored once; unlike Elasticsearch, which overwrites, the document already present is kept
+            new, seen = [], set(self.ids)
+            for row, doc_id in enumerate(ids):
+                if doc_id not in seen:
+                    seen.add(doc_id)
+                    new.append(row)
+            docs = [{"id": ids[row], "text": texts[row], "metadata": metadatas[row]} for row in new]
+            data = "".join(json.dumps(doc) + "\n" for doc in docs).encode()
+            with open(self._docs_path, "ab") as file:
+                file.write(data)
+            with open(self._vectors_path, "ab") as file:
+                file.write(vectors[new].tobytes())
+            self._docs_offset += len(data)
+            for doc in docs:
+                self._index(doc)
+            # Remap lazily so the next search sees the appended rows
+            self._matrix = None
+        logger.debug(f"Added {len(new)} documents to local index '{self.index_name}'.")
+        return [ids[row] for row in new]
+
+    def existing_ids(self, ids: List[str]) -> set:
+        """
+        Returns the given IDs that are already stored in the index.
+        """
+        with self._lock:
+            return {doc_id for doc_id in ids if doc_id in self.ids}
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None, hybrid: bool = True,
+                          fetch_k: int = 50, **kwargs: Any) -> List[Document]:
+        """
+        Returns the documents most relevant to the query.
+
+        Args:
+            query (str): The query text.
+            k (int): Number of documents to return.
+            filter (Optional[dict]): Metadata values the documents must match; list values match any element.
+            hybrid (bool): Whether to fuse the vector ranking with a BM25 ranking.
+            fetch_k (int): Number of candidates taken from each ranking before fusion.
+
+        Returns:
+            List[Document]: The most relevant documents, best first.
+        """
+        vector = np.asarray(self.embedding.embed_query(query), dtype=np.float32)
+        with self._lock:
+            allowed = self._filter_rows(filter)
+            vector_rows = self._vector_top_k(vector, max(k, fetch_k), allowed)
+            if not hybrid:
+                return [self._to_document(row) for row in vector_rows[:k]]
+            text_scores = self.bm25.scores(query)
+            candidates = np.flatnonzero(text_scores)
+            if allowed is not None:
+                candidates = np.intersect1d(candidates, allowed, assume_unique=True)
+            text_rows = candidates[np.argsort(-text_scores[candidates], kind="stable")[:max(k, fetch_k)]].tolist()
+            fused: dict[int, float] = defaultdict(float)
+            for ranking in (vector_rows, text_rows):
+                for rank, row in enumerate(ranking):
+                    fused[row] += 1.0 / (self.rank_constant + rank + 1)
+            best = sorted(fused, key=fused.get, reverse=True)[:k]
+            return [self._to_document(row) for row in best]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[dict] = None,
+                                    **kwargs: Any) -> List[Document]:
+        with self._lock:
+            rows = self._vector_top_k(np.asarray(embedding, dtype=np.float32), k, self._filter_rows(filter))
+            return [self._to_document(row) for row in rows]
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   index_name: str = "default", directory: str = "local_indexes", **kwargs: Any) -> "LocalVectorStore":
+        store = cls(index_name=index_name, embedding=embedding, directory=directory)
+        store.add_texts(texts, metadatas=metadatas, ids=kwargs.get("ids"))
+        return store
+
+    def _load(self) -> None:
+        """
+        Loads the sidecar documents and rebuilds the BM25 and metadata indexes from them.
+        """
+        if os.path.isdir(self.path):
+            with self._lock, self._file_lock():
+                self._sync()
+        logger.info(f"Local index '{self.index_name}' loaded with {len(self.docs)} documents.")
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        Holds the exclusive lock of the index directory, serializing writers across processes.
+        """
+        with open(self._lock_path, "a") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            yield
+
+    def _sync(self) -> None:
+        """
+        Indexes the documents appended since the last sync, up to the number of complete vector rows, and
+        truncates documents and vectors left by an interrupted write. Called with the file lock held.
+        """
+        if self.dim is None and os.path.exists(self._meta_path):
+            with open(self._meta_path) as file:
+                self.dim = json.load(file)["dim"]
+        if self.dim is None or not os.path.exists(self._docs_path):
+            return
+        with open(self._docs_path, "rb") as file:
+            file.seek(self._docs_offset)
+            lines = file.read().split(b"\n")
+        row_bytes = self.dim * np.dtype(np.float32).itemsize
+        rows = os.path.getsize(self._vectors_path) // row_bytes if os.path.exists(self._vectors_path) else 0
+
+        # The last element is empty unless a write was torn mid-line
+        complete = lines[:-1][:max(0, rows - len(self.docs))]
+        for line in complete:
+            self._docs_offset += len(line) + 1
+            self._index(json.loads(line))
+        if os.path.getsize(self._docs_path) > self._docs_offset:
+            logger.warning(f"Truncating documents without vectors in local index '{self.index_name}'.")
+            os.truncate(self._docs_path, self._docs_offset)
+        if os.path.exists(self._vectors_path) and os.path.getsize(self._vectors_path) > len(self.docs) * row_bytes:
+            logger.warning(f"Truncating vectors without documents in local index '{self.index_name}'.")
+            os.truncate(self._vectors_path, len(self.docs) * row_bytes)
+        self._matrix = None
+
+    def _index(self, doc: dict) -> None:
+        row = len(self.docs)
+        self.docs.append(doc)
+        self.ids.add(doc["id"])
+        self.bm25.add(doc["text"])
+        for key, value in doc["metadata"].items():
+            self.metadata_index[key][_value_key(value)].append(row)
+
+    def _matrix_view(self) -> np.ndarray | None:
+        if self._matrix is None and self.docs:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(len(self.docs), self.dim))
+        return self._matrix
+
+    def _vector_top_k(self, vector: np.ndarray, k: int, allowed: np.ndarray | None) -> list[int]:
+        """
+        Scans the matrix block by block and returns the rows with the highest cosine similarity.
+        """
+        matrix = self._matrix_view()
+        if matrix is None:
+            return []
+        vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+        rows = np.arange(len(self.docs)) if allowed is None else allowed
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, len(rows), SCAN_BLOCK_ROWS):
+            block = rows[start:start + SCAN_BLOCK_ROWS]
+            scores = matrix[block] @ vector
+            best_rows = np.concatenate([best_rows, block])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_rows) > k:
+                keep = np.argpartition(-best_scores, k)[:k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+        order = np.argsort(-best_scores)
+        return best_rows[order].tolist()
+
+    def _filter_rows(self, filter: Optional[dict]) -> np.ndarray | None:
+        """
+        Returns the sorted rows matching every filter key, looked up in the metadata index.
+        """
+        if not filter:
+            return None
+        allowed = None
+        for key, values in filter.items():
+            values = values if isinstance(values, list) else [values]
+            index = self.metadata_index.get(key, {})
+            matches = [np.asarray(index.get(_value_key(value), []), dtype=np.int64) for value in values]
+            if None in values:
+                # A document without the key matches None, like metadata.get(key) does
+                present = np.concatenate([np.asarray(rows, dtype=np.int64) for rows in index.values()] or [[]])
+                matches.append(np.setdiff1d(np.arange(len(self.docs)), present))
+            rows = np.unique(np.concatenate(matches or [np.empty(0, dtype=np.int64)]))
+            allowed = rows if allowed is None else np.intersect1d(allowed, rows, assume_unique=True)
+        return allowed.astype(np.int64)
+
+    def _to_document(self, row: int) -> Document:
+        doc = self.docs[row]
+        return Document(page_content=doc["text"], metadata=doc["metadata"])
@@ -1,9 +1,21 @@
+import os
 from typing import List, Callable
 
 from custom_logger import logger
+from elasticsearch import ConnectionError as ESConnectionError, ConnectionTimeout, helpers
 
+from cache_store import TTLCache
+from instrumentation import metrics_registry
+from memory_write_buffer import get_write_buffer
 from utils import setup_es_vector_store
 
+# Index mapping properties per index; the TTL bounds how long a mapping changed by another process stays stale
+mapping_cache = TTLCache(max_size=256, ttl=float(os.getenv("ES_MAPPING_CACHE_TTL", "60")))
+metrics_registry.register("es_mapping_cache", mapping_cache.stats)
+
+# Statuses of writes rejected under back-pressure or by an unavailable node, which succeed when sent again
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+
 
 class ElasticsearchIndexManager:
     """
@@ -13,15 +25,25 @@ class ElasticsearchIndexManager:
 
     def __init__(self, es_store) -> None:
         self.es_store = es_store
+        self.client = getattr(es_store, "client", es_store)
+
+    def get_properties(self, index_name: str) -> dict:
+        """
+        Returns the mapped properties of an index, served from the in-process mapping cache when fresh.
+        """
+        properties = mapping_cache.get(index_name)
+        if properties is None:
+            current_mapping = self.client.indices.get_mapping(index=index_name).body
+            properties = current_mapping.get(index_name, {}).get('mappings', {}).get('properties', {})
+            mapping_cache.set(index_name, properties)
+        return properties
 
     def field_exists_in_index(self, index_name: str, field_name: str) -> bool:
         """
         Checks if a given field exists in the index mapping.
         """
         try:
-            current_mapping = self.es_store.get_mapping(index_name=index_name)
-            properties = current_mapping.get(index_name, {}).get('mappings', {}).get('properties', {})
-            return field_name in properties
+            return field_name in self.get_properties(index_name)
         except Exception as e:
             logger.error(f"Error checking field existence in index: {e}", exc_info=True)
             return False
@@ -31,14 +53,16 @@ class ElasticsearchIndexManager:
         Updates the index schema by adding a new field to the mapping.
         """
         try:
-            body = {
-                "properties": {
-                    field_name: {
-                        "type": field_type
-                    }
+            properties = {
+                field_name: {
+                    "type": field_type
                 }
             }
-            self.es_store.put_mapping(index_name=index_name, body=body)
+            try:
+                self.client.indices.put_mapping(index=index_name, properties=properties)
+            finally:
+                # The mapping may have changed even when the request failed midway
+                mapping_cache.pop(index_name)
             logger.info(f"Schema updated: added field '{field_name}' to '{index_name}'")
             return True
         except Exception as e:
@@ -48,22 +72,29 @@ class ElasticsearchIndexManager:
 
 class ElasticsearchMemoryActions:
     """
-    Performs requested actions (insert, delete, add, append, delete bulk, insert bulk)
-    against an Elasticsearch index.
+    Performs requested actions (insert, delete, add, append, delete bulk, insert bulk, read)
+    against an Elasticsearch index. Inserts go through the bulk helpers and deletes combine
+    their items into one boolean query per batch.
     """
 
-    def __init__(self, es_store) -> None:
+    def __init__(self, es_store, settings: dict | None = None) -> None:
+        settings = settings or {}
         self.es_store = es_store
+        self.client = getattr(es_store, "client", es_store)
+        self.chunk_size = settings.get("bulk_chunk_size", 500)
+        self.bulk_threads = settings.get("bulk_threads", 1)
+        # Deletes are matched with one should clause per item, bounded by the cluster's max clause count
+        self.delete_batch_size = settings.get("delete_batch_size", 500)
+        # True, False or "wait_for"; delete_by_query only supports True or False
+        self.refresh = settings.get("refresh", False)
+        self.read_size = settings.get("read_size", 100)
 
     def insert(self, index_name: str, field_name: str, items: List[str]) -> str:
         """
         Inserts new items (each as a separate document) into the index.
         """
         try:
-            for item in items:
-                doc = {field_name: item}
-                self.es_store.index_document(index_name=index_name, body=doc)
-            return "Insert operation completed."
+            return self._report("Insert", self.index_items(index_name, field_name, items))
         except Exception as e:
             logger.error(f"Error inserting items: {e}", exc_info=True)
             return "Error inserting items."
@@ -73,11 +104,7 @@ class ElasticsearchMemoryActions:
         Deletes items from the index that match the specified field/value criteria.
         """
         try:
-            # Optional optimization: batch multiple items into a single boolean query
-            for item in items:
-                query = {"query": {"match": {field_name: item}}}
-                self.es_store.delete_by_query(index_name=index_name, body=query)
-            return "Delete operation completed."
+            return self._report("Delete", self.delete_items(index_name, field_name, items))
         except Exception as e:
             logger.error(f"Error deleting items: {e}", exc_info=True)
             return "Error deleting items."
@@ -96,36 +123,125 @@ class ElasticsearchMemoryActions:
 
     def insert_bulk(self, index_name: str, field_name: str, items: List[str]) -> str:
         """
-        Bulk insert items using a single bulk API call.
+        Bulk insert items in chunks through the bulk API.
         """
         try:
-            docs = [
-                {
-                    "_op_type": "index",
-                    "_index": index_name,
-                    field_name: item
-                }
-                for item in items
-            ]
-            self.es_store.bulk_index(docs)
-            return "Bulk insert operation completed."
+            return self._report("Bulk insert", self.index_items(index_name, field_name, items))
         except Exception as e:
             logger.error(f"Error performing bulk insert: {e}", exc_info=True)
             return "Error performing bulk insert."
 
     def delete_bulk(self, index_name: str, field_name: str, items: List[str]) -> str:
         """
-        Bulk delete items using delete_by_query for each item or combine into one query.
+        Bulk delete items with one delete_by_query per batch of items.
         """
         try:
-            for item in items:
-                query = {"query": {"match": {field_name: item}}}
-                self.es_store.delete_by_query(index_name=index_name, body=query)
-            return "Bulk delete operation completed."
+            return self._report("Bulk delete", self.delete_items(index_name, field_name, items))
         except Exception as e:
             logger.error(f"Error performing bulk delete: {e}", exc_info=True)
             return "Error performing bulk delete."
 
+    def read(self, index_name: str, field_name: str, items: List[str]) -> str:
+        """
+        Reads the stored values of a field, limited to values matching the items when any are given.
+        """
+        try:
+            values = self.read_values(index_name, field_name, items)
+            return "\n".join(values) if values else "No stored items found."
+        except Exception as e:
+            logger.error(f"Error reading items: {e}", exc_info=True)
+            return "Error reading items."
+
+    def read_values(self, index_name: str, field_name: str, items: List[str]) -> List[str]:
+        """
+        Returns the stored values of a field, limited to values matching the items when any are given.
+        """
+        if items:
+            query = {"bool": {"should": [{"match": {field_name: item}} for item in items], "minimum_should_match": 1}}
+        else:
+            query = {"exists": {"field": field_name}}
+        response = self.client.search(index=index_name, query=query, size=self.read_size, source=[field_name]).body
+        return [hit["_source"][field_name] for hit in response["hits"]["hits"] if field_name in hit["_source"]]
+
+    def index_items(self, index_name: str, field_name: str, items: List[str]) -> List[dict]:
+        """
+        Indexes items as separate documents, chunk by chunk, using parallel bulk workers when configured.
+
+        Returns:
+            List[dict]: One result per item with its status and document ID, or the error and whether sending
+                the item again can succeed.
+        """
+        actions = ({"_op_type": "index", "_index": index_name, "_source": {field_name: item}} for item in items)
+        options = {"chunk_size": self.chunk_size, "raise_on_error": False, "raise_on_exception": False,
+                   "refresh": self.refresh}
+        if self.bulk_threads > 1:
+            responses = helpers.parallel_bulk(self.client, actions, thread_count=self.bulk_threads, **options)
+        else:
+            responses = helpers.streaming_bulk(self.client, actions, **options)
+
+        results = []
+        for item, (ok, info) in zip(items, responses):
+            outcome = info.get("index", info)
+            result = {"item": item, "status": "indexed" if ok else "failed", "id": outcome.get("_id")}
+            if not ok:
+                result["error"] = str(outcome.get("error", outcome))
+                result["retryable"] = outcome.get("status") in RETRYABLE_STATUSES
+            results.append(result)
+        return results
+
+    def delete_items(self, index_name: str, field_name: str, items: List[str]) -> List[dict]:
+        """
+        Deletes the documents matching any of the items, with one boolean query per batch of items.
+
+        Returns:
+            List[dict]: One result per batch with its items and the number of deleted documents, or the error and
+                whether sending the batch again can succeed.
+        """
+        results = []
+        for start in range(0, len(items), self.delete_batch_size):
+            batch = items[start:start + self.delete_batch_size]
+            query = {
+                "bool": {
+                    "should": [{"match": {field_name: item}} for item in batch],
+                    "minimum_should_match": 1
+                }
+            }
+            try:
+                response = self.client.delete_by_query(
+                    index=index_name, query=query, conflicts="proceed", refresh=bool(self.refresh)
+                ).body
+                failures = response.get("failures") or []
+                result = {"items": batch, "status": "failed" if failures else "deleted",
+                          "deleted": response.get("deleted", 0)}
+                if failures:
+                    result["error"] = str(failures[0])
+                    result["retryable"] = any(failure.get("status") in RETRYABLE_STATUSES for failure in failures)
+            except Exception as e:
+                logger.error(f"Error deleting batch of {len(batch)} items: {e}", exc_info=True)
+                retryable = (isinstance(e, (ESConnectionError, ConnectionTimeout))
+                             or getattr(e, "status_code", None) in RETRYABLE_STATUSES)
+                result = {"items": batch, "status": "failed", "deleted": 0, "error": str(e), "retryable": retryable}
+            results.append(result)
+        return results
+
+    @staticmethod
+    def _report(operation: str, results: List[dict]) -> str:
+        """
+        Summarizes per-item insert results or per-batch delete results for the agent.
+        """
+        failed = [result for result in results if result["status"] == "failed"]
+        deletes = [result for result in results if "deleted" in result]
+        if deletes:
+            summary = f"{operation} operation completed: {sum(r['deleted'] for r in deletes)} documents deleted."
+        else:
+            summary = f"{operation} operation completed: {len(results) - len(failed)} of {len(results)} items indexed."
+        if failed:
+            summary += " Failed: " + "; ".join(
+                f"{result.get('item', result.get('items'))}: {result['error']}" for result in failed
+            )
+        logger.info(summary)
+        return summary
+
 
 class MemoryTool:
     """
@@ -133,6 +249,9 @@ class MemoryTool:
     functioning as a 'memory' by handling inserts, deletions, and schema updates.
     """
 
+    # Writes must run every time and reads must see them, so calls are never memoized per request
+    memoize = False
+
     def __init__(self, settings: dict) -> None:
         self.settings = settings
         self.prompt_id = self.settings.get("prompt_id")
@@ -143,7 +262,9 @@ class MemoryTool:
 
         # Manager and action classes to keep responsibilities separated.
         self.index_manager = ElasticsearchIndexManager(self.es_store)
-        self.actions = ElasticsearchMemoryActions(self.es_store)
+        self.actions = ElasticsearchMemoryActions(self.es_store, self.settings)
+        # Optional write-behind buffer acknowledging writes before they are indexed
+        self.write_buffer = get_write_buffer(self.actions, self.index_name, self.settings.get("write_behind"))
 
         # Build a dictionary to map action strings to methods, removing large if/else blocks.
         self.action_map = {
@@ -152,8 +273,13 @@ class MemoryTool:
             "add": self.actions.add,
             "append": self.actions.append,
             "delete bulk": self.actions.delete_bulk,
-            "insert bulk": self.actions.insert_bulk
+            "insert bulk": self.actions.insert_bulk,
+            "read": self.read
         }
+        if self.write_buffer is not None:
+            for action, op in (("insert", "insert"), ("add", "insert"), ("append", "insert"),
+                               ("insert bulk", "insert"), ("delete", "delete"), ("delete bulk", "delete")):
+                self.action_map[action] = self._buffered(op)
 
         logger.debug("MemoryTool initialized with settings.")
 
@@ -182,6 +308,29 @@ class MemoryTool:
         logger.error("Schema update failed.")
         return "Error updating schema."
 
+    def read(self, index_name: str, field_name: str, items: List[str]) -> str:
+        """
+        Reads stored values, including buffered writes that have not been indexed yet.
+        """
+        if self.write_buffer is None:
+            return self.actions.read(index_name, field_name, items)
+        try:
+            values = self.actions.read_values(index_name, field_name, items)
+        except Exception as e:
+            logger.error(f"Error reading items: {e}", exc_info=True)
+            return "Error reading items."
+        values = self.write_buffer.overlay(index_name, field_name, values, items)
+        return "\n".join(values) if values else "No stored items found."
+
+    def _buffered(self, op: str) -> Callable[[str, str, List[str]], str]:
+        """
+        Returns an action handing its items to the write-behind buffer.
+        """
+        def action(index_name: str, field_name: str, items: List[str]) -> str:
+            return self.write_buffer.submit(op, index_name, field_name, items)
+
+        return action
+
     def _perform_memory_action(self, action: str, items: List[str], field_name: str) -> str:
         """
         Dispatches the requested action to the appropriate method in ElasticsearchMemoryActions.
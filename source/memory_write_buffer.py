@@ -0,0 +1,419 @@
+import atexit
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import List
+
+from custom_logger import logger
+from dotenv import load_dotenv
+
+from instrumentation import metrics_registry
+
+# Load environment variables from the .env file
+dotenv_path = os.path.join(os.path.dirname(__file__), "../.env")
+load_dotenv(dotenv_path)
+
+# Directory of the spill files holding acknowledged but not yet indexed memory writes
+MEMORY_SPILL_DIR = os.getenv("MEMORY_SPILL_DIR", os.path.join(os.path.dirname(__file__), "../memory_spill"))
+# Seconds to wait before retrying a flush that failed to reach Elasticsearch
+FLUSH_RETRY_DELAY = 5.0
+
+DEFAULT_SETTINGS = {
+    "enabled": False,
+    "max_pending": 10000,
+    "flush_size": 200,
+    "flush_interval": 1.0,
+    "spill_path": None,
+}
+
+
+class RetryableWriteError(Exception):
+    """
+    Raised by a flush when Elasticsearch rejected items with a retryable status; they stay buffered.
+    """
+
+
+class MemoryWriteBuffer:
+    """
+    Write-behind buffer for memory inserts and deletes. Writes are journaled to a spill file and acknowledged
+    immediately; a background worker flushes them in bulk once enough items are pending or the flush interval
+    elapsed. Reads are overlaid with the writes that have not been indexed yet.
+
+    Every process journals to its own spill file, "<spill path>.<pid>.jsonl", and holds an exclusive lock on
+    the matching ".lock" file for its lifetime. On startup a buffer takes over the spill files of processes
+    that no longer hold their lock, so writes of a crashed worker are flushed once by whichever process
+    claims them first.
+    """
+
+    def __init__(self, actions, spill_path: str, max_pending: int = 10000, flush_size: int = 200,
+                 flush_interval: float = 1.0) -> None:
+        """
+        Initializes the buffer, recovering writes left in the spill files of dead processes.
+
+        Args:
+            actions (ElasticsearchMemoryActions): Performs the bulk writes.
+            spill_path (str): Path of the JSON lines spill file, suffixed with the process ID.
+            max_pending (int): Maximum number of buffered items; a write beyond it flushes synchronously first,
+                and a write that still does not fit is sent to Elasticsearch directly.
+            flush_size (int): Number of pending items that triggers a flush.
+            flush_interval (float): Maximum seconds a write stays buffered.
+
+        Returns:
+            None
+        """
+        root, extension = os.path.splitext(spill_path)
+        self.actions = actions
+        self.spill_path = f"{root}.{os.getpid()}{extension or '.jsonl'}"
+        self.max_pending = max_pending
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._pending: List[dict] = []
+        self._in_flight: List[dict] = []
+        self._dirty_indexes: set = set()
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._counts = {"acknowledged": 0, "flushed": 0, "failed": 0, "requeued": 0, "written_through": 0,
+                        "flushes": 0}
+        self._lock_file = None
+        self._recover()
+        self._worker = threading.Thread(target=self._run, name="memory-write-behind", daemon=True)
+        self._worker.start()
+
+    def submit(self, op: str, index_name: str, field_name: str, items: List[str]) -> str:
+        """
+        Journals and buffers a write.
+
+        Args:
+            op (str): Either 'insert' or 'delete'.
+            index_name (str): The target index.
+            field_name (str): The target field.
+            items (List[str]): The items to write.
+
+        Returns:
+            str: The acknowledgement for the agent, or the outcome of a write sent directly.
+        """
+        if self.buffered_items() + len(items) > self.max_pending:
+            logger.warning("Memory write buffer is full; flushing synchronously.")
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Synchronous write-behind flush failed: {e}", exc_info=True)
+                return "Error storing items: the memory write buffer is full and could not be flushed."
+
+        entry = {"op": op, "index": index_name, "field": field_name, "items": list(items)}
+        with self._condition:
+            fits = self.buffered_items() + len(items) <= self.max_pending
+            if fits:
+                with open(self.spill_path, "a") as file:
+                    file.write(json.dumps(entry) + "\n")
+                    file.flush()
+                    os.fsync(file.fileno())
+                self._pending.append(entry)
+                self._counts["acknowledged"] += len(items)
+                if self.pending_items() >= self.flush_size:
+                    self._condition.notify()
+        if not fits:
+            return self._write_through(op, index_name, field_name, items)
+        return f"{op.capitalize()} of {len(items)} items accepted; it will be stored shortly."
+
+    def overlay(self, index_name: str, field_name: str, values: List[str], items: List[str] | None = None) -> List[str]:
+        """
+        Applies buffered writes to values read from the index, so a reader sees its own writes.
+
+        Args:
+            index_name (str): The index that was read.
+            field_name (str): The field that was read.
+            values (List[str]): The values returned by the index.
+            items (List[str] | None): The query items of the read; pending inserts are only added when they
+                contain one of them.
+
+        Returns:
+            List[str]: The values with pending inserts added and pending deletes removed.
+        """
+        values = list(values)
+        with self._condition:
+            entries = self._in_flight + self._pending
+        for entry in entries:
+            if entry["index"] != index_name or entry["field"] != field_name:
+                continue
+            if entry["op"] == "delete":
+                deleted = {item.lower() for item in entry["items"]}
+                values = [value for value in values if str(value).lower() not in deleted]
+                continue
+            for item in entry["items"]:
+                matches = not items or any(query.lower() in item.lower() for query in items)
+                if matches and item not in values:
+                    values.append(item)
+        return values
+
+    def pending_items(self) -> int:
+        return sum(len(entry["items"]) for entry in self._pending)
+
+    def buffered_items(self) -> int:
+        return sum(len(entry["items"]) for entry in self._in_flight + self._pending)
+
+    def flush(self) -> None:
+        """
+        Writes every pending entry to Elasticsearch. Consecutive entries with the same operation and target
+        are coalesced into one bulk request. Every request that succeeded is dropped from the buffer and the
+        spill file right away, so a failure only leaves the entries that were not sent buffered; inserts
+        are not idempotent and must not be sent twice. Items rejected with a retryable status stay buffered
+        in place of their request and the flush stops with RetryableWriteError, so later writes keep their
+        order.
+        """
+        with self._flush_lock:
+            self._flush()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {**self._counts, "pending": self.pending_items()}
+
+    def _flush(self) -> None:
+        """
+        Flushes the pending entries. Called with the flush lock held.
+        """
+        with self._condition:
+            if not self._pending:
+                return
+            self._in_flight, self._pending = self._pending, []
+
+        try:
+            for op, index_name, field_name, items, entry_count in self._coalesce(self._in_flight):
+                retry = self._write(op, index_name, field_name, items)
+                with self._condition:
+                    del self._in_flight[:entry_count]
+                    if retry:
+                        self._in_flight.insert(0, {"op": op, "index": index_name, "field": field_name, "items": retry})
+                    self._rewrite_spill()
+                if retry:
+                    raise RetryableWriteError(f"Elasticsearch rejected {len(retry)} {op} items with a retryable "
+                                              f"status; they stay buffered.")
+        except Exception:
+            with self._condition:
+                self._pending = self._in_flight + self._pending
+                self._in_flight = []
+            raise
+
+        with self._condition:
+            self._counts["flushes"] += 1
+
+    def _write_through(self, op: str, index_name: str, field_name: str, items: List[str]) -> str:
+        """
+        Sends a write larger than the buffer directly, after the writes buffered before it.
+        """
+        logger.warning(f"{op.capitalize()} of {len(items)} items exceeds the memory write buffer; writing it directly.")
+        with self._flush_lock:
+            try:
+                self._flush()
+                results = self._send(op, index_name, field_name, items)
+            except Exception as e:
+                logger.error(f"Direct {op} into '{index_name}' failed: {e}", exc_info=True)
+                return f"Error storing items: the {op} of {len(items)} items could not be written."
+        failed = [result for result in results if result["status"] == "failed"]
+        with self._condition:
+            self._counts["written_through"] += len(items)
+            self._counts["failed"] += len(failed)
+        if failed:
+            logger.error(f"Direct {op} into '{index_name}' failed for {len(failed)} results: {failed}")
+            return f"Error storing items: the {op} failed for {len(failed)} of {len(results)} results."
+        return f"{op.capitalize()} of {len(items)} items stored."
+
+    @staticmethod
+    def _coalesce(entries: List[dict]) -> List[list]:
+        """
+        Groups consecutive entries with the same target into [op, index, field, items, entry count].
+        """
+        groups: List[list] = []
+        for entry in entries:
+            target = [entry["op"], entry["index"], entry["field"]]
+            if groups and groups[-1][:3] == target:
+                groups[-1][3].extend(entry["items"])
+                groups[-1][4] += 1
+            else:
+                groups.append([*target, list(entry["items"]), 1])
+        return groups
+
+    def _write(self, op: str, index_name: str, field_name: str, items: List[str]) -> List[str]:
+        """
+        Sends one coalesced group. Permanent per-item failures, such as mapping errors, are logged and dropped;
+        transport errors propagate.
+
+        Returns:
+            List[str]: The items rejected with a retryable status, to be sent again.
+        """
+        results = self._send(op, index_name, field_name, items)
+        failed = [result for result in results if result["status"] == "failed"]
+        retry = [item for result in failed if result.get("retryable")
+                 for item in result.get("items", [result.get("item")])]
+        dropped = [result for result in failed if not result.get("retryable")]
+        if dropped:
+            logger.error(f"Write-behind {op} into '{index_name}' failed for {len(dropped)} results: {dropped}")
+        with self._condition:
+            self._counts["flushed"] += len(items) - len(retry)
+            self._counts["failed"] += len(dropped)
+            self._counts["requeued"] += len(retry)
+        return retry
+
+    def _send(self, op: str, index_name: str, field_name: str, items: List[str]) -> List[dict]:
+        if op == "insert":
+            results = self.actions.index_items(index_name, field_name, items)
+            self._dirty_indexes.add(index_name)
+            return results
+        if index_name in self._dirty_indexes:
+            # delete_by_query only sees refreshed documents, including the inserts flushed just before
+            self.actions.client.indices.refresh(index=index_name)
+            self._dirty_indexes.discard(index_name)
+        return self.actions.delete_items(index_name, field_name, items)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait(timeout=self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush failed, retrying in {FLUSH_RETRY_DELAY}s: {e}", exc_info=True)
+                time.sleep(FLUSH_RETRY_DELAY)
+
+    def _recover(self) -> None:
+        """
+        Locks this process's spill file and takes over its entries and those of every sibling spill file
+        whose owner died. Claimed files are removed once their entries are journaled in this process's file.
+        """
+        directory = os.path.dirname(self.spill_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = _lock(self.spill_path + ".lock", blocking=True)
+
+        # A previous process with the same ID left this file behind
+        self._pending.extend(_read_spill(self.spill_path))
+        root, extension = os.path.splitext(self.spill_path)
+        pattern = re.escape(os.path.basename(os.path.splitext(root)[0])) + r"\.\d+" + re.escape(extension)
+        claimed = []
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if path == self.spill_path or not re.fullmatch(pattern, name):
+                continue
+            lock_file = _lock(path + ".lock", blocking=False)
+            if lock_file is None:
+                continue
+            self._pending.extend(_read_spill(path))
+            claimed.append((path, lock_file))
+
+        if self._pending:
+            self._rewrite_spill()
+            logger.info(f"Recovered {self.pending_items()} buffered memory writes into {self.spill_path}.")
+        for path, lock_file in claimed:
+            # The spill file goes before its lock, so a process that locks it afterwards finds nothing to claim
+            os.remove(path)
+            os.remove(path + ".lock")
+            lock_file.close()
+
+    def _rewrite_spill(self) -> None:
+        """
+        Replaces the spill file with the entries not written yet. Called with the condition held.
+        """
+        temporary_path = self.spill_path + ".tmp"
+        with open(temporary_path, "w") as file:
+            for entry in self._in_flight + self._pending:
+                file.write(json.dumps(entry) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self.spill_path)
+
+
+def _lock(path: str, blocking: bool):
+    """
+    Opens and exclusively locks a lock file. Returns None when another process holds the lock, or when the
+    file was removed by a process that claimed it in the meantime and blocking is False.
+    """
+    while True:
+        file = open(path, "a")
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            file.close()
+            return None
+        try:
+            if os.fstat(file.fileno()).st_ino == os.stat(path).st_ino:
+                return file
+        except FileNotFoundError:
+            pass
+        file.close()
+        if not blocking:
+            return None
+
+
+def _read_spill(path: str) -> List[dict]:
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path) as file:
+        for line in file:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A torn last line from a crash mid-write was never acknowledged
+                logger.warning(f"Skipping unreadable line in memory spill file {path}.")
+    return entries
+
+
+_buffers: dict[str, MemoryWriteBuffer] = {}
+_buffers_lock = threading.Lock()
+
+
+def get_write_buffer(actions, index_name: str, settings: dict) -> MemoryWriteBuffer | None:
+    """
+    Returns the shared write-behind buffer of an index when the "write_behind" tool setting enables it.
+    Tools of a process writing to the same spill file share one buffer; each process journals to its own copy.
+    The default spill file is per index and per write settings of the actions (bulk chunk size, threads, delete
+    batch size and refresh), so tools with different write settings get their own buffer. Tools sharing an
+    explicit "spill_path" are all flushed with the actions of the first tool.
+
+    Args:
+        actions (ElasticsearchMemoryActions): Performs the bulk writes.
+        index_name (str): The memory index.
+        settings (dict): The "write_behind" block of the tool settings.
+
+    Returns:
+        MemoryWriteBuffer | None: The buffer, or None when write-behind is disabled.
+    """
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    if not settings["enabled"]:
+        return None
+    write_settings = _write_settings(actions)
+    digest = hashlib.sha256(json.dumps(write_settings, sort_keys=True).encode()).hexdigest()[:12]
+    spill_path = settings["spill_path"] or os.path.join(MEMORY_SPILL_DIR, f"{index_name}-{digest}.jsonl")
+    with _buffers_lock:
+        buffer = _buffers.get(spill_path)
+        if buffer is not None and _write_settings(buffer.actions) != write_settings:
+            logger.warning(f"Write-behind buffer {spill_path} is shared by tools with different write settings; "
+                           f"it flushes with {_write_settings(buffer.actions)}.")
+        if buffer is None:
+            buffer = _buffers[spill_path] = MemoryWriteBuffer(
+                actions,
+                spill_path,
+                max_pending=settings["max_pending"],
+                flush_size=settings["flush_size"],
+                flush_interval=settings["flush_interval"],
+            )
+            name = os.path.splitext(os.path.basename(spill_path))[0]
+            metrics_registry.register(f"memory_write_buffer:{name}", buffer.stats)
+        return buffer
+
+
+def _write_settings(actions) -> dict:
+    names = ("chunk_size", "bulk_threads", "delete_batch_size", "refresh")
+    return {name: getattr(actions, name, None) for name in names}
+
+
+@atexit.register
+def _flush_all() -> None:
+    for buffer in list(_buffers.values()):
+        try:
+            buffer.flush()
+        except Exception as e:
+            logger.error(f"Final write-behind flush failed; writes remain in {buffer.spill_path}: {e}")
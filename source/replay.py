@@ -0,0 +1,435 @@
+import asyncio
+import fnmatch
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable
+
+import httpx
+from custom_logger import logger
+from dotenv import load_dotenv
+from elastic_transport import ApiResponseMeta, HttpHeaders, Urllib3HttpNode
+from elastic_transport._node import NodeApiResponse
+from elastic_transport.client_utils import DEFAULT, DefaultType
+from langchain_community.chat_message_histories import RedisChatMessageHistory
+
+# Load environment variables from the .env file
+dotenv_path = os.path.join(os.path.dirname(__file__), "../.env")
+load_dotenv(dotenv_path)
+
+# 'off' calls the live services, 'record' calls them and writes cassettes, 'replay' serves only from cassettes
+REPLAY_MODE = os.getenv("REPLAY_MODE", "off").lower()
+# Cassettes hold full request and response bodies; the default directory is ignored by git
+REPLAY_DIR = os.getenv("REPLAY_DIR", os.path.join(os.path.dirname(__file__), "../replay_cassettes"))
+# Replayed latency: 'recorded' sleeps as long as the original call took, a number sleeps that many milliseconds
+REPLAY_LATENCY = os.getenv("REPLAY_LATENCY", "recorded")
+REPLAY_LATENCY_SCALE = float(os.getenv("REPLAY_LATENCY_SCALE", "1.0"))
+# Redis URLs with this scheme are served by the in-process fake instead of a server
+MEMORY_REDIS_SCHEME = "memory://"
+
+
+class ReplayMissError(LookupError):
+    """
+    Raised in replay mode when a call has no recorded response.
+    """
+
+
+class Cassette:
+    """
+    Recorded responses of one service, appended as JSON lines and keyed by a hash of the request.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._entries: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    entry = json.loads(line)
+                    self._entries[entry["key"]] = entry
+            logger.info(f"Replay cassette {path} loaded with {len(self._entries)} entries.")
+
+    def get(self, key: str) -> dict | None:
+        return self._entries.get(key)
+
+    def record(self, key: str, response: Any, latency: float) -> None:
+        """
+        Stores a response and the latency it was served with, replacing an earlier recording of the same key.
+
+        Args:
+            key (str): The request key.
+            response (Any): The JSON serializable response.
+            latency (float): The latency of the live call in seconds.
+        """
+        entry = {"key": key, "response": response, "latency": latency}
+        with self._lock:
+            self._entries[key] = entry
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as file:
+                file.write(json.dumps(entry) + "\n")
+
+
+_cassettes: dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def replay_enabled() -> bool:
+    return REPLAY_MODE in ("record", "replay")
+
+
+def get_cassette(service: str) -> Cassette:
+    """
+    Returns the shared cassette of a service, loading it on first use.
+
+    Args:
+        service (str): The service name, used as the cassette file name.
+
+    Returns:
+        cassette (Cassette): The cassette.
+    """
+    with _cassettes_lock:
+        cassette = _cassettes.get(service)
+        if cassette is None:
+            cassette = _cassettes[service] = Cassette(os.path.join(REPLAY_DIR, f"{service}.jsonl"))
+        return cassette
+
+
+def request_key(*parts: Any) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=repr).encode("utf-8")).hexdigest()
+
+
+def replay_delay(entry: dict) -> float:
+    """
+    Returns how long a replayed response should take according to the latency configuration.
+    """
+    if REPLAY_LATENCY == "recorded":
+        latency = entry.get("latency", 0.0)
+    else:
+        latency = float(REPLAY_LATENCY) / 1000
+    return max(latency * REPLAY_LATENCY_SCALE, 0.0)
+
+
+def _lookup(service: str, key: str) -> dict:
+    entry = get_cassette(service).get(key)
+    if entry is None:
+        raise ReplayMissError(
+            f"No recorded {service} response for request {key[:12]}; record it with REPLAY_MODE=record."
+        )
+    return entry
+
+
+def replay_call(service: str, key_parts: Any, function: Callable[[], Any],
+                encode: Callable[[Any], Any] = lambda value: value,
+                decode: Callable[[Any], Any] = lambda value: value) -> Any:
+    """
+    Calls a service through the record/replay layer. With replay off the function is called directly.
+
+    Args:
+        service (str): The service name selecting the cassette.
+        key_parts (Any): JSON serializable request description identifying the response.
+        function (Callable[[], Any]): The live call.
+        encode (Callable[[Any], Any]): Converts the live response to a JSON serializable value for recording.
+        decode (Callable[[Any], Any]): Converts a recorded value back to a response.
+
+    Returns:
+        Any: The live or replayed response.
+    """
+    if REPLAY_MODE == "replay":
+        entry = _lookup(service, request_key(service, key_parts))
+        time.sleep(replay_delay(entry))
+        return decode(entry["response"])
+    if REPLAY_MODE != "record":
+        return function()
+    started = time.monotonic()
+    result = function()
+    get_cassette(service).record(request_key(service, key_parts), encode(result), time.monotonic() - started)
+    return result
+
+
+class _HTTPReplay:
+    """
+    Shared request keying and response encoding of the httpx replay transports.
+    """
+
+    # Headers kept in recordings; authorization and request ids are never written to disk
+    KEPT_HEADERS = ("content-type",)
+
+    def __init__(self, service: str) -> None:
+        self.service = service
+
+    def _key(self, request: httpx.Request) -> str:
+        return request_key(self.service, request.method, str(request.url), request.content.decode("utf-8", "replace"))
+
+    def _encode(self, response: httpx.Response) -> dict:
+        headers = {name: value for name, value in response.headers.items() if name.lower() in self.KEPT_HEADERS}
+        return {"status": response.status_code, "headers": headers, "body": response.content.decode("utf-8")}
+
+    @staticmethod
+    def _decode(payload: dict, request: httpx.Request) -> httpx.Response:
+        return httpx.Response(payload["status"], headers=payload["headers"],
+                              content=payload["body"].encode("utf-8"), request=request)
+
+
+class ReplayTransport(_HTTPReplay, httpx.BaseTransport):
+    """
+    httpx transport recording or replaying the HTTP traffic of a synchronous client.
+    """
+
+    def __init__(self, service: str, transport: httpx.BaseTransport | None = None) -> None:
+        super().__init__(service)
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        key = self._key(request)
+        if REPLAY_MODE == "replay":
+            entry = _lookup(self.service, key)
+            time.sleep(replay_delay(entry))
+            return self._decode(entry["response"], request)
+        started = time.monotonic()
+        response = self.transport.handle_request(request)
+        response.read()
+        payload = self._encode(response)
+        response.close()
+        get_cassette(self.service).record(key, payload, time.monotonic() - started)
+        return self._decode(payload, request)
+
+
+class AsyncReplayTransport(_HTTPReplay, httpx.AsyncBaseTransport):
+    """
+    httpx transport recording or replaying the HTTP traffic of an asynchronous client.
+    """
+
+    def __init__(self, service: str, transport: httpx.AsyncBaseTransport | None = None) -> None:
+        super().__init__(service)
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        key = self._key(request)
+        if REPLAY_MODE == "replay":
+            entry = _lookup(self.service, key)
+            await asyncio.sleep(replay_delay(entry))
+            return self._decode(entry["response"], request)
+        started = time.monotonic()
+        response = await self.transport.handle_async_request(request)
+        await response.aread()
+        payload = self._encode(response)
+        await response.aclose()
+        get_cassette(self.service).record(key, payload, time.monotonic() - started)
+        return self._decode(payload, request)
+
+
+def openai_http_clients() -> dict:
+    """
+    Returns the http client arguments routing an OpenAI client through the replay layer.
+
+    Returns:
+        dict: 'http_client' and 'http_async_client' keyword arguments, empty with replay off.
+    """
+    if not replay_enabled():
+        return {}
+    return {
+        "http_client": httpx.Client(transport=ReplayTransport("openai")),
+        "http_async_client": httpx.AsyncClient(transport=AsyncReplayTransport("openai")),
+    }
+
+
+class ElasticsearchReplayNode(Urllib3HttpNode):
+    """
+    Elasticsearch transport node recording or replaying every request of a client, so searches, bulk writes,
+    mappings and any other API call go through the cassette. In replay mode the cluster is never contacted
+    and an unrecorded request raises ReplayMissError.
+    """
+
+    # The client refuses responses without the product header, so it is kept along with the content type
+    KEPT_HEADERS = ("content-type", "x-elastic-product")
+
+    def perform_request(self, method: str, target: str, body: bytes | None = None,
+                        headers: HttpHeaders | None = None,
+                        request_timeout: DefaultType | float | None = DEFAULT) -> NodeApiResponse:
+        # The cluster address is left out of the key so cassettes can be replayed against any ES_URL
+        key = request_key("elasticsearch", method, target, (body or b"").decode("utf-8", "replace"))
+        if REPLAY_MODE == "replay":
+            entry = _lookup("elasticsearch", key)
+            time.sleep(replay_delay(entry))
+            return self._decode(entry["response"])
+        started = time.monotonic()
+        response = super().perform_request(method, target, body=body, headers=headers,
+                                           request_timeout=request_timeout)
+        headers = {name: value for name, value in response.meta.headers.items()
+                   if name.lower() in self.KEPT_HEADERS}
+        payload = {"status": response.meta.status, "headers": headers, "body": response.body.decode("utf-8")}
+        get_cassette("elasticsearch").record(key, payload, time.monotonic() - started)
+        return response
+
+    def _decode(self, payload: dict) -> NodeApiResponse:
+        meta = ApiResponseMeta(status=payload["status"], http_version="1.1", headers=HttpHeaders(payload["headers"]),
+                               duration=0.0, node=self.config)
+        return NodeApiResponse(meta, payload["body"].encode("utf-8"))
+
+
+def elasticsearch_client_options() -> dict:
+    """
+    Returns the Elasticsearch client arguments routing its requests through the replay layer.
+
+    Returns:
+        dict: The 'node_class' keyword argument, empty with replay off.
+    """
+    if not replay_enabled():
+        return {}
+    return {"node_class": ElasticsearchReplayNode}
+
+
+class FakeRedis:
+    """
+    In-process stand-in for the subset of the Redis API used by the caches, settings and chat memory.
+    Clients of the same memory:// URL share one keyspace; like Redis, values are stored as bytes and only
+    decoded for clients created with decode_responses. Keys expire lazily.
+    """
+
+    _keyspaces: dict[str, tuple[dict, dict, threading.RLock]] = {}
+    _keyspaces_lock = threading.Lock()
+
+    def __init__(self, url: str = MEMORY_REDIS_SCHEME, decode_responses: bool = False) -> None:
+        with self._keyspaces_lock:
+            keyspace = self._keyspaces.get(url)
+            if keyspace is None:
+                keyspace = self._keyspaces[url] = ({}, {}, threading.RLock())
+        self._data, self._expiry, self._lock = keyspace
+        self.decode_responses = decode_responses
+
+    @staticmethod
+    def _encode(value: Any) -> bytes:
+        if isinstance(value, bytes):
+            return value
+        return str(value).encode("utf-8")
+
+    def _decode(self, value: bytes | None) -> Any:
+        if value is None or not self.decode_responses:
+            return value
+        return value.decode("utf-8")
+
+    def _live(self, name: str) -> bool:
+        expires = self._expiry.get(name)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(name, None)
+            self._expiry.pop(name, None)
+        return name in self._data
+
+    def get(self, name: str) -> Any:
+        with self._lock:
+            return self._decode(self._data[name]) if self._live(name) else None
+
+    def mget(self, keys: list, *args: str) -> list:
+        with self._lock:
+            return [self._decode(self._data[name]) if self._live(name) else None for name in [*keys, *args]]
+
+    def set(self, name: str, value: Any, ex: float | None = None, px: float | None = None,
+            nx: bool = False) -> bool | None:
+        with self._lock:
+            if nx and self._live(name):
+                return None
+            self._data[name] = self._encode(value)
+            self._expiry.pop(name, None)
+            ttl = ex if ex is not None else (px / 1000 if px is not None else None)
+            if ttl is not None:
+                self._expiry[name] = time.monotonic() + ttl
+            return True
+
+    def setex(self, name: str, time_seconds: float, value: Any) -> bool:
+        return self.set(name, value, ex=time_seconds)
+
+    def incr(self, name: str, amount: int = 1) -> int:
+        with self._lock:
+            value = int(self._data[name]) + amount if self._live(name) else amount
+            self._data[name] = self._encode(value)
+            return value
+
+    def delete(self, *names: str) -> int:
+        with self._lock:
+            removed = 0
+            for name in names:
+                if self._live(name):
+                    removed += 1
+                self._data.pop(name, None)
+                self._expiry.pop(name, None)
+            return removed
+
+    def exists(self, *names: str) -> int:
+        with self._lock:
+            return sum(1 for name in names if self._live(name))
+
+    def expire(self, name: str, time_seconds: float) -> bool:
+        with self._lock:
+            if not self._live(name):
+                return False
+            self._expiry[name] = time.monotonic() + time_seconds
+            return True
+
+    def keys(self, pattern: str = "*") -> list:
+        with self._lock:
+            names = [name for name in list(self._data) if self._live(name) and fnmatch.fnmatchcase(name, pattern)]
+            return [self._decode(self._encode(name)) for name in names]
+
+    def lpush(self, name: str, *values: Any) -> int:
+        with self._lock:
+            items = self._data[name] if self._live(name) else []
+            for value in values:
+                items.insert(0, self._encode(value))
+            self._data[name] = items
+            return len(items)
+
+    def rpush(self, name: str, *values: Any) -> int:
+        with self._lock:
+            items = self._data[name] if self._live(name) else []
+            items.extend(self._encode(value) for value in values)
+            self._data[name] = items
+            return len(items)
+
+    def lrange(self, name: str, start: int, end: int) -> list:
+        with self._lock:
+            items = self._data[name] if self._live(name) else []
+            return [self._decode(item) for item in items[start:None if end == -1 else end + 1]]
+
+    def ltrim(self, name: str, start: int, end: int) -> bool:
+        with self._lock:
+            if self._live(name):
+                self._data[name] = self._data[name][start:None if end == -1 else end + 1]
+            return True
+
+    def ping(self) -> bool:
+        return True
+
+
+class FakeRedisChatMessageHistory(RedisChatMessageHistory):
+    """
+    Redis chat message history stored in the in-process fake of a memory:// URL.
+    """
+
+    def __init__(self, session_id: str, url: str = MEMORY_REDIS_SCHEME, key_prefix: str = "message_store:",
+                 ttl: int | None = None) -> None:
+        self.redis_client = FakeRedis(url)
+        self.session_id = session_id
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+
+
+def chat_message_history(session_id: str, url: str, ttl: int | None = None) -> RedisChatMessageHistory:
+    """
+    Returns the Redis chat message history of a session, served by the in-process fake for memory:// URLs.
+
+    Args:
+        session_id (str): The session ID.
+        url (str): The Redis URL.
+        ttl (int | None): Expiry of the history in seconds.
+
+    Returns:
+        RedisChatMessageHistory: The message history.
+    """
+    if url and url.startswith(MEMORY_REDIS_SCHEME):
+        return FakeRedisChatMessageHistory(session_id=session_id, url=url, ttl=ttl)
+    return RedisChatMessageHistory(session_id=session_id, url=url, ttl=ttl)
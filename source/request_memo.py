@@ -0,0 +1,174 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Iterator
+
+from custom_logger import logger
+
+# Memo of the graph run currently executing; thread pools copy the context, so every worker shares it
+_current_memo: contextvars.ContextVar["RequestMemo | None"] = contextvars.ContextVar("request_memo", default=None)
+# Tools report failures as results starting with this prefix instead of raising
+ERROR_PREFIX = "Error"
+
+
+def is_error_result(result: Any) -> bool:
+    return isinstance(result, str) and result.startswith(ERROR_PREFIX)
+
+
+class RequestMemo:
+    """
+    Per-request store of tool results keyed by tool name and arguments. Concurrent identical calls wait on
+    the first one instead of executing again. Failures, raised or returned as an error string, are handed to
+    the calls already waiting but not kept, so a later call retries.
+    """
+
+    def __init__(self) -> None:
+        self._results: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def call(self, name: str, function: Callable, *args: Any, **kwargs: Any) -> Any:
+        """
+        Returns the memoized result of a call, executing it only the first time.
+
+        Args:
+            name (str): The name of the tool.
+            function (Callable): The tool function.
+            *args (Any): Positional tool arguments.
+            **kwargs (Any): Keyword tool arguments.
+
+        Returns:
+            Any: The tool result.
+        """
+        key, future, owner = self._claim(name, args, kwargs)
+        if not owner:
+            logger.debug(f"Tool '{name}' served from the request memo.")
+            return future.result()
+
+        try:
+            result = function(*args, **kwargs)
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result=result)
+        return result
+
+    async def acall(self, name: str, coroutine: Callable, *args: Any, **kwargs: Any) -> Any:
+        """
+        Async counterpart of call; sync and async calls with the same arguments share one result.
+
+        Args:
+            name (str): The name of the tool.
+            coroutine (Callable): The tool coroutine function.
+            *args (Any): Positional tool arguments.
+            **kwargs (Any): Keyword tool arguments.
+
+        Returns:
+            Any: The tool result.
+        """
+        key, future, owner = self._claim(name, args, kwargs)
+        if not owner:
+            logger.debug(f"Tool '{name}' served from the request memo.")
+            return await asyncio.wrap_future(future)
+
+        try:
+            result = await coroutine(*args, **kwargs)
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result=result)
+        return result
+
+    def _claim(self, name: str, args: tuple, kwargs: dict) -> tuple[str, Future, bool]:
+        """
+        Returns the key and future of a call and whether the caller owns, i.e. has to execute, it.
+        """
+        key = self._key(name, args, kwargs)
+        with self._lock:
+            future = self._results.get(key)
+            owner = future is None
+            if owner:
+                future = self._results[key] = Future()
+            else:
+                self.hits += 1
+        return key, future, owner
+
+    def _settle(self, key: str, future: Future, result: Any = None, error: BaseException | None = None) -> None:
+        if error is not None or is_error_result(result):
+            # Failures are not memoized so that a later call can retry
+            with self._lock:
+                if self._results.get(key) is future:
+                    del self._results[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    @staticmethod
+    def _key(name: str, args: tuple, kwargs: dict) -> str:
+        return json.dumps([name, args, kwargs], sort_keys=True, default=repr)
+
+
+@contextlib.contextmanager
+def request_scope() -> Iterator[RequestMemo]:
+    """
+    Opens a memo scope for the duration of one request.
+
+    Returns:
+        Iterator[RequestMemo]: The memo of the request.
+    """
+    memo = RequestMemo()
+    token = _current_memo.set(memo)
+    try:
+        yield memo
+    finally:
+        _current_memo.reset(token)
+        if memo.hits:
+            logger.info(f"Request memo avoided {memo.hits} duplicate tool calls.")
+
+
+def memoized(name: str, function: Callable) -> Callable:
+    """
+    Wraps a function so that calls inside a request scope are memoized by name and arguments.
+    Outside a request scope the function is called directly.
+
+    Args:
+        name (str): The name the results are memoized under.
+        function (Callable): The function to wrap.
+
+    Returns:
+        Callable: The wrapped function.
+    """
+    @functools.wraps(function)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        memo = _current_memo.get()
+        if memo is None:
+            return function(*args, **kwargs)
+        return memo.call(name, function, *args, **kwargs)
+
+    return wrapper
+
+
+def amemoized(name: str, coroutine: Callable) -> Callable:
+    """
+    Async counterpart of memoized, sharing the memo entries of the sync function with the same name.
+
+    Args:
+        name (str): The name the results are memoized under.
+        coroutine (Callable): The coroutine function to wrap.
+
+    Returns:
+        Callable: The wrapped coroutine function.
+    """
+    @functools.wraps(coroutine)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        memo = _current_memo.get()
+        if memo is None:
+            return await coroutine(*args, **kwargs)
+        return await memo.acall(name, coroutine, *args, **kwargs)
+
+    return wrapper
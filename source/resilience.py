@@ -0,0 +1,470 @@
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, List, Optional
+
+import openai
+from custom_logger import logger
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import agenerate_from_stream, generate_from_stream
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_openai import ChatOpenAI
+
+# Upstream failures worth retrying; anything else (bad requests, auth errors) is raised immediately
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    TimeoutError,
+)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when the circuit breaker rejects a call because the upstream is degraded."""
+
+
+class CircuitBreaker:
+    """
+    Fails fast after consecutive upstream failures and lets a trial call through once the reset timeout expires.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Checks whether a call may be sent upstream.
+
+        Returns:
+            bool: False while the circuit is open, True otherwise.
+        """
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                logger.info("Circuit breaker half-open, allowing a trial call.")
+            return self.state != "open"
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                logger.info("Circuit breaker closed after a successful call.")
+            self.state = "closed"
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"Circuit breaker opened after {self._failures} consecutive failures.")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """
+    Keeps a sliding window of call latencies to derive the hedging threshold.
+    """
+
+    def __init__(self, window: int = 200) -> None:
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, latency: float) -> None:
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, percentile: float, min_samples: int = 1) -> float | None:
+        """
+        Returns the requested latency percentile, or None while there are too few samples.
+
+        Args:
+            percentile (float): Percentile between 0 and 100.
+            min_samples (int): Minimum number of samples required.
+
+        Returns:
+            float | None: The latency in seconds.
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < max(min_samples, 1):
+            return None
+        index = min(len(samples) - 1, int(round(percentile / 100 * (len(samples) - 1))))
+        return samples[index]
+
+
+class ResiliencePolicy:
+    """
+    Wraps upstream calls with a timeout, jittered retries, hedged duplicate requests and a circuit breaker.
+
+    A running thread cannot be cancelled: an attempt that loses a hedge or outlives the timeout keeps its
+    worker until it returns. Attempts should therefore bound their own request time (ResilientChatOpenAI
+    passes the policy timeout to the client), and max_workers bounds how many can be in flight.
+    """
+
+    def __init__(self, settings: dict | None = None) -> None:
+        """
+        Initializes the policy from a settings dictionary.
+
+        Args:
+            settings (dict | None): Policy settings. Recognised keys are timeout, max_retries, backoff_base,
+                backoff_max, hedge_enabled, hedge_percentile, hedge_min_samples, failure_threshold,
+                reset_timeout and max_workers.
+
+        Returns:
+            None
+        """
+        settings = settings or {}
+        self.timeout = settings.get("timeout", 60.0)
+        self.max_retries = settings.get("max_retries", 2)
+        self.backoff_base = settings.get("backoff_base", 0.5)
+        self.backoff_max = settings.get("backoff_max", 8.0)
+        self.hedge_enabled = settings.get("hedge_enabled", True)
+        self.hedge_percentile = settings.get("hedge_percentile", 95)
+        self.hedge_min_samples = settings.get("hedge_min_samples", 20)
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.get("failure_threshold", 5),
+            reset_timeout=settings.get("reset_timeout", 30.0),
+        )
+        self.latencies = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=settings.get("max_workers", 32),
+                                            thread_name_prefix="llm-hedge")
+        self._counters = {
+            "calls": 0, "successes": 0, "failures": 0, "retries": 0, "timeouts": 0,
+            "hedges": 0, "hedge_wins": 0, "circuit_rejections": 0,
+        }
+        self._lock = threading.Lock()
+
+    def call(self, attempt: Callable[[bool], Any]) -> Any:
+        """
+        Runs a call under the policy.
+
+        Args:
+            attempt (Callable[[bool], Any]): Performs one upstream call. Receives True for the primary request
+                and False for a hedged duplicate.
+
+        Returns:
+            Any: The result of the first successful attempt.
+        """
+        self._ensure_allowed()
+        for retry in range(self.max_retries + 1):
+            try:
+                result = self._hedged(attempt)
+                self._succeeded()
+                return result
+            except RETRYABLE_ERRORS as e:
+                self._failed(e)
+                if retry == self.max_retries or not self.breaker.allow():
+                    raise
+                self._count("retries")
+                delay = self._backoff(retry)
+                logger.warning(f"Retrying model call in {delay:.2f}s after error: {e}")
+                time.sleep(delay)
+
+    async def acall(self, attempt: Callable[[bool], Awaitable[Any]]) -> Any:
+        """
+        Async counterpart of call.
+
+        Args:
+            attempt (Callable[[bool], Awaitable[Any]]): Coroutine factory performing one upstream call.
+
+        Returns:
+            Any: The result of the first successful attempt.
+        """
+        self._ensure_allowed()
+        for retry in range(self.max_retries + 1):
+            try:
+                result = await self._ahedged(attempt)
+                self._succeeded()
+                return result
+            except RETRYABLE_ERRORS as e:
+                self._failed(e)
+                if retry == self.max_retries or not self.breaker.allow():
+                    raise
+                self._count("retries")
+                delay = self._backoff(retry)
+                logger.warning(f"Retrying model call in {delay:.2f}s after error: {e}")
+                await asyncio.sleep(delay)
+
+    def stream(self, open_stream: Callable[[], Iterator]) -> Iterator:
+        """
+        Runs a streaming call under the policy. Retries are only attempted before the first chunk is yielded,
+        and streams are never hedged. A failure after the first chunk is recorded with the circuit breaker and
+        raised. The stream must enforce its own timeout, e.g. the client read timeout.
+
+        Args:
+            open_stream (Callable[[], Iterator]): Opens the upstream stream.
+
+        Returns:
+            Iterator: The chunks of the first stream that produced output.
+        """
+        self._ensure_allowed()
+        for retry in range(self.max_retries + 1):
+            iterator = open_stream()
+            try:
+                first = next(iterator)
+            except StopIteration:
+                self._succeeded()
+                return
+            except RETRYABLE_ERRORS as e:
+                self._stream_failed(e)
+                if retry == self.max_retries or not self.breaker.allow():
+                    raise
+                self._count("retries")
+                time.sleep(self._backoff(retry))
+                continue
+            self._succeeded()
+            yield first
+            try:
+                yield from iterator
+            except RETRYABLE_ERRORS as e:
+                # Chunks were already yielded, so the stream cannot be retried
+                self._stream_failed(e)
+                raise
+            return
+
+    async def astream(self, open_stream: Callable[[], AsyncIterator]) -> AsyncIterator:
+        """
+        Async counterpart of stream.
+
+        Args:
+            open_stream (Callable[[], AsyncIterator]): Opens the upstream stream.
+
+        Returns:
+            AsyncIterator: The chunks of the first stream that produced output.
+        """
+        self._ensure_allowed()
+        for retry in range(self.max_retries + 1):
+            iterator = open_stream()
+            try:
+                first = await iterator.__anext__()
+            except StopAsyncIteration:
+                self._succeeded()
+                return
+            except RETRYABLE_ERRORS as e:
+                self._stream_failed(e)
+                if retry == self.max_retries or not self.breaker.allow():
+                    raise
+                self._count("retries")
+                await asyncio.sleep(self._backoff(retry))
+                continue
+            self._succeeded()
+            yield first
+            try:
+                async for chunk in iterator:
+                    yield chunk
+            except RETRYABLE_ERRORS as e:
+                self._stream_failed(e)
+                raise
+            return
+
+    def snapshot(self) -> dict:
+        """
+        Returns the policy counters, circuit state and current hedging threshold.
+
+        Returns:
+            dict: Resilience metrics.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+        counters["circuit_state"] = self.breaker.state
+        counters["hedge_threshold"] = self._hedge_delay()
+        return counters
+
+    def _hedged(self, attempt: Callable[[bool], Any]) -> Any:
+        """
+        Sends the primary request and, if it outlives the latency percentile, a duplicate; the first success wins.
+        Losing attempts that have not started yet are cancelled; running ones finish in the background.
+        """
+        started = time.perf_counter()
+        hedge_delay = self._hedge_delay()
+        pending = {self._executor.submit(contextvars.copy_context().run, attempt, True)}
+        primary = next(iter(pending))
+        try:
+            if hedge_delay is not None:
+                done, pending = wait(pending, timeout=hedge_delay)
+                if not done:
+                    self._count("hedges")
+                    pending.add(self._executor.submit(contextvars.copy_context().run, attempt, False))
+                else:
+                    pending = done
+
+            error = None
+            deadline = started + self.timeout
+            while pending:
+                done, pending = wait(
+                    pending, timeout=max(deadline - time.perf_counter(), 0), return_when=FIRST_COMPLETED
+                )
+                if not done:
+                    self._count("timeouts")
+                    raise TimeoutError(f"Model call timed out after {self.timeout}s.")
+                for future in done:
+                    if future.exception() is None:
+                        if future is not primary:
+                            self._count("hedge_wins")
+                        self.latencies.add(time.perf_counter() - started)
+                        return future.result()
+                    error = future.exception()
+            raise error
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def _ahedged(self, attempt: Callable[[bool], Awaitable[Any]]) -> Any:
+        """
+        Async counterpart of _hedged.
+        """
+        started = time.perf_counter()
+        hedge_delay = self._hedge_delay()
+        primary = asyncio.ensure_future(attempt(True))
+        pending = {primary}
+        try:
+            if hedge_delay is not None:
+                done, pending = await asyncio.wait(pending, timeout=hedge_delay)
+                if not done:
+                    self._count("hedges")
+                    pending.add(asyncio.ensure_future(attempt(False)))
+                else:
+                    pending = done
+
+            error = None
+            deadline = started + self.timeout
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(deadline - time.perf_counter(), 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    self._count("timeouts")
+                    raise TimeoutError(f"Model call timed out after {self.timeout}s.")
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._count("hedge_wins")
+                        self.latencies.add(time.perf_counter() - started)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _hedge_delay(self) -> float | None:
+        if not self.hedge_enabled:
+            return None
+        return self.latencies.percentile(self.hedge_percentile, self.hedge_min_samples)
+
+    def _backoff(self, retry: int) -> float:
+        # Full jitter keeps retrying workers from synchronising against a recovering upstream
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry))
+
+    def _ensure_allowed(self) -> None:
+        self._count("calls")
+        if not self.breaker.allow():
+            self._count("circuit_rejections")
+            raise CircuitOpenError("Model circuit breaker is open; upstream is degraded.")
+
+    def _succeeded(self) -> None:
+        self._count("successes")
+        self.breaker.record_success()
+
+    def _failed(self, error: Exception) -> None:
+        self._count("failures")
+        self.breaker.record_failure()
+        logger.error(f"Model call failed: {error}")
+
+    def _stream_failed(self, error: Exception) -> None:
+        # Streams time out in the client rather than in _hedged, so their timeouts are counted here
+        if isinstance(error, (openai.APITimeoutError, TimeoutError)):
+            self._count("timeouts")
+        self._failed(error)
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+
+class ResilientChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI whose upstream calls run under a ResiliencePolicy. Binding tools or functions keeps the policy.
+    Every request carries the policy timeout, so abandoned hedges and streams stalled between chunks are cut off
+    by the client.
+    """
+
+    resilience: Any = None
+
+    def _with_timeout(self, kwargs: dict) -> dict:
+        return {"timeout": self.resilience.timeout, **kwargs}
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        kwargs = self._with_timeout(kwargs)
+
+        def attempt(primary: bool) -> ChatResult:
+            # Hedged duplicates run silently so that callbacks only see the primary request
+            manager = run_manager if primary else None
+            if self.streaming:
+                return generate_from_stream(
+                    ChatOpenAI._stream(self, messages, stop=stop, run_manager=manager, **kwargs)
+                )
+            return ChatOpenAI._generate(self, messages, stop=stop, run_manager=manager, **kwargs)
+
+        return self.resilience.call(attempt)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        kwargs = self._with_timeout(kwargs)
+
+        async def attempt(primary: bool) -> ChatResult:
+            manager = run_manager if primary else None
+            if self.streaming:
+                return await agenerate_from_stream(
+                    ChatOpenAI._astream(self, messages, stop=stop, run_manager=manager, **kwargs)
+                )
+            return await ChatOpenAI._agenerate(self, messages, stop=stop, run_manager=manager, **kwargs)
+
+        return await self.resilience.acall(attempt)
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        kwargs = self._with_timeout(kwargs)
+        return self.resilience.stream(
+            lambda: ChatOpenAI._stream(self, messages, stop=stop, run_manager=run_manager, **kwargs)
+        )
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        kwargs = self._with_timeout(kwargs)
+        async for chunk in self.resilience.astream(
+            lambda: ChatOpenAI._astream(self, messages, stop=stop, run_manager=run_manager, **kwargs)
+        ):
+            yield chunk
@@ -0,0 +1,133 @@
+import os
+import threading
+
+from custom_logger import logger
+from dotenv import load_dotenv
+
+from cache_store import TTLCache, get_redis_client
+from instrumentation import metrics_registry
+
+# Load environment variables from the .env file
+dotenv_path = os.path.join(os.path.dirname(__file__), "../.env")
+load_dotenv(dotenv_path)
+
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "900"))
+# Generations live in Redis when configured so that every worker sees an ingestion
+INDEX_GENERATION_REDIS_URL = os.getenv("INDEX_GENERATION_REDIS_URL")
+# Pseudo index bumped along with every index, for caches that depend on the whole KB
+ALL_INDEXES = "*"
+
+
+class IndexGenerations:
+    """
+    Tracks a generation number per index, bumped whenever new documents are ingested into it.
+    """
+
+    def __init__(self, redis_client=None) -> None:
+        self.redis_client = redis_client
+        self._generations: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, index_name: str) -> int:
+        """
+        Returns the current generation of an index.
+
+        Args:
+            index_name (str): The name of the index.
+
+        Returns:
+            generation (int): The generation number, 0 for an index that was never bumped.
+        """
+        if self.redis_client is not None:
+            try:
+                return int(self.redis_client.get(self._key(index_name)) or 0)
+            except Exception as e:
+                logger.warning(f"Reading index generation from Redis failed: {e}")
+        return self._generations.get(index_name, 0)
+
+    def bump(self, index_name: str) -> int:
+        """
+        Advances the generation of an index, and of ALL_INDEXES, making results cached for older generations stale.
+
+        Args:
+            index_name (str): The name of the index.
+
+        Returns:
+            generation (int): The new generation number.
+        """
+        with self._lock:
+            generation = self._generations.get(index_name, 0) + 1
+            self._generations[index_name] = generation
+            self._generations[ALL_INDEXES] = self._generations.get(ALL_INDEXES, 0) + 1
+        if self.redis_client is not None:
+            try:
+                generation = int(self.redis_client.incr(self._key(index_name)))
+                self.redis_client.incr(self._key(ALL_INDEXES))
+            except Exception as e:
+                logger.warning(f"Bumping index generation in Redis failed: {e}")
+        logger.info(f"Index '{index_name}' advanced to generation {generation}.")
+        return generation
+
+    @staticmethod
+    def _key(index_name: str) -> str:
+        return f"index_generation:{index_name}"
+
+
+class RetrievalCache:
+    """
+    TTL and size bounded cache of KB search results, keyed by index, query, k and search parameters and
+    tagged with the index generation they were fetched at.
+    """
+
+    def __init__(self, generations: IndexGenerations, max_size: int = 1024, ttl: float | None = 900) -> None:
+        self.generations = generations
+        self.cache = TTLCache(max_size=max_size, ttl=ttl)
+
+    def get(self, index_name: str, query: str, k: int, params: str = "") -> list | None:
+        """
+        Returns cached results, dropping them if the index has been re-ingested since they were stored.
+
+        Args:
+            index_name (str): The name of the index.
+            query (str): The search query.
+            k (int): The number of results requested.
+            params (str): Serialized search parameters such as filters, distinguishing otherwise equal searches.
+
+        Returns:
+            list | None: The cached results or None on a miss.
+        """
+        key = (index_name, query, k, params)
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        generation, results = entry
+        if generation != self.generations.get(index_name):
+            self.cache.pop(key)
+            return None
+        return results
+
+    def set(self, index_name: str, query: str, k: int, results: list, params: str = "",
+            generation: int | None = None) -> None:
+        """
+        Stores results under the generation of the index they were fetched at.
+
+        Args:
+            index_name (str): The name of the index.
+            query (str): The search query.
+            k (int): The number of results requested.
+            results (list): The search results.
+            params (str): Serialized search parameters such as filters.
+            generation (int | None): Generation read before searching; defaults to the current one.
+        """
+        if generation is None:
+            generation = self.generations.get(index_name)
+        self.cache.set((index_name, query, k, params), (generation, results))
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+index_generations = IndexGenerations(get_redis_client(INDEX_GENERATION_REDIS_URL))
+retrieval_cache = RetrievalCache(index_generations, max_size=RETRIEVAL_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL)
+metrics_registry.register("retrieval_cache", retrieval_cache.stats)
@@ -0,0 +1,152 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable
+
+from custom_logger import logger
+
+from context_packer import truncate_tokens
+from instrumentation import metrics_registry
+
+# Pool running tool calls that have a timeout, so the agent can stop waiting on them
+call_executor = ThreadPoolExecutor(max_workers=int(os.getenv("TOOL_CALL_WORKERS", "32")),
+                                   thread_name_prefix="tool-call")
+TRUNCATION_NOTE = "\n[Output truncated to fit the tool output limit.]"
+
+
+class ToolGuardStats:
+    """
+    Counts the tool calls cut off by a timeout or an output limit.
+    """
+
+    def __init__(self) -> None:
+        self._counts = {"timeouts": 0, "truncations": 0}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._counts)
+
+
+guard_stats = ToolGuardStats()
+metrics_registry.register("tool_guard", guard_stats.snapshot)
+
+
+def timeout_result(name: str, timeout: float) -> str:
+    """
+    Returns the structured observation given to the agent in place of a tool result that timed out.
+
+    Args:
+        name (str): The name of the tool.
+        timeout (float): The timeout in seconds.
+
+    Returns:
+        result (str): JSON describing the timeout.
+    """
+    guard_stats.increment("timeouts")
+    logger.warning(f"Tool '{name}' timed out after {timeout} seconds.")
+    return json.dumps({
+        "status": "timeout",
+        "tool": name,
+        "timeout_seconds": timeout,
+        "message": f"The {name} tool did not respond within {timeout} seconds. Continue without it or retry "
+                   f"with a narrower input."
+    })
+
+
+def cap_output(result: Any, max_chars: int | None = None, max_tokens: int | None = None) -> Any:
+    """
+    Truncates a tool result to the configured character and token limits.
+
+    Args:
+        result (Any): The tool result; non-string results are converted to text when a limit is set.
+        max_chars (int | None): Maximum number of characters.
+        max_tokens (int | None): Maximum number of tokens.
+
+    Returns:
+        Any: The result, truncated when it exceeded a limit.
+    """
+    if max_chars is None and max_tokens is None:
+        return result
+    text = result if isinstance(result, str) else str(result)
+    capped = text
+    if max_tokens is not None:
+        capped = truncate_tokens(capped, max_tokens)
+    if max_chars is not None:
+        capped = capped[:max_chars]
+    if len(capped) == len(text):
+        return result
+    guard_stats.increment("truncations")
+    return capped + TRUNCATION_NOTE
+
+
+def guarded(name: str, function: Callable, tool_config: dict) -> Callable:
+    """
+    Wraps a tool function with the per-tool "timeout" (seconds), "max_output_chars" and "max_output_tokens"
+    settings. A call that exceeds its timeout is cancelled if it has not started yet, otherwise abandoned,
+    and the agent receives a structured timeout result.
+
+    Args:
+        name (str): The name of the tool.
+        function (Callable): The tool function.
+        tool_config (dict): The configuration for the tool.
+
+    Returns:
+        Callable: The wrapped function, or the function itself when no limit is configured.
+    """
+    timeout = tool_config.get("timeout")
+    max_chars = tool_config.get("max_output_chars")
+    max_tokens = tool_config.get("max_output_tokens")
+    if timeout is None and max_chars is None and max_tokens is None:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        if timeout is None:
+            return cap_output(function(*args, **kwargs), max_chars, max_tokens)
+        future = call_executor.submit(contextvars.copy_context().run, function, *args, **kwargs)
+        try:
+            result = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            return timeout_result(name, timeout)
+        return cap_output(result, max_chars, max_tokens)
+
+    return wrapper
+
+
+def aguarded(name: str, coroutine: Callable, tool_config: dict) -> Callable:
+    """
+    Async counterpart of guarded; a coroutine that exceeds its timeout is cancelled.
+
+    Args:
+        name (str): The name of the tool.
+        coroutine (Callable): The tool coroutine function.
+        tool_config (dict): The configuration for the tool.
+
+    Returns:
+        Callable: The wrapped coroutine function, or the coroutine function itself when no limit is configured.
+    """
+    timeout = tool_config.get("timeout")
+    max_chars = tool_config.get("max_output_chars")
+    max_tokens = tool_config.get("max_output_tokens")
+    if timeout is None and max_chars is None and max_tokens is None:
+        return coroutine
+
+    @functools.wraps(coroutine)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        try:
+            result = await asyncio.wait_for(coroutine(*args, **kwargs), timeout)
+        except asyncio.TimeoutError:
+            return timeout_result(name, timeout)
+        return cap_output(result, max_chars, max_tokens)
+
+    return wrapper
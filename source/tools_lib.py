@@ -1,7 +1,110 @@
+import asyncio
+import hashlib
 import importlib
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
 
 from custom_logger import logger
-from langchain_core.tools import Tool
+from langchain_core.tools import BaseTool, StructuredTool, Tool, ToolException
+
+from instrumentation import metrics_registry
+from request_memo import amemoized, memoized
+from tool_guard import aguarded, guarded
+
+# Bounded pool building tools and pulling agent prompts side by side during a settings update
+init_executor = ThreadPoolExecutor(max_workers=int(os.getenv("TOOL_INIT_WORKERS", "8")),
+                                   thread_name_prefix="tool-init")
+# Settings applied per agent on top of the shared tool, see tool_guard
+GUARD_KEYS = ("timeout", "max_output_chars", "max_output_tokens")
+
+
+def config_key(tool_config: dict) -> str:
+    """
+    Returns the canonical hash of a tool configuration; configurations differing only in key order or
+    whitespace hash the same. Guard settings are left out, as they are applied per agent.
+
+    Args:
+        tool_config (dict): The configuration for the tool.
+
+    Returns:
+        key (str): The hex digest of the configuration.
+    """
+    shared_config = {key: value for key, value in tool_config.items() if key not in GUARD_KEYS}
+    canonical = json.dumps(shared_config, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class LazyToolInstance:
+    """
+    Defers the construction of a tool class until one of its functions is first called, so prompts and
+    clients are only set up for tools an agent actually uses. A failed construction is raised as a
+    ToolException, which the tool reports to the agent, and is retried on the next call.
+    """
+
+    def __init__(self, module, class_name: str, settings: dict) -> None:
+        self.module = module
+        self.class_name = class_name
+        self.settings = settings
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def resolve(self) -> object:
+        """
+        Returns the class instance, constructing it on the first call.
+
+        Returns:
+            class_instance (object): The class instance.
+
+        Raises:
+            ToolException: If the class could not be constructed.
+        """
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    logger.info(f"Materializing tool class '{self.class_name}' on first use.")
+                    try:
+                        self._instance = ToolFactory.get_class_instance(self.module, self.class_name, self.settings)
+                    except Exception as e:
+                        logger.error(f"Error constructing tool class '{self.class_name}': {e}", exc_info=True)
+                        raise ToolException(f"The tool is unavailable: {e}") from e
+        return self._instance
+
+    def function(self, function_name: str) -> Callable:
+        """
+        Returns a proxy calling a function of the instance.
+
+        Args:
+            function_name (str): The name of the function.
+
+        Returns:
+            function (Callable): The proxy.
+        """
+        def proxy(*args: Any, **kwargs: Any) -> Any:
+            return ToolFactory.get_function(self.resolve(), function_name)(*args, **kwargs)
+
+        proxy.__name__ = function_name
+        return proxy
+
+    def coroutine(self, function_name: str) -> Callable:
+        """
+        Returns an async proxy of a coroutine function; construction runs in a worker thread so the event
+        loop is not blocked.
+
+        Args:
+            function_name (str): The name of the coroutine function.
+
+        Returns:
+            coroutine (Callable): The proxy.
+        """
+        async def proxy(*args: Any, **kwargs: Any) -> Any:
+            instance = self._instance or await asyncio.to_thread(self.resolve)
+            return await ToolFactory.get_function(instance, function_name)(*args, **kwargs)
+
+        proxy.__name__ = function_name
+        return proxy
 
 
 class ToolFactory:
@@ -64,10 +167,74 @@ class ToolFactory:
             raise TypeError(f"Attribute '{function_name}' is not callable")
         return function
 
+    @staticmethod
+    def validate_class(module, class_name: str, function_names: list) -> None:
+        """
+        Checks that a class and its tool functions exist without instantiating it.
+
+        Args:
+            module: The module holding the class.
+            class_name (str): The name of the class.
+            function_names (list): The names of the functions the tool calls.
+        """
+        tool_class = getattr(module, class_name, None)
+        if tool_class is None:
+            logger.error(f"Class '{class_name}' not found in module '{module.__name__}'.")
+            raise ValueError(f"Class '{class_name}' not found in module '{module.__name__}'")
+        for function_name in function_names:
+            if not callable(getattr(tool_class, function_name, None)):
+                logger.error(f"Function '{function_name}' not found in class '{class_name}'")
+                raise ValueError(f"Function '{function_name}' not found in class '{class_name}'")
+
+    @staticmethod
+    def get_args_schema(module, tool_config: dict) -> type | None:
+        """
+        Returns the argument schema of a tool: the model named by the "args_schema" config key, or else the
+        args_schema attribute of the tool class.
+
+        Args:
+            module: The module holding the tool.
+            tool_config (dict): The configuration for the tool.
+
+        Returns:
+            type | None: The schema, or None for a tool taking a single string.
+        """
+        if 'args_schema' in tool_config:
+            args_schema = getattr(module, tool_config['args_schema'], None)
+            if args_schema is None:
+                logger.error(f"Schema '{tool_config['args_schema']}' not found in module '{module.__name__}'.")
+                raise ValueError(f"Schema '{tool_config['args_schema']}' not found in module '{module.__name__}'")
+            return args_schema
+        if 'class' in tool_config:
+            return getattr(getattr(module, tool_config['class'], None), 'args_schema', None)
+        return None
+
+    @staticmethod
+    def memoize_enabled(module, tool_config: dict) -> bool:
+        """
+        Returns whether calls of a tool are memoized per request: the "memoize" config key, or else the
+        memoize attribute of the tool class. Tools with side effects, such as writes, set it to False.
+
+        Args:
+            module: The module holding the tool.
+            tool_config (dict): The configuration for the tool.
+
+        Returns:
+            bool: True unless memoization is turned off.
+        """
+        if 'memoize' in tool_config:
+            return bool(tool_config['memoize'])
+        if 'class' in tool_config:
+            return getattr(getattr(module, tool_config['class'], None), 'memoize', True)
+        return True
+
     @staticmethod
     def initialize_tool(tool_config: dict) -> Tool:
         """
-        Initializes a tool based on the provided configuration.
+        Initializes a tool based on the provided configuration. Class based tools are constructed on their
+        first call unless the configuration sets "lazy" to false. Tools with an argument schema become
+        structured tools taking keyword arguments. Calls are memoized per request unless "memoize" is false.
+        Timeouts and output limits are not applied here but by guard_tool.
 
         Args:
             tool_config (dict): The configuration for the tool.
@@ -76,34 +243,203 @@ class ToolFactory:
             Tool: The initialized tool.
         """
         module = ToolFactory.load_module(tool_config["module"])
-        if 'class' in tool_config:
+        coroutine = None
+        lazy = 'class' in tool_config and bool(tool_config.get('lazy', True))
+        if lazy:
+            coroutine_name = tool_config.get('coroutine')
+            function_names = [tool_config['function']] + ([coroutine_name] if coroutine_name else [])
+            ToolFactory.validate_class(module, tool_config['class'], function_names)
+            lazy_instance = LazyToolInstance(module, tool_config['class'], tool_config)
+            function = lazy_instance.function(tool_config['function'])
+            if coroutine_name:
+                coroutine = lazy_instance.coroutine(coroutine_name)
+        elif 'class' in tool_config:
             class_instance = ToolFactory.get_class_instance(module, tool_config['class'], tool_config)
             function = ToolFactory.get_function(class_instance, tool_config['function'])
+            # Optional async implementation used when the agent runs asynchronously
+            if 'coroutine' in tool_config:
+                coroutine = ToolFactory.get_function(class_instance, tool_config['coroutine'])
         else:
             function = getattr(module, tool_config['function'])
             if not callable(function):
                 logger.error(f"Function '{tool_config['function']}' is not callable.")
                 raise TypeError(f"Function '{tool_config['function']}' is not callable")
+        key = config_key(tool_config)
+        if ToolFactory.memoize_enabled(module, tool_config):
+            # Memoize per request; the config key keeps equally named tools with different settings apart
+            function = memoized(f"{tool_config['name']}:{key}", function)
+            if coroutine is not None:
+                coroutine = amemoized(f"{tool_config['name']}:{key}", coroutine)
+        args_schema = ToolFactory.get_args_schema(module, tool_config)
+        # A lazy tool reports a failed construction to the agent instead of failing the whole request
+        options = {"metadata": {"registry_key": key}, "handle_tool_error": lazy}
         logger.debug(f"Tool '{tool_config['name']}' initialized successfully.")
-        return Tool.from_function(func=function, name=tool_config['name'], description=tool_config.get('description'))
+        if args_schema is not None:
+            return StructuredTool.from_function(
+                func=function, name=tool_config['name'], description=tool_config.get('description'),
+                coroutine=coroutine, args_schema=args_schema, **options
+            )
+        return Tool.from_function(func=function, name=tool_config['name'], description=tool_config.get('description'),
+                                  coroutine=coroutine, **options)
+
+
+    @staticmethod
+    def guard_tool(tool: BaseTool, tool_config: dict) -> BaseTool:
+        """
+        Applies the timeout and output limits of a configuration to a tool.
+
+        Args:
+            tool (BaseTool): The tool, possibly shared with other agents.
+            tool_config (dict): The configuration for the tool.
+
+        Returns:
+            BaseTool: A guarded copy of the tool, or the tool itself when no limit is configured.
+        """
+        if not any(key in tool_config for key in GUARD_KEYS):
+            return tool
+        # Timeouts and output limits sit outside the memo so that waiting on a shared call is bounded too
+        update = {"func": guarded(tool_config['name'], tool.func, tool_config)}
+        if tool.coroutine is not None:
+            update["coroutine"] = aguarded(tool_config['name'], tool.coroutine, tool_config)
+        # Rebuilt rather than copied, since pydantic's copy drops excluded fields such as callbacks
+        return type(tool)(**{**{name: getattr(tool, name) for name in tool.__fields__}, **update})
+
+
+class ToolRegistry:
+    """
+    Process-wide registry sharing tools built from identical configurations across agents and apps.
+    Every acquisition is reference counted and a tool is dropped once all of its holders released it.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[str, list] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.reuses = 0
+
+    def acquire(self, tool_config: dict) -> Tool:
+        """
+        Returns the shared tool for a configuration, building it on first use. Concurrent acquisitions of
+        the same configuration wait for a single build.
+
+        Args:
+            tool_config (dict): The configuration for the tool.
+
+        Returns:
+            Tool: The shared tool.
+        """
+        key = config_key(tool_config)
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = [Future(), 0]
+                self.builds += 1
+            else:
+                self.reuses += 1
+            entry[1] += 1
 
+        if not owner:
+            logger.debug(f"Tool '{tool_config['name']}' shared from the tool registry.")
+            try:
+                return entry[0].result()
+            except BaseException:
+                # Release the failed entry itself; the key may already map to a newer build
+                self._release_entry(key, entry)
+                raise
 
-def initialize_tools(settings: dict) -> list:
+        try:
+            tool = ToolFactory.initialize_tool(tool_config)
+        except BaseException as e:
+            # Failed builds are not kept so that a later settings update can retry
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            entry[0].set_exception(e)
+            raise
+        entry[0].set_result(tool)
+        return tool
+
+    def release(self, key: str) -> None:
+        """
+        Drops one reference to a shared tool, removing it when no holder is left.
+
+        Args:
+            key (str): The registry key of the tool.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            self._release_entry(key, entry)
+
+    def _release_entry(self, key: str, entry: list) -> None:
+        with self._lock:
+            entry[1] -= 1
+            if entry[1] <= 0 and self._entries.get(key) is entry:
+                del self._entries[key]
+                logger.debug(f"Tool {key[:12]} released from the tool registry.")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"tools": len(self._entries), "builds": self.builds, "reuses": self.reuses,
+                    "references": sum(entry[1] for entry in self._entries.values())}
+
+
+tool_registry = ToolRegistry()
+metrics_registry.register("tool_registry", tool_registry.stats)
+
+
+def acquire_tool(tool_config: dict) -> BaseTool:
+    """
+    Acquires the shared tool of a configuration and applies the agent's own timeout and output limits to it.
+
+    Args:
+        tool_config (dict): The configuration for the tool.
+
+    Returns:
+        BaseTool: The tool for the agent.
+    """
+    return ToolFactory.guard_tool(tool_registry.acquire(tool_config), tool_config)
+
+
+def initialize_tools(settings: dict, errors: dict | None = None) -> list:
     """
-    Initializes a list of tools based on the provided settings.
+    Initializes a list of tools based on the provided settings, building the tools concurrently.
 
     Args:
         settings (dict): The settings to be used for tool initialization.
+        errors (dict | None): Collects the error message of every tool that failed, keyed by tool name.
 
     Returns:
-        tool_list (list): A list of initialized tools.
+        tool_list (list): A list of initialized tools, in configuration order.
     """
+    futures = {
+        tool_name: init_executor.submit(acquire_tool, tool_config)
+        for tool_name, tool_config in settings["Tools"].items()
+    }
     tools_list = []
-    for tool_name, tool_config in settings["Tools"].items():
+    for tool_name, future in futures.items():
         try:
-            tool = ToolFactory.initialize_tool(tool_config)
-            tools_list.append(tool)
+            tools_list.append(future.result())
             logger.info(f"Tool {tool_name} initialized successfully.")
         except Exception as e:
             logger.error(f"Error initializing tool {tool_name}: {str(e)}")
+            if errors is not None:
+                errors[tool_name] = str(e)
     return tools_list
+
+
+def release_tools(tools: list) -> None:
+    """
+    Releases registry references held by a list of tools, e.g. when the agents using them are replaced.
+
+    Args:
+        tools (list): The tools to release.
+
+    Returns:
+        None
+    """
+    for tool in tools:
+        key = (tool.metadata or {}).get("registry_key") if isinstance(tool, BaseTool) else None
+        if key:
+            tool_registry.release(key)
@@ -4,13 +4,17 @@ import os
 from custom_logger import logger
 from dotenv import load_dotenv
 from langchain import hub
-from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
-from langchain_community.chat_message_histories import RedisChatMessageHistory
+from langchain_core.load import dumpd, load
 from langchain_core.messages import BaseMessage
 from langchain_core.prompts.chat import ChatPromptTemplate
+from langchain_core.vectorstores import VectorStore
 from langchain_elasticsearch import ElasticsearchStore
 from langchain_openai import ChatOpenAI
-from langchain_openai import OpenAIEmbeddings
+
+from instrumentation import metrics_callback, metrics_registry
+from replay import chat_message_history, openai_http_clients, replay_call
+from resilience import ResiliencePolicy, ResilientChatOpenAI
+from vector_stores import get_vector_store
 
 # Load environment variables from the .env file
 dotenv_path = os.path.join(os.path.dirname(__file__), "../.env")
@@ -32,12 +36,23 @@ def setup_model() -> object:
             raise ValueError("MODEL_SETTINGS environment variable is not set.")
 
         model_settings = json.loads(model_settings_str)
-        llm_model = ChatOpenAI(
-            model_name=model_settings.get("model_name"),
-            streaming=model_settings.get("streaming"),
-            callbacks=[StreamingStdOutCallbackHandler()],
-            verbose=True
-        )
+        model_kwargs = {
+            "model_name": model_settings.get("model_name"),
+            "streaming": model_settings.get("streaming"),
+            "callbacks": [metrics_callback],
+            "verbose": model_settings.get("verbose", False),
+            **openai_http_clients(),
+        }
+        resilience_settings = model_settings.get("resilience", {})
+        if resilience_settings.get("enabled", True):
+            # Retries and timeouts are owned by the policy instead of the OpenAI client
+            policy = ResiliencePolicy(resilience_settings)
+            metrics_registry.register("llm_resilience", policy.snapshot)
+            llm_model = ResilientChatOpenAI(
+                **model_kwargs, resilience=policy, max_retries=0, request_timeout=policy.timeout
+            )
+        else:
+            llm_model = ChatOpenAI(**model_kwargs)
         logger.info(f"Large language model initialized with model name: {model_settings.get('model_name')}")
         return llm_model
     except Exception as e:
@@ -60,9 +75,7 @@ def get_memory(session_id: str) -> object:
         message_history (object): The message history object for the session ID.
     """
     try:
-        message_history = RedisChatMessageHistory(
-            url=os.environ.get("REDIS_URL"), ttl=600, session_id=session_id
-        )
+        message_history = chat_message_history(session_id, os.environ.get("REDIS_URL"), ttl=600)
         logger.info(f"Message history setup for session ID: {session_id}")
         return message_history
     except Exception as e:
@@ -83,9 +96,9 @@ def update_memory(session_id: str, new_message: BaseMessage) -> None:
     """
     try:
         # Create an instance of RedisChatMessageHistory with session ID
-        message_history = RedisChatMessageHistory(
-            session_id=session_id,
-            url=os.environ.get("REDIS_URL", "redis://localhost:6379/0"),
+        message_history = chat_message_history(
+            session_id,
+            os.environ.get("REDIS_URL", "redis://localhost:6379/0"),
             ttl=600  # Optional: Adjust TTL as required
         )
         # Append the new message to the Redis chat history
@@ -108,7 +121,7 @@ def fetch_prompt(prompt_id: str) -> ChatPromptTemplate:
         prompt (ChatPromptTemplate): The fetched prompt.
     """
     try:
-        prompt = hub.pull(prompt_id)
+        prompt = replay_call("langchain_hub", prompt_id, lambda: hub.pull(prompt_id), encode=dumpd, decode=load)
         logger.info(f"Prompt fetched with ID: {prompt_id}")
         return prompt
     except Exception as e:
@@ -116,26 +129,40 @@ def fetch_prompt(prompt_id: str) -> ChatPromptTemplate:
         raise
 
 
-def setup_es_vector_store(index_name: str) -> ElasticsearchStore:
+def setup_es_vector_store(index_name: str, rrf: bool | dict = True) -> ElasticsearchStore:
     """
     Initialize the Elasticsearch vector store.
 
     Args:
         index_name (str): The name of the Elasticsearch index to use for the vector store.
+        rrf (bool | dict): Reciprocal rank fusion setting, e.g. {"rank_constant": 60, "window_size": 100}.
 
     Returns:
-        es_vector_store (object): The initialized Elasticsearch vector store.
+        es_vector_store (object): The shared Elasticsearch vector store from the process-wide registry.
     """
     try:
-        embedding = OpenAIEmbeddings()
-        elastic_vector_search = ElasticsearchStore(
-            es_url=os.getenv("ES_URL"),
-            index_name=index_name,
-            embedding=embedding,
-            strategy=ElasticsearchStore.ApproxRetrievalStrategy(hybrid=True, rrf=True)
-
-        )
-        return elastic_vector_search
+        return get_vector_store(index_name, hybrid=True, rrf=rrf)
     except Exception as e:
         logger.error(f"Error setting up Elasticsearch vector store: {str(e)}", exc_info=True)
         raise
+
+
+def setup_vector_store(index_name: str, backend: str = "elasticsearch", rrf: bool | dict = True) -> VectorStore:
+    """
+    Initialize the vector store for an index on the configured retrieval backend.
+
+    Args:
+        index_name (str): The name of the index to use for the vector store.
+        backend (str): Either 'elasticsearch' or 'local' for the embedded index.
+        rrf (bool | dict): Reciprocal rank fusion setting for the Elasticsearch backend.
+
+    Returns:
+        vector_store (VectorStore): The shared vector store from the process-wide registry.
+    """
+    if backend == "elasticsearch":
+        return setup_es_vector_store(index_name, rrf=rrf)
+    try:
+        return get_vector_store(index_name, backend=backend)
+    except Exception as e:
+        logger.error(f"Error setting up {backend} vector store: {str(e)}", exc_info=True)
+        raise
@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+
+from custom_logger import logger
+from dotenv import load_dotenv
+from elasticsearch import Elasticsearch
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_elasticsearch import ElasticsearchStore
+from langchain_openai import OpenAIEmbeddings
+
+from cache_store import get_redis_client
+from embedding_cache import CachedQueryEmbeddings
+from instrumentation import metrics_registry
+from local_vector_store import LocalVectorStore
+from replay import elasticsearch_client_options, openai_http_clients
+
+# Load environment variables from the .env file
+dotenv_path = os.path.join(os.path.dirname(__file__), "../.env")
+load_dotenv(dotenv_path)
+
+# Size of the keep-alive connection pool shared by every store talking to the same cluster
+ES_CONNECTIONS_PER_NODE = int(os.getenv("ES_CONNECTIONS_PER_NODE", "10"))
+ES_REQUEST_TIMEOUT = float(os.getenv("ES_REQUEST_TIMEOUT", "30"))
+# Query embedding cache sizing; the Redis tier is only used when a URL is configured
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_REDIS_URL = os.getenv("EMBEDDING_CACHE_REDIS_URL")
+# Root directory of the embedded local indexes
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(os.path.dirname(__file__), "../local_indexes"))
+
+_lock = threading.Lock()
+_es_clients: dict[str, Elasticsearch] = {}
+_vector_stores: dict[tuple, VectorStore] = {}
+_embedding: Embeddings | None = None
+
+
+def get_embeddings() -> Embeddings:
+    """
+    Return the process-wide embeddings client, creating it on first use.
+    Query embeddings are cached, so repeated KB lookups for the same query skip the embedding round trip.
+
+    Returns:
+        embedding (Embeddings): The shared embeddings client.
+    """
+    global _embedding
+    with _lock:
+        if _embedding is None:
+            openai_embedding = OpenAIEmbeddings(**openai_http_clients())
+            _embedding = CachedQueryEmbeddings(
+                openai_embedding,
+                model_name=openai_embedding.model,
+                max_size=EMBEDDING_CACHE_SIZE,
+                redis_client=get_redis_client(EMBEDDING_CACHE_REDIS_URL),
+            )
+            metrics_registry.register("query_embedding_cache", _embedding.stats)
+            logger.info("Shared embeddings client initialized.")
+        return _embedding
+
+
+def get_es_client(es_url: str) -> Elasticsearch:
+    """
+    Return the pooled Elasticsearch client for a cluster URL, creating it on first use.
+
+    Args:
+        es_url (str): The URL of the Elasticsearch cluster.
+
+    Returns:
+        es_client (Elasticsearch): The shared client, whose connections are kept alive between requests.
+    """
+    with _lock:
+        client = _es_clients.get(es_url)
+        if client is None:
+            client = Elasticsearch(
+                hosts=[es_url],
+                connections_per_node=ES_CONNECTIONS_PER_NODE,
+                request_timeout=ES_REQUEST_TIMEOUT,
+                retry_on_timeout=True,
+                # Record or replay every request, searches and memory writes alike, when replay is on
+                **elasticsearch_client_options(),
+            )
+            _es_clients[es_url] = client
+            logger.info(f"Pooled Elasticsearch client created for {es_url}.")
+        return client
+
+
+def get_vector_store(index_name: str, hybrid: bool = True, rrf: bool | dict = True,
+                     backend: str = "elasticsearch") -> VectorStore:
+    """
+    Return the registered vector store for an index, backend and retrieval strategy, creating it on first use.
+
+    Args:
+        index_name (str): The name of the index.
+        hybrid (bool): Whether to combine kNN and text search. Only used by the Elasticsearch backend.
+        rrf (bool | dict): Reciprocal rank fusion setting passed to the Elasticsearch retrieval strategy.
+        backend (str): Either 'elasticsearch' or 'local' for the embedded memory-mapped index.
+
+    Returns:
+        vector_store (VectorStore): The shared vector store.
+    """
+    if backend == "local":
+        key = ("local", LOCAL_INDEX_DIR, index_name)
+    elif backend == "elasticsearch":
+        key = (os.getenv("ES_URL"), index_name, "approx", hybrid, json.dumps(rrf, sort_keys=True))
+    else:
+        raise ValueError(f"Unsupported vector store backend: {backend}")
+
+    store = _vector_stores.get(key)
+    if store is not None:
+        return store
+
+    embedding = get_embeddings()
+    es_client = get_es_client(key[0]) if backend == "elasticsearch" else None
+    with _lock:
+        store = _vector_stores.get(key)
+        if store is None:
+            if backend == "local":
+                store = LocalVectorStore(index_name=index_name, embedding=embedding, directory=LOCAL_INDEX_DIR)
+            else:
+                store = ElasticsearchStore(
+                    index_name=index_name,
+                    embedding=embedding,
+                    es_connection=es_client,
+                    strategy=ElasticsearchStore.ApproxRetrievalStrategy(hybrid=hybrid, rrf=rrf)
+                )
+            _vector_stores[key] = store
+            logger.info(f"{backend} vector store registered for index '{index_name}'.")
+    return store
@@ -1,13 +1,24 @@
+import json
 import os
 import re
 
 from custom_logger import logger
 from langchain_community.utilities import GoogleSerperAPIWrapper
 
+from cache_store import TTLCache, get_redis_client
+from instrumentation import metrics_registry
+from replay import replay_call
+
 # Fetching API keys from environment variables
 SERPER_API_KEY = os.getenv("SERPER_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Raw Serper responses keyed by the final query string; the Redis tier is only used when a URL is configured
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "3600"))
+search_cache = TTLCache(max_size=int(os.getenv("SEARCH_CACHE_SIZE", "1024")), ttl=SEARCH_CACHE_TTL)
+search_redis_client = get_redis_client(os.getenv("SEARCH_CACHE_REDIS_URL"), decode_responses=True)
+metrics_registry.register("web_search_cache", search_cache.stats)
+
 
 class SearchTool:
     def __init__(self, settings: dict) -> None:
@@ -38,12 +49,50 @@ class SearchTool:
         website_url = self.settings.get("website_url", "")
         modified_query = f"{website_url} {query}"
         logger.debug(f"Performing search with query: {modified_query}")
-        response = self.search_api.run(query=modified_query)
-        results = self.search_api.results(modified_query)
+        results = self._fetch_results(modified_query)
+        # Derive both the text summary and the URLs from the one raw response
+        response = self.search_api._parse_results(results)
         urls = self._extract_urls(results)
         logger.info(f"Search performed successfully, extracted {len(urls)} URLs.")
         return response, urls
 
+    def _fetch_results(self, query: str) -> dict:
+        """
+        Fetches raw search results, serving them from the in-process or Redis cache when possible.
+
+        Args:
+            query (str): The final search query.
+
+        Returns:
+            results (dict): The raw Serper response.
+        """
+        results = search_cache.get(query)
+        if results is not None:
+            logger.debug("Search results served from the in-process cache.")
+            return results
+
+        cache_key = f"serper:{query}"
+        if search_redis_client is not None:
+            try:
+                payload = search_redis_client.get(cache_key)
+                if payload:
+                    results = json.loads(payload)
+                    search_cache.set(query, results)
+                    logger.debug("Search results served from the shared cache.")
+                    return results
+            except Exception as e:
+                logger.warning(f"Shared search cache read failed: {e}")
+
+        results = replay_call("serper", [query, self.search_api.k, self.search_api.gl, self.search_api.hl],
+                              lambda: self.search_api.results(query))
+        search_cache.set(query, results)
+        if search_redis_client is not None:
+            try:
+                search_redis_client.set(cache_key, json.dumps(results), ex=int(SEARCH_CACHE_TTL))
+            except Exception as e:
+                logger.warning(f"Shared search cache write failed: {e}")
+        return results
+
     @staticmethod
     def _extract_urls(results: dict) -> list[str]:
         """
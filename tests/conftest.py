@@ -0,0 +1,11 @@
+import os
+import sys
+
+# Mirror the import layout of application/api.py
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+for path in ("source", "ingestion", "application", "configurations"):
+    sys.path.insert(1, os.path.join(ROOT, path))
+
+# The model is set up at import time; no request is sent in the tests
+os.environ.setdefault("MODEL_SETTINGS", '{"model_name": "gpt-4o", "streaming": false}')
+os.environ.setdefault("OPENAI_API_KEY", "test")
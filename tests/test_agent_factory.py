@@ -0,0 +1,23 @@
+import agent_factory
+from agent_factory import agent_manager
+from tools_lib import config_key, tool_registry
+
+
+def lookup(query: str) -> str:
+    """Looks the query up."""
+    return query
+
+
+def test_tools_are_released_when_the_agent_cannot_be_built(monkeypatch):
+    def fail(prompt_id: str) -> None:
+        raise RuntimeError("prompt hub unavailable")
+
+    monkeypatch.setattr(agent_factory, "fetch_prompt", fail)
+    tool_config = {"name": "lookup", "description": "Looks up.", "module": __name__, "function": "lookup"}
+    errors = {}
+
+    agent = agent_manager({"parent_settings": {"agent_id": "research"}, "Tools": {"lookup": tool_config}}, errors)
+
+    assert agent is None
+    assert errors["agent"] == "prompt hub unavailable"
+    assert config_key(tool_config) not in tool_registry._entries
@@ -0,0 +1,35 @@
+import answer_cache as answer_cache_module
+from answer_cache import DEFAULT_SETTINGS, SemanticAnswerCache
+from retrieval_cache import index_generations
+
+
+class FixedEmbeddings:
+    def embed_query(self, text: str) -> list:
+        return [1.0, 0.0]
+
+
+def cached_cache(monkeypatch) -> SemanticAnswerCache:
+    monkeypatch.setattr(answer_cache_module, "get_embeddings", FixedEmbeddings)
+    cache = SemanticAnswerCache()
+    cache.store("lease", "When is rent due?", "v1", "On the first.", DEFAULT_SETTINGS)
+    return cache
+
+
+def test_cached_answer_is_served_for_the_same_settings(monkeypatch):
+    cache = cached_cache(monkeypatch)
+
+    assert cache.lookup("lease", "When is rent due?", "v1", DEFAULT_SETTINGS)[0] == "On the first."
+
+
+def test_settings_change_makes_cached_answers_stale(monkeypatch):
+    cache = cached_cache(monkeypatch)
+
+    assert cache.lookup("lease", "When is rent due?", "v2", DEFAULT_SETTINGS) == (None, None)
+
+
+def test_ingestion_makes_cached_answers_stale(monkeypatch):
+    cache = cached_cache(monkeypatch)
+
+    index_generations.bump("lease-kb")
+
+    assert cache.lookup("lease", "When is rent due?", "v1", DEFAULT_SETTINGS) == (None, None)
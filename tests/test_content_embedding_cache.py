@@ -0,0 +1,18 @@
+import sqlite3
+
+import pytest
+
+from content_embedding_cache import SQLiteEmbeddingCache, content_hash
+
+
+def test_sqlite_cache_round_trips_vectors_and_closes(tmp_path):
+    cache = SQLiteEmbeddingCache(str(tmp_path / "embeddings.sqlite"))
+    key = content_hash("lease")
+    cache.set_many("model", {key: [0.5, 0.25]})
+
+    assert cache.get_many("model", [key, content_hash("notice")]) == {key: [0.5, 0.25]}
+    assert cache.get_many("other-model", [key]) == {}
+
+    cache.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        cache.get_many("model", [key])
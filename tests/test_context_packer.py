@@ -0,0 +1,56 @@
+from langchain_core.documents import Document
+
+import context_packer
+from context_packer import merge_adjacent, pack_context
+
+
+def count_words(text: str, encoding_name: str = "cl100k_base") -> int:
+    return len(text.split())
+
+
+def truncate_words(text: str, max_tokens: int, encoding_name: str = "cl100k_base") -> str:
+    return " ".join(text.split()[:max_tokens])
+
+
+def test_near_duplicates_are_packed_once(monkeypatch):
+    monkeypatch.setattr(context_packer, "count_tokens", count_words)
+    text = "The tenant pays the rent on the first day of every month to the landlord."
+
+    context = pack_context([text, text + " ", "The deposit is returned within thirty days."])
+
+    assert context.count("The tenant pays") == 1
+    assert "[2]\nThe deposit is returned" in context
+
+
+def test_context_stops_at_the_token_budget(monkeypatch):
+    monkeypatch.setattr(context_packer, "count_tokens", count_words)
+    monkeypatch.setattr(context_packer, "truncate_tokens", truncate_words)
+    monkeypatch.setattr(context_packer, "MIN_PARTIAL_TOKENS", 3)
+    documents = ["one two three four five six seven", "eight nine ten eleven twelve thirteen", "fourteen"]
+
+    context = pack_context(documents, budget_tokens=12)
+
+    assert count_words(context) == 12
+    assert context.startswith("[1]\none two three four five six seven\n\n")
+    assert context.endswith("eight nine ten")
+
+
+def test_neighbouring_pages_without_overlap_stay_apart():
+    documents = [Document(page_content="Top of page three.", metadata={"source": "lease.pdf", "page": 3}),
+                 Document(page_content="Bottom of page four.", metadata={"source": "lease.pdf", "page": 4})]
+
+    assert merge_adjacent(documents) == documents
+
+
+def test_overlapping_chunks_merge_across_pages():
+    documents = [Document(page_content="continues on the next page with the deposit terms.",
+                          metadata={"source": "lease.pdf", "page": 4}),
+                 Document(page_content="The tenant pays the rent monthly and continues on the next page",
+                          metadata={"source": "lease.pdf", "page": 3})]
+
+    [merged] = merge_adjacent(documents)
+
+    assert merged.page_content == ("The tenant pays the rent monthly and continues on the next page"
+                                   " with the deposit terms.")
+    assert merged.metadata["page"] == 3
+    assert merged.metadata["page_range"] == [3, 4]
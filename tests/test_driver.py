@@ -0,0 +1,22 @@
+from types import SimpleNamespace
+
+import driver
+
+
+def test_failed_agent_fails_the_request(monkeypatch):
+    def build(settings: dict, errors: dict):
+        if settings == "drafter":
+            errors["agent"] = "prompt hub unavailable"
+            return None
+        return SimpleNamespace(tools=[])
+
+    invalidated = []
+    monkeypatch.setattr(driver, "agent_manager", build)
+    monkeypatch.setattr(driver.answer_cache, "invalidate", invalidated.append)
+    settings = {"research_agent": "research", "discriminator_agent": "discriminator", "drafter_agent": "drafter"}
+
+    result, status = driver.ast_driver({"app_name": "lease", "session_id": "1", "query": "q"}, settings)
+
+    assert status == "500 Internal Server Error"
+    assert "prompt hub unavailable" in result
+    assert invalidated == []
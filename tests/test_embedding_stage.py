@@ -0,0 +1,39 @@
+import time
+
+import httpx
+import openai
+from langchain_core.embeddings import Embeddings
+
+import embedding_stage
+from embedding_stage import EmbeddingStage
+
+
+class RateLimitedEmbeddings(Embeddings):
+    def __init__(self, latency: float, rate_limited_calls: set) -> None:
+        self.latency = latency
+        self.rate_limited_calls = rate_limited_calls
+        self.starts = []
+
+    def embed_documents(self, texts: list) -> list:
+        self.starts.append(time.monotonic())
+        if len(self.starts) in self.rate_limited_calls:
+            request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+            raise openai.RateLimitError("rate limited", response=httpx.Response(429, request=request), body=None)
+        time.sleep(self.latency)
+        return [[1.0] for _ in texts]
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_documents([text])[0]
+
+
+def test_rate_limit_spaces_the_following_requests(monkeypatch):
+    monkeypatch.setattr(embedding_stage, "count_tokens", len)
+    embedding = RateLimitedEmbeddings(latency=0.05, rate_limited_calls={2})
+    stage = EmbeddingStage(embedding, max_concurrency=1, backoff_base=0.0)
+
+    stage.embed(["lease"])
+    stage.embed(["deposit"])
+
+    # Halving the rate of one request per 0.05s spaces the retry 0.1s after the rejected request
+    assert embedding.starts[2] - embedding.starts[1] >= 0.09
+    assert stage.stats()["rate_limited"] == 1
@@ -0,0 +1,34 @@
+import time
+
+import pytest
+
+from ingestion_pipeline import IngestionPipeline
+
+
+def test_slow_stage_holds_back_the_source():
+    produced, consumed, leads = [], [], []
+
+    def source():
+        for item in range(20):
+            produced.append(item)
+            leads.append(len(produced) - len(consumed))
+            yield item
+
+    def slow(item: int) -> None:
+        time.sleep(0.01)
+        consumed.append(item)
+
+    pipeline = IngestionPipeline(queue_size=1).add_stage("parse", lambda item: item).add_stage("index", slow)
+    counts = pipeline.run(source())
+
+    assert counts["index"] == 20
+    # One item in each queue, one in each stage and the one the source is handing over
+    assert max(leads) <= 5
+
+
+def test_failing_stage_stops_the_pipeline():
+    def fail(item: int) -> None:
+        raise ValueError(f"cannot parse {item}")
+
+    with pytest.raises(ValueError):
+        IngestionPipeline().add_stage("parse", fail).run(iter(range(1000)))
@@ -0,0 +1,18 @@
+from uuid import uuid4
+
+from langchain_core.outputs import LLMResult
+
+from instrumentation import LLMMetrics, MetricsCallbackHandler
+
+
+def test_empty_stream_chunks_are_not_counted_as_tokens():
+    metrics = LLMMetrics()
+    handler = MetricsCallbackHandler(metrics)
+    run_id = uuid4()
+
+    handler.on_chat_model_start({"kwargs": {"model_name": "gpt-4o"}}, [], run_id=run_id)
+    for token in ("", "The", " lease", ""):
+        handler.on_llm_new_token(token, run_id=run_id)
+    handler.on_llm_end(LLMResult(generations=[]), run_id=run_id)
+
+    assert metrics.snapshot()["gpt-4o"]["completion_tokens"] == 2
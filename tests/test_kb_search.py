@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+from langchain_core.documents import Document
+
+import kb_search
+from tools_lib import ToolFactory
+
+
+class FakeChain:
+    def invoke(self, inputs: dict) -> SimpleNamespace:
+        return SimpleNamespace(content=f"{len(inputs['documents'])} documents")
+
+
+def test_kb_tool_accepts_filters_through_tool_interface(monkeypatch):
+    calls = []
+    monkeypatch.setattr(kb_search.chain_handler, "create_chain", lambda prompt_id: FakeChain())
+    monkeypatch.setattr(kb_search, "fetch_kb_results",
+                        lambda query, settings, filters=None: calls.append((query, filters)) or [])
+    tool = ToolFactory.initialize_tool({
+        "name": "kb_search",
+        "description": "Searches the knowledge base.",
+        "module": "kb_search",
+        "class": "KBSearchTool",
+        "function": "kb_tool",
+        "index_name": "kb",
+    })
+
+    assert set(tool.args) == {"query", "filters"}
+    result = tool.invoke({"query": "notice period", "filters": {"jurisdiction": "NY"}})
+
+    assert result == "0 documents"
+    assert calls == [("notice period", {"jurisdiction": "NY"})]
+
+
+def test_kb_tool_filters_are_optional(monkeypatch):
+    calls = []
+    monkeypatch.setattr(kb_search.chain_handler, "create_chain", lambda prompt_id: FakeChain())
+    monkeypatch.setattr(kb_search, "fetch_kb_results",
+                        lambda query, settings, filters=None: calls.append((query, filters)) or [])
+    tool = ToolFactory.initialize_tool({
+        "name": "kb_search",
+        "description": "Searches the knowledge base.",
+        "module": "kb_search",
+        "class": "KBSearchTool",
+        "function": "kb_tool",
+        "index_name": "kb",
+    })
+
+    tool.invoke({"query": "notice period"})
+
+    assert calls == [("notice period", None)]
+
+
+def federated_search(monkeypatch, results: dict, settings: dict) -> list:
+    monkeypatch.setattr(kb_search, "fetch_kb_results",
+                        lambda query, index, filters=None: [Document(page_content=text)
+                                                            for text in results[index["index_name"]]])
+    return [document.page_content for document in kb_search.fetch_federated_kb_results("rent", settings)]
+
+
+def test_federated_search_ranks_by_index_weight(monkeypatch):
+    results = {"statutes": ["statute"], "cases": ["case"]}
+    settings = {"indexes": [{"index_name": "statutes"}, {"index_name": "cases", "weight": 2.0}]}
+
+    assert federated_search(monkeypatch, results, settings) == ["case", "statute"]
+
+
+def test_federated_search_favours_results_found_in_several_indexes(monkeypatch):
+    results = {"statutes": ["statute", "shared"], "cases": ["case", "shared"]}
+    settings = {"indexes": [{"index_name": "statutes"}, {"index_name": "cases"}], "k": 1}
+
+    assert federated_search(monkeypatch, results, settings) == ["shared"]
@@ -0,0 +1,39 @@
+import json
+
+from local_vector_store import LocalVectorStore
+
+
+def test_add_embeddings_returns_only_the_added_ids(tmp_path):
+    store = LocalVectorStore("kb", embedding=None, directory=str(tmp_path))
+
+    assert store.add_embeddings([("lease", [1.0, 0.0]), ("notice", [0.0, 1.0])], ids=["a", "b"]) == ["a", "b"]
+    assert store.add_embeddings([("lease", [1.0, 0.0]), ("deposit", [1.0, 1.0]), ("deposit", [1.0, 1.0])],
+                                ids=["a", "c", "c"]) == ["c"]
+    assert len(store.docs) == 3
+
+
+def test_load_drops_documents_left_without_vectors(tmp_path):
+    store = LocalVectorStore("kb", embedding=None, directory=str(tmp_path))
+    store.add_embeddings([("lease", [1.0, 0.0])], ids=["a"])
+    # A crash after the documents were appended and midway through their vectors
+    with open(tmp_path / "kb" / "docs.jsonl", "a") as file:
+        file.write(json.dumps({"id": "b", "text": "notice", "metadata": {}}) + "\n")
+    with open(tmp_path / "kb" / "vectors.f32", "ab") as file:
+        file.write(b"\0\0")
+
+    store = LocalVectorStore("kb", embedding=None, directory=str(tmp_path))
+    assert store.add_embeddings([("deposit", [0.0, 1.0])], ids=["c"]) == ["c"]
+
+    assert [doc["id"] for doc in store.docs] == ["a", "c"]
+    assert store.similarity_search_by_vector([0.0, 1.0], k=1)[0].page_content == "deposit"
+
+
+def test_filter_uses_the_metadata_index(tmp_path):
+    store = LocalVectorStore("kb", embedding=None, directory=str(tmp_path))
+    store.add_embeddings([("lease", [1.0, 0.0]), ("notice", [0.9, 0.1]), ("deposit", [0.8, 0.2])],
+                         metadatas=[{"source": "a.pdf", "page": 1}, {"source": "b.pdf"},
+                                    {"source": "a.pdf", "page": 2}])
+
+    documents = store.similarity_search_by_vector([1.0, 0.0], k=3, filter={"source": "a.pdf", "page": [2, None]})
+
+    assert [document.page_content for document in documents] == ["deposit"]
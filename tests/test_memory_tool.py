@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+
+from elastic_transport import ApiResponseMeta, HttpHeaders, NodeConfig, ObjectApiResponse
+from elasticsearch import Elasticsearch
+
+from memory_tool import ElasticsearchMemoryActions
+
+
+def api_response(body: dict) -> ObjectApiResponse:
+    meta = ApiResponseMeta(status=200, http_version="1.1", headers=HttpHeaders(), duration=0.0,
+                           node=NodeConfig("http", "localhost", 9200))
+    return ObjectApiResponse(body=body, meta=meta)
+
+
+def test_delete_reports_the_deleted_document_count(monkeypatch):
+    client = Elasticsearch("http://localhost:9200")
+    requests = []
+
+    def delete_by_query(**kwargs) -> ObjectApiResponse:
+        requests.append(kwargs)
+        return api_response({"deleted": len(kwargs["query"]["bool"]["should"]) * 2, "failures": []})
+
+    monkeypatch.setattr(client, "delete_by_query", delete_by_query)
+    actions = ElasticsearchMemoryActions(SimpleNamespace(client=client), {"delete_batch_size": 2})
+
+    result = actions.delete("memory", "notes", ["lease", "notice", "deposit"])
+
+    assert result == "Delete operation completed: 6 documents deleted."
+    assert len(requests) == 2
@@ -0,0 +1,106 @@
+import fcntl
+import json
+from types import SimpleNamespace
+
+from memory_write_buffer import MemoryWriteBuffer, RetryableWriteError
+
+
+class FlakyActions:
+    def __init__(self) -> None:
+        self.inserted = []
+        self.fail_deletes = True
+        self.rejected = set()
+        self.client = SimpleNamespace(indices=SimpleNamespace(refresh=lambda index: None))
+
+    def index_items(self, index_name: str, field_name: str, items: list) -> list:
+        results = []
+        for item in items:
+            if item in self.rejected:
+                results.append({"item": item, "status": "failed", "error": "es_rejected_execution_exception",
+                                "retryable": True})
+            else:
+                self.inserted.append(item)
+                results.append({"item": item, "status": "indexed"})
+        return results
+
+    def delete_items(self, index_name: str, field_name: str, items: list) -> list:
+        if self.fail_deletes:
+            raise ConnectionError("cluster unavailable")
+        return [{"items": items, "status": "deleted", "deleted": len(items)}]
+
+
+def spilled(path) -> list:
+    with open(path) as file:
+        return [json.loads(line)["op"] for line in file]
+
+
+def test_failed_flush_keeps_only_the_unsent_groups(tmp_path):
+    actions = FlakyActions()
+    spill_path = tmp_path / "memory.jsonl"
+    buffer = MemoryWriteBuffer(actions, str(spill_path), flush_size=100, flush_interval=3600)
+    buffer.submit("insert", "memory", "notes", ["lease"])
+    buffer.submit("delete", "memory", "notes", ["notice"])
+
+    try:
+        buffer.flush()
+    except ConnectionError:
+        pass
+
+    assert spilled(buffer.spill_path) == ["delete"]
+    actions.fail_deletes = False
+    buffer.flush()
+    assert actions.inserted == ["lease"]
+    assert spilled(buffer.spill_path) == []
+
+
+def test_full_buffer_reports_a_failed_flush(tmp_path):
+    actions = FlakyActions()
+    buffer = MemoryWriteBuffer(actions, str(tmp_path / "memory.jsonl"), max_pending=1, flush_size=100,
+                               flush_interval=3600)
+    buffer.submit("delete", "memory", "notes", ["notice"])
+
+    assert buffer.submit("insert", "memory", "notes", ["lease"]).startswith("Error")
+
+
+def test_rejected_items_stay_buffered_until_accepted(tmp_path):
+    actions = FlakyActions()
+    actions.rejected = {"deposit"}
+    buffer = MemoryWriteBuffer(actions, str(tmp_path / "memory.jsonl"), flush_size=100, flush_interval=3600)
+    buffer.submit("insert", "memory", "notes", ["lease", "deposit"])
+
+    try:
+        buffer.flush()
+    except RetryableWriteError:
+        pass
+
+    assert actions.inserted == ["lease"]
+    assert buffer.overlay("memory", "notes", []) == ["deposit"]
+    actions.rejected = set()
+    buffer.flush()
+    assert actions.inserted == ["lease", "deposit"]
+    assert spilled(buffer.spill_path) == []
+
+
+def test_oversized_write_bypasses_the_buffer(tmp_path):
+    actions = FlakyActions()
+    buffer = MemoryWriteBuffer(actions, str(tmp_path / "memory.jsonl"), max_pending=1, flush_size=100,
+                               flush_interval=3600)
+
+    assert buffer.submit("insert", "memory", "notes", ["lease", "deposit"]) == "Insert of 2 items stored."
+    assert actions.inserted == ["lease", "deposit"]
+    assert buffer.pending_items() == 0
+
+
+def test_recovers_only_spill_files_of_dead_processes(tmp_path):
+    entry = {"op": "insert", "index": "memory", "field": "notes", "items": ["lease"]}
+    for pid in (1001, 1002):
+        (tmp_path / f"memory.{pid}.jsonl").write_text(json.dumps(entry) + "\n")
+    with open(tmp_path / "memory.1002.jsonl.lock", "a") as live_lock:
+        fcntl.flock(live_lock, fcntl.LOCK_EX)
+        buffer = MemoryWriteBuffer(FlakyActions(), str(tmp_path / "memory.jsonl"), flush_size=100,
+                                   flush_interval=3600)
+
+        assert buffer.pending_items() == 1
+        assert spilled(buffer.spill_path) == ["insert"]
+        assert not (tmp_path / "memory.1001.jsonl").exists()
+        assert (tmp_path / "memory.1002.jsonl").exists()
@@ -0,0 +1,51 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+from elasticsearch import Elasticsearch
+
+import replay
+
+
+class FakeClusterHandler(BaseHTTPRequestHandler):
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("content-length", 0)))
+        body = json.dumps({"hits": {"total": {"value": 1, "relation": "eq"}, "hits": [{"_id": "1"}]}}).encode()
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        self.send_header("x-elastic-product", "Elasticsearch")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def cassette_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(replay, "REPLAY_DIR", str(tmp_path))
+    monkeypatch.setattr(replay, "REPLAY_LATENCY", "0")
+    monkeypatch.setattr(replay, "_cassettes", {})
+    return tmp_path
+
+
+def test_elasticsearch_requests_are_recorded_and_replayed_offline(cassette_dir, monkeypatch):
+    server = HTTPServer(("127.0.0.1", 0), FakeClusterHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    monkeypatch.setattr(replay, "REPLAY_MODE", "record")
+    client = Elasticsearch(url, **replay.elasticsearch_client_options())
+    recorded = client.search(index="memory", query={"match": {"notes": "lease"}}).body
+    server.shutdown()
+    server.server_close()
+
+    monkeypatch.setattr(replay, "REPLAY_MODE", "replay")
+    monkeypatch.setattr(replay, "_cassettes", {})
+    client = Elasticsearch(url, **replay.elasticsearch_client_options())
+    assert client.search(index="memory", query={"match": {"notes": "lease"}}).body == recorded
+
+    with pytest.raises(replay.ReplayMissError):
+        client.search(index="memory", query={"match": {"notes": "unrecorded"}})
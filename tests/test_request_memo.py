@@ -0,0 +1,42 @@
+import asyncio
+
+from request_memo import memoized, amemoized, request_scope
+
+
+def test_identical_calls_in_a_request_run_once():
+    calls = []
+    tool = memoized("search", lambda query: calls.append(query) or f"results for {query}")
+
+    with request_scope() as memo:
+        assert tool("a") == "results for a"
+        assert tool("a") == "results for a"
+
+    assert calls == ["a"]
+    assert memo.hits == 1
+
+
+def test_error_results_are_not_memoized():
+    results = iter(["Error executing Knowledge Base Search.", "results"])
+    tool = memoized("search", lambda query: next(results))
+
+    with request_scope():
+        assert tool("a") == "Error executing Knowledge Base Search."
+        assert tool("a") == "results"
+
+
+def test_async_calls_share_the_memo_with_sync_calls():
+    calls = []
+
+    async def search(query: str) -> str:
+        calls.append(query)
+        return f"results for {query}"
+
+    tool = memoized("search", lambda query: calls.append(query) or f"results for {query}")
+    async_tool = amemoized("search", search)
+
+    with request_scope():
+        assert tool("a") == "results for a"
+        assert asyncio.run(async_tool("a")) == "results for a"
+        assert asyncio.run(async_tool("b")) == "results for b"
+
+    assert calls == ["a", "b"]
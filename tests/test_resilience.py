@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from resilience import CircuitOpenError, ResiliencePolicy
+
+
+def flaky(failures: int):
+    calls = []
+
+    def attempt(primary: bool) -> str:
+        calls.append(primary)
+        if len(calls) <= failures:
+            raise TimeoutError("upstream timed out")
+        return "answer"
+
+    return attempt, calls
+
+
+def test_retryable_errors_are_retried():
+    policy = ResiliencePolicy({"backoff_base": 0.0, "hedge_enabled": False})
+    attempt, calls = flaky(failures=2)
+
+    assert policy.call(attempt) == "answer"
+    assert len(calls) == 3
+
+
+def test_open_circuit_rejects_calls():
+    policy = ResiliencePolicy({"max_retries": 0, "failure_threshold": 2, "hedge_enabled": False})
+    attempt, calls = flaky(failures=10)
+    for _ in range(2):
+        with pytest.raises(TimeoutError):
+            policy.call(attempt)
+
+    with pytest.raises(CircuitOpenError):
+        policy.call(attempt)
+    assert len(calls) == 2
+
+
+def test_slow_primary_is_hedged():
+    policy = ResiliencePolicy({"hedge_min_samples": 1})
+    policy.latencies.add(0.01)
+
+    def attempt(primary: bool) -> str:
+        if primary:
+            time.sleep(0.5)
+        return "primary" if primary else "hedge"
+
+    assert policy.call(attempt) == "hedge"
+    assert policy.snapshot()["hedge_wins"] == 1
+
+
+def test_stream_failure_after_the_first_chunk_is_recorded():
+    policy = ResiliencePolicy({"backoff_base": 0.0})
+
+    def open_stream():
+        yield "The"
+        raise TimeoutError("stream stalled")
+
+    chunks = []
+    with pytest.raises(TimeoutError):
+        for chunk in policy.stream(open_stream):
+            chunks.append(chunk)
+
+    assert chunks == ["The"]
+    assert policy.snapshot()["failures"] == 1
@@ -0,0 +1,64 @@
+import kb_search
+import memory_tool
+from tools_lib import ToolFactory, initialize_tools, release_tools, tool_registry
+
+
+def echo(text: str) -> str:
+    """Returns the text."""
+    return text
+
+
+def echo_config(**options) -> dict:
+    return {"name": "echo", "description": "Echoes the text.", "module": __name__, "function": "echo", **options}
+
+
+class Greeter:
+    instances = 0
+
+    def __init__(self, settings: dict) -> None:
+        Greeter.instances += 1
+        self.greeting = settings["greeting"]
+
+    def greet(self, name: str) -> str:
+        return f"{self.greeting}, {name}"
+
+
+def greeter_config(**options) -> dict:
+    return {"name": "greeter", "description": "Greets.", "module": __name__, "class": "Greeter",
+            "function": "greet", **options}
+
+
+def test_memory_tool_is_not_memoized_by_default():
+    assert not ToolFactory.memoize_enabled(memory_tool, {"class": "MemoryTool"})
+    assert ToolFactory.memoize_enabled(memory_tool, {"class": "MemoryTool", "memoize": True})
+    assert ToolFactory.memoize_enabled(kb_search, {"class": "KBSearchTool"})
+    assert not ToolFactory.memoize_enabled(kb_search, {"class": "KBSearchTool", "memoize": False})
+
+
+def test_guard_settings_apply_per_agent_on_a_shared_tool():
+    builds = tool_registry.builds
+    short = initialize_tools({"Tools": {"echo": echo_config(max_output_chars=3)}})
+    full = initialize_tools({"Tools": {"echo": echo_config()}})
+
+    assert tool_registry.builds == builds + 1
+    assert full[0].run("abcdef") == "abcdef"
+    assert short[0].run("abcdef").startswith("abc\n")
+
+    release_tools(short + full)
+    assert tool_registry.stats()["tools"] == 0
+
+
+def test_sync_class_tool_is_constructed_on_first_call():
+    instances = Greeter.instances
+    tool = ToolFactory.initialize_tool(greeter_config(greeting="Hello"))
+
+    assert Greeter.instances == instances
+    assert tool.run("Ada") == "Hello, Ada"
+    assert tool.run("Grace") == "Hello, Grace"
+    assert Greeter.instances == instances + 1
+
+
+def test_failed_lazy_construction_is_reported_to_the_agent():
+    tool = ToolFactory.initialize_tool(greeter_config())
+
+    assert "The tool is unavailable" in tool.run("Ada")